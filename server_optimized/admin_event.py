@@ -1,10 +1,15 @@
 import os
 from flask import Blueprint, request, jsonify, session
-from database.db import execute_query, fetch_query
+from database.db import execute_query, fetch_query, get_event_meta, DatabaseBusy
 import sqlite3
 from werkzeug.utils import secure_filename
 # 新增：导入缓存模块
 import seat_cache  # 新增
+import seat_changes
+import search_cache
+import event_suggest
+import seat_allocator
+import stock_counters
 
 admin_event_bp = Blueprint('admin_event', __name__)
 
@@ -71,8 +76,11 @@ def add_event():
             (name, poster_url, event_date, start_time)
         )
         print('event_id', event_id)
+        event_suggest.apply_change(event_id, name, search_cache.bump_events_version())
     except sqlite3.IntegrityError:
         return jsonify({'status': 'fail', 'message': 'Event name already exists'}), 409
+    except DatabaseBusy:
+        raise
     except Exception as e:
         print(f"Unexpected error during event insertion: {e}")
         return jsonify({'status': 'error', 'message': 'Server error during event creation'}), 500
@@ -112,6 +120,8 @@ def add_event():
             dict_seats = [dict(row) for row in initial_seats]
             seat_cache.set_seats_to_cache(event_id, dict_seats)  # 新增
 
+    except DatabaseBusy:
+        raise
     except Exception as e:
         print(f"Unexpected error during seat insertion: {e}")
         return jsonify({'status': 'error', 'message': 'Server error during seat setup'}), 500
@@ -159,10 +169,23 @@ def edit_event():
                 (price, eid, seat_type)
             )
 
-        # 新增：编辑活动后清除旧缓存
-        seat_cache.clear_event_cache(event_id)  # 新增
+        # 改价/改期不影响座位状态：保留座位图缓存，只原地更新缓存中的场次信息和票价
+        meta = get_event_meta(event_id)
+        patched = meta is not None and seat_cache.patch_event_meta(
+            event_id,
+            {k: meta["event"][k] for k in ("event_date", "start_time")},
+            {row["type"]: row["price"] for row in meta["seat_types"]}
+        )
+        if not patched:
+            # 兜底：整体失效
+            seat_cache.clear_event_cache(event_id)
+        version = search_cache.bump_events_version()
+        if meta is not None:
+            event_suggest.apply_change(event_id, meta["event"]["name"], version)
 
         return jsonify({'status': 'success', 'message': 'Event updated successfully'})
+    except DatabaseBusy:
+        raise
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return jsonify({'status': 'error', 'message': 'Database error'}), 500
@@ -190,7 +213,13 @@ def delete_event():
 
         # 新增：删除活动后清除对应缓存
         seat_cache.clear_event_cache(event_id)  # 新增
+        seat_changes.reset_event_log(event_id)
+        seat_allocator.forget(event_id)
+        stock_counters.clear(event_id)
+        event_suggest.apply_change(event_id, None, search_cache.bump_events_version())
 
         return jsonify({"status": "success", "message": f"Event {event_id} deleted"}), 200
+    except DatabaseBusy:
+        raise
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -1,5 +1,9 @@
-from flask import Blueprint, request, jsonify, session
-from database.db import execute_query, fetch_query, get_user_id
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
+from database.db import fetch_query, get_user_id, release_order, reserve_orders, DatabaseBusy
+import event_cancellation
+import order_listing
+import sales_summary
+import seat_holds
 admin_order_bp = Blueprint("admin_order", __name__)
 
 # FR-OM-001
@@ -14,54 +18,91 @@ def show_orders():
     is_admin = session_info[0]['is_admin']
     user_id = get_user_id(username)
 
-    status = request.args.get("status") #0-only status == 0  1-only status == 1  2-ignore status and return all
-    if status is None:
-        return jsonify({'status': 'fail', 'message': 'Need a status'}), 400
+    # 分页游标及场次/状态/日期过滤；status: 0-已取消 1-已确认 2-全部，不带limit/cursor时一次返回全部
+    try:
+        options = order_listing.parse_order_args(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'fail', 'message': str(e)}), 400
 
     try:
-        # only show the user's own orders
-        if is_admin == 0:
-            if status == '2':
-                order_info = fetch_query(f"""
-                    SELECT e.name, o.total_price, o.created_at, u.username, o.id
-                    FROM Events e
-                    JOIN Orders o ON e.id = o.event_id
-                    JOIN Users u ON u.user_id = o.user_id
-                    WHERE o.user_id = ?
-                """, (user_id,))
-            else:
-                order_info = fetch_query(f"""
-                    SELECT e.name, o.total_price, o.created_at, u.username, o.id
-                    FROM Events e
-                    JOIN Orders o ON e.id = o.event_id
-                    JOIN Users u ON u.user_id = o.user_id
-                    WHERE o.user_id = ? and o.status = ?
-                """, (user_id, status))
-        # show all users' orders
-        else:
-            if status == '2':
-                order_info = fetch_query(f"""
-                    SELECT e.name, o.total_price, o.created_at, u.username, o.id
-                    FROM Events e
-                    JOIN Orders o ON e.id = o.event_id
-                    JOIN Users u ON u.user_id = o.user_id
-                """)
-            else:
-                order_info = fetch_query(f"""
-                    SELECT e.name, o.total_price, o.created_at, u.username, o.id
-                    FROM Events e
-                    JOIN Orders o ON e.id = o.event_id
-                    JOIN Users u ON u.user_id = o.user_id
-                    WHERE o.status = ?
-                """, (status,))
+        # 普通用户只能看到自己的订单，管理员看到所有用户的订单
+        order_info, next_cursor = order_listing.list_orders(
+            None if is_admin else user_id, options["filters"], options["after"], options["limit"]
+        )
     except Exception as e:
         # 捕获异常并返回错误信息
         return jsonify({'status': 'fail', 'message': str(e)}), 500
-    if order_info:
-        dict_order_info = [dict(row) for row in order_info]
-        return jsonify({'status': 'success', 'data': dict_order_info})
-    else:
-        return jsonify({'status': 'success', 'data': []})
+    if not options["paginate"]:
+        return jsonify({'status': 'success', 'data': order_info})
+    return jsonify({'status': 'success', 'data': order_info, 'next_cursor': next_cursor})
+
+# 管理员导出订单及明细：CSV或NDJSON流式输出，分批读取，内存占用与订单总数无关
+@admin_order_bp.route('/export_orders', methods=['get'])
+def export_orders():
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    if session_info[0]['is_admin'] == 0:
+        return jsonify({'status': 'fail', 'message': 'Permission denied: not an admin'}), 403
+    try:
+        options = order_listing.parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'fail', 'message': str(e)}), 400
+
+    export_format = options["format"]
+    lines = order_listing.export_lines(export_format, options["filters"])
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return Response(stream_with_context(lines), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=orders.{export_format}"})
+
+# 管理员销售统计：只读汇总表，按场次/座位类型/日期分组
+@admin_order_bp.route('/admin/sales_summary', methods=['get'])
+def sales_summary_view():
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    if session_info[0]['is_admin'] == 0:
+        return jsonify({'status': 'fail', 'message': 'Permission denied: not an admin'}), 403
+    try:
+        options = sales_summary.parse_summary_args(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'fail', 'message': str(e)}), 400
+    rows, totals = sales_summary.summarize(**options)
+    return jsonify({'status': 'success', 'data': rows, 'totals': totals})
+
+# 整场退票：后台按批取消场次的全部订单，返回任务进度（202）；GET查询进度
+@admin_order_bp.route('/admin/cancel_event_orders', methods=['post'])
+def cancel_event_orders():
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    if session_info[0]['is_admin'] == 0:
+        return jsonify({'status': 'fail', 'message': 'Permission denied: not an admin'}), 403
+    event_id = (request.get_json() or {}).get("event_id")
+    if not event_id:
+        return jsonify({'status': 'fail', 'message': 'event_id required'}), 400
+    if not fetch_query("SELECT id FROM Events WHERE id = ?", (event_id,)):
+        return jsonify({'status': 'fail', 'message': 'Event not found'}), 404
+    job = event_cancellation.start(event_id)
+    return jsonify({'status': 'success', 'data': job,
+                    'status_url': f'/admin/cancel_event_orders/{event_id}'}), 202
+
+
+@admin_order_bp.route('/admin/cancel_event_orders/<int:event_id>', methods=['get'])
+def cancel_event_orders_status(event_id):
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    if session_info[0]['is_admin'] == 0:
+        return jsonify({'status': 'fail', 'message': 'Permission denied: not an admin'}), 403
+    job = event_cancellation.get_job(event_id)
+    if job is None:
+        return jsonify({'status': 'fail', 'message': 'No cancellation job for this event'}), 404
+    return jsonify({'status': 'success', 'data': job})
 
 # FR-OM-002
 @admin_order_bp.route('/cancel_order', methods=['post'])
@@ -69,11 +110,53 @@ def cancel_order():
     id = request.args.get("id")
     print(id)
     try:
-        execute_query('UPDATE Orders SET status = 0 WHERE id = ?', (id,))
+        release_order(id)
         return jsonify({'status': 'success', 'message': 'Order has been canceled'}), 200
+    except DatabaseBusy:
+        raise
     except Exception as e:
         # 捕获异常并返回错误信息
         return jsonify({'status': 'fail', 'message': str(e)}), 500
 
 
+# 批量团体订票：同一场次的多个订单分块在少量事务中写入，逐条返回结果（部分成功）
+MAX_BULK_ORDERS = 5000
+
+
+@admin_order_bp.route('/admin/bulk_book', methods=['post'])
+def bulk_book():
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    if session_info[0]['is_admin'] == 0:
+        return jsonify({'status': 'fail', 'message': 'Permission denied: not an admin'}), 403
+
+    data = request.get_json() or {}
+    event_id = data.get("event_id")
+    orders = data.get("orders")
+    if not event_id or not isinstance(orders, list) or not all(isinstance(order, dict) for order in orders):
+        return jsonify({'status': 'fail', 'message': 'event_id and orders [{username, seat_ids}] required'}), 400
+    if len(orders) > MAX_BULK_ORDERS:
+        return jsonify({'status': 'fail', 'message': f'At most {MAX_BULK_ORDERS} orders per request'}), 400
+
+    # 他人正在锁定的座位不参与批量订票
+    held = seat_holds.held_seat_ids(event_id)
+    results = [None] * len(orders)
+    pending = []
+    for i, order in enumerate(orders):
+        seat_ids = order.get("seat_ids") or []
+        if not isinstance(seat_ids, list) or not all(
+                isinstance(seat_id, int) and not isinstance(seat_id, bool) for seat_id in seat_ids):
+            results[i] = {"status": "fail", "message": "seat_ids must be a list of integers"}
+        elif held.intersection(seat_ids):
+            results[i] = {"status": "fail", "message": "Seats are held by another user"}
+        else:
+            pending.append(i)
+    for i, result in zip(pending, reserve_orders(event_id, [orders[i] for i in pending])):
+        results[i] = result
 
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    status = 'success' if succeeded == len(results) else 'partial' if succeeded else 'fail'
+    return jsonify({'status': status, 'succeeded': succeeded, 'failed': len(results) - succeeded,
+                    'results': [dict(result, index=i) for i, result in enumerate(results)]})
@@ -1,6 +1,7 @@
 
 
-from flask import Flask
+import os
+from flask import Flask, jsonify
 from flask_cors import CORS
 
 
@@ -9,6 +10,14 @@ from user import user_bp
 from admin_event import admin_event_bp
 from ticket_booking import ticket_booking_bp
 from admin_order import admin_order_bp
+from metrics import metrics_bp
+from waiting_room import waiting_room_bp
+import cache_warmer
+import cache_auditor
+import booking_queue
+import event_cancellation
+import rate_limit
+from database.db import DatabaseBusy, set_request_deadline, REQUEST_BUSY_BUDGET_SECONDS
 # instantiate the app
 app = Flask(__name__)
 #app.config.from_object(__name__)
@@ -18,7 +27,9 @@ app = Flask(__name__)
 #CORS(app, resources={r'/*': {'origins': '*'}})
 CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}},
      supports_credentials=True,
-     allow_headers=["Content-Type", "Session-ID"])
+     allow_headers=["Content-Type", "Session-ID", "Last-Event-ID", "Waiting-Room-Token",
+                    "Idempotency-Key"],
+     expose_headers=["Retry-After", "Idempotent-Replayed"])
 app.config['SECRET_KEY'] = 'admin'
 
 
@@ -27,6 +38,40 @@ app.register_blueprint(user_bp)
 app.register_blueprint(admin_event_bp)
 app.register_blueprint(ticket_booking_bp)
 app.register_blueprint(admin_order_bp)
+app.register_blueprint(metrics_bp)
+app.register_blueprint(waiting_room_bp)
+
+# token-bucket limits for booking/seat/search routes, checked before any database work
+@app.before_request
+def apply_rate_limit():
+    return rate_limit.limit_request()
+
+
+# bound how long one request may wait for the SQLite write lock
+@app.before_request
+def start_db_deadline():
+    set_request_deadline(REQUEST_BUSY_BUDGET_SECONDS)
+
+
+@app.teardown_request
+def clear_db_deadline(exc):
+    set_request_deadline(None)
+
+
+# write lock still contended after retries: tell the client to come back instead of a 500
+@app.errorhandler(DatabaseBusy)
+def database_busy(e):
+    response = jsonify({'status': 'fail', 'message': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+# start background jobs (set BACKGROUND_JOBS=0 to disable, e.g. in tests)
+if os.environ.get("BACKGROUND_JOBS", "1") != "0":
+    cache_warmer.start()
+    cache_auditor.start()
+    booking_queue.start()
+    event_cancellation.resume_jobs()
 
 if __name__ == '__main__':
     app.run(port=5002)
@@ -0,0 +1,118 @@
+"""
+异步订票：/book_ticket 校验通过后把订票请求放入队列并立即返回任务ID，
+由固定数量的订票线程按入队顺序执行数据库事务，请求线程不再等待SQLite写锁。
+任务状态存放在缓存后端，/booking_status/<job_id> 在任意worker上都能查询。
+"""
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+
+import metrics
+import seat_cache
+from database.db import DatabaseBusy
+
+BOOKING_JOB_PREFIX = "booking:job:"
+# 未显式指定时是否默认走异步订票
+ASYNC_BOOKING = os.environ.get("ASYNC_BOOKING", "0") == "1"
+# 队列容量，队列满时拒绝新请求（503）
+BOOKING_QUEUE_SIZE = 10000
+# 订票线程数：SQLite同一时刻只有一个写事务，多于两个线程只会互相等待写锁
+BOOKING_WORKERS = 2
+# 任务状态保存时长（秒）
+JOB_TTL = 3600
+
+# 任务状态
+QUEUED = "queued"
+PROCESSING = "processing"
+DONE = "done"
+
+_queue = queue.Queue(maxsize=BOOKING_QUEUE_SIZE)
+_started = False
+_start_lock = threading.Lock()
+
+
+def _job_key(job_id):
+    return f"{BOOKING_JOB_PREFIX}{job_id}"
+
+
+def _save(job):
+    seat_cache.redis_client.setex(_job_key(job["job_id"]), JOB_TTL, json.dumps(job))
+
+
+def get_job(job_id):
+    """任务记录，不存在或已过期时返回None"""
+    value = seat_cache.redis_client.get(_job_key(job_id))
+    return json.loads(value) if value else None
+
+
+def submit(username, booking, handler):
+    """
+    提交订票任务，返回任务记录；队列已满时返回None
+    handler(username, booking) 在订票线程中执行，返回 (结果dict, HTTP状态码)
+    """
+    job = {"job_id": secrets.token_urlsafe(12), "status": QUEUED, "username": username,
+           "event_id": str(booking["event_id"]), "seat_ids": booking["seat_ids"], "enqueued_at": time.time()}
+    _save(job)
+    try:
+        _queue.put_nowait((job, booking, handler))
+    except queue.Full:
+        seat_cache.redis_client.delete(_job_key(job["job_id"]))
+        metrics.inc("booking_queue.rejected")
+        return None
+    metrics.inc("booking_queue.submitted")
+    metrics.set_gauge("booking_queue.depth", _queue.qsize())
+    return job
+
+
+def _process(job, booking, handler):
+    start = time.time()
+    metrics.observe("booking_queue.wait_seconds", start - job["enqueued_at"])
+    metrics.set_gauge("booking_queue.depth", _queue.qsize())
+    _save(dict(job, status=PROCESSING, started_at=start))
+    try:
+        result, status_code = handler(job["username"], booking)
+    except DatabaseBusy as e:
+        result, status_code = {"status": "fail", "message": str(e), "retry_after": e.retry_after}, 503
+    except Exception as e:
+        metrics.inc("booking_queue.errors")
+        print(f"订票任务{job['job_id']}失败: {e}")
+        result, status_code = {"status": "error", "message": f"Unexpected error: {str(e)}"}, 500
+    finished = time.time()
+    metrics.observe("booking_queue.process_seconds", finished - start)
+    metrics.inc("booking_queue.succeeded" if status_code == 200 else "booking_queue.failed")
+    _save(dict(job, status=DONE, started_at=start, finished_at=finished, result=result, status_code=status_code))
+
+
+def run_pending():
+    """在当前线程处理队列中已有的任务，返回处理的任务数"""
+    processed = 0
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            return processed
+        _process(*item)
+        processed += 1
+
+
+def queue_depth():
+    return _queue.qsize()
+
+
+def _worker_loop():
+    while True:
+        _process(*_queue.get())
+
+
+def start():
+    """启动订票线程（重复调用无副作用）"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        for i in range(BOOKING_WORKERS):
+            threading.Thread(target=_worker_loop, name=f"booking-worker-{i}", daemon=True).start()
+        _started = True
@@ -0,0 +1,127 @@
+"""
+缓存/数据库一致性巡检：定期抽样已缓存的场次，先用座位数和校验值做廉价比对，
+不一致时再逐座位比对并用数据库数据修复缓存，漂移情况通过 /metrics 导出。
+每轮同时按 SeatTypes.stock 校正所有余票计数器，并丢弃已过期场次的缓存策略统计。
+"""
+import random
+import threading
+import time
+
+import metrics
+import seat_cache
+import stock_counters
+from database.db import fetch_query
+
+# 每轮抽样的场次数与巡检间隔（秒）
+AUDIT_SAMPLE_SIZE = 20
+AUDIT_INTERVAL_SECONDS = 30
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def _load_seats(event_id):
+    return [dict(row) for row in fetch_query("SELECT * FROM Seats WHERE event_id = ? ORDER BY id", (event_id,))]
+
+
+def db_checksums(event_ids):
+    """一条聚合SQL计算多个场次的校验值，与seat_cache.seat_checksum口径一致"""
+    if not event_ids:
+        return {}
+    placeholders = ",".join("?" for _ in event_ids)
+    rows = fetch_query(f"""
+        SELECT event_id,
+               COUNT(*) AS total,
+               SUM(CASE WHEN is_reserved THEN 1 ELSE 0 END) AS reserved,
+               SUM(CASE WHEN is_reserved THEN id ELSE 0 END) AS id_sum,
+               SUM(CASE WHEN is_reserved THEN id * id ELSE 0 END) AS id_square_sum
+        FROM Seats
+        WHERE event_id IN ({placeholders})
+        GROUP BY event_id
+    """, list(event_ids))
+    return {str(r["event_id"]): (r["total"], r["reserved"], r["id_sum"], r["id_square_sum"]) for r in rows}
+
+
+def audit_events(event_ids):
+    """
+    巡检一批场次，返回本轮统计
+    {"checked": 场次数, "drifted": 不一致场次数, "repaired_seats": 修复座位数}
+    """
+    event_ids = [str(event_id) for event_id in event_ids]
+    cached = seat_cache.get_many_seats_from_cache(event_ids)
+    expected = db_checksums(event_ids)
+
+    report = {"checked": 0, "drifted": 0, "repaired_seats": 0}
+    for event_id, seats in cached.items():
+        if seats is None:
+            continue  # 抽样后已过期
+        report["checked"] += 1
+        db_sum = expected.get(event_id)
+        if db_sum is None:
+            # 场次已被删除，缓存只会误导请求
+            seat_cache.clear_event_cache(event_id)
+            report["drifted"] += 1
+            continue
+        if seat_cache.seat_checksum(seats) == db_sum:
+            continue
+        drifted = seat_cache.repair_seat_cache(event_id, _load_seats)
+        if drifted:
+            report["drifted"] += 1
+            report["repaired_seats"] += drifted
+
+    metrics.inc("cache_auditor.events_checked", report["checked"])
+    metrics.inc("cache_auditor.events_drifted", report["drifted"])
+    metrics.inc("cache_auditor.seats_repaired", report["repaired_seats"])
+    if report["checked"]:
+        metrics.set_gauge("cache_auditor.drift_rate", round(report["drifted"] / report["checked"], 4))
+    return report
+
+
+def reconcile_stock_counters(event_ids=None):
+    """一条SQL读取剩余票数并校正余票计数器，返回偏差的票数之和"""
+    event_ids = [str(event_id) for event_id in (stock_counters.counted_event_ids() if event_ids is None else event_ids)]
+    if not event_ids:
+        return 0
+    placeholders = ",".join("?" for _ in event_ids)
+    rows = fetch_query(f"SELECT event_id, type, stock FROM SeatTypes WHERE event_id IN ({placeholders})", event_ids)
+    stocks = {}
+    for row in rows:
+        stocks.setdefault(str(row["event_id"]), {})[row["type"]] = row["stock"]
+    drift = 0
+    for event_id in event_ids:
+        drift += stock_counters.reconcile(event_id, stocks.get(event_id)) or 0
+    metrics.inc("stock_counters.reconciled_events", len(event_ids))
+    metrics.inc("stock_counters.drift", drift)
+    return drift
+
+
+def run_once(sample_size=AUDIT_SAMPLE_SIZE):
+    """随机抽样已缓存的场次并巡检"""
+    event_ids = seat_cache.cached_event_ids()
+    seat_cache.prune_policy_state(event_ids)
+    if len(event_ids) > sample_size:
+        event_ids = random.sample(event_ids, sample_size)
+    start = time.perf_counter()
+    report = audit_events(event_ids)
+    reconcile_stock_counters()
+    metrics.observe("cache_auditor.run_seconds", time.perf_counter() - start)
+    return report
+
+
+def _audit_loop():
+    while True:
+        time.sleep(AUDIT_INTERVAL_SECONDS)
+        try:
+            run_once()
+        except Exception as e:
+            metrics.inc("cache_auditor.errors")
+            print(f"缓存巡检失败: {e}")
+
+
+def start():
+    """启动后台巡检线程（重复调用无副作用）"""
+    global _started
+    with _start_lock:
+        if not _started:
+            threading.Thread(target=_audit_loop, name="cache-auditor", daemon=True).start()
+            _started = True
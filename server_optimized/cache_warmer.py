@@ -0,0 +1,146 @@
+"""
+后台座位缓存预热：请求线程只把场次ID放入有界队列，由固定数量的预热线程
+去重后加载座位图；另有定时任务提前预热临近开演的场次。
+"""
+import queue
+import threading
+import time
+
+import metrics
+import seat_cache
+from database.db import fetch_query
+
+# 预热队列容量，队列满时丢弃新的预热请求（预热只是优化，不影响正确性）
+WARM_QUEUE_SIZE = 1000
+# 并发预热线程数，以及每个线程一次合并处理的场次数
+WARM_WORKERS = 2
+WARM_BATCH_SIZE = 50
+# 定时预热间隔（秒）及提前天数
+WARM_INTERVAL_SECONDS = 60
+WARM_AHEAD_DAYS = 3
+
+_queue = queue.Queue(maxsize=WARM_QUEUE_SIZE)
+_pending = set()  # 已入队或正在预热的场次，用于去重
+_pending_lock = threading.Lock()
+_started = False
+_start_lock = threading.Lock()
+
+
+def enqueue(event_ids):
+    """提交预热请求（不阻塞），返回实际入队的数量"""
+    queued = 0
+    for event_id in event_ids:
+        key = str(event_id)
+        with _pending_lock:
+            if key in _pending:
+                metrics.inc("cache_warmer.deduplicated")
+                continue
+            _pending.add(key)
+        try:
+            _queue.put_nowait(key)
+            queued += 1
+        except queue.Full:
+            with _pending_lock:
+                _pending.discard(key)
+            metrics.inc("cache_warmer.dropped")
+    metrics.inc("cache_warmer.enqueued", queued)
+    metrics.set_gauge("cache_warmer.queue_depth", _queue.qsize())
+    return queued
+
+
+def warm_events(event_ids):
+    """
+    预热一批场次：一次MGET找出未缓存的场次，一条SQL加载它们的座位，
+    再用一次pipeline写回缓存，返回实际加载的场次数
+    """
+    summaries = seat_cache.get_availability_summaries(event_ids)
+    missing = [event_id for event_id, summary in summaries.items() if summary is None]
+    if not missing:
+        return 0
+    start = time.perf_counter()
+    placeholders = ",".join("?" for _ in missing)
+    rows = fetch_query(f"SELECT * FROM Seats WHERE event_id IN ({placeholders}) ORDER BY id", missing)
+    seats_by_event = {}
+    for row in rows:
+        seats_by_event.setdefault(str(row["event_id"]), []).append(dict(row))
+    elapsed = time.perf_counter() - start
+    # 合并加载的耗时按座位数分摊到各场次，作为回源成本估计
+    for event_id, seats in seats_by_event.items():
+        seat_cache.note_reload_cost(event_id, elapsed * len(seats) / max(len(rows), 1))
+    seat_cache.set_many_seats_to_cache(seats_by_event)
+    metrics.observe("cache_warmer.load_seconds", elapsed)
+    metrics.inc("cache_warmer.warmed", len(seats_by_event))
+    return len(seats_by_event)
+
+
+def _take_batch(first):
+    """以first开头，再取出队列中已有的请求凑成一批"""
+    batch = [first]
+    while len(batch) < WARM_BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _process(batch):
+    try:
+        warm_events(batch)
+    except Exception as e:
+        metrics.inc("cache_warmer.errors")
+        print(f"预热场次{batch}缓存失败: {e}")
+    finally:
+        with _pending_lock:
+            _pending.difference_update(batch)
+        metrics.set_gauge("cache_warmer.queue_depth", _queue.qsize())
+
+
+def run_pending():
+    """在当前线程处理队列中已有的预热请求，返回处理的场次数"""
+    processed = 0
+    while True:
+        try:
+            first = _queue.get_nowait()
+        except queue.Empty:
+            return processed
+        batch = _take_batch(first)
+        _process(batch)
+        processed += len(batch)
+
+
+def upcoming_event_ids(days=WARM_AHEAD_DAYS):
+    """今天起days天内开演的场次"""
+    rows = fetch_query(
+        "SELECT id, event_date FROM Events WHERE event_date BETWEEN date('now') AND date('now', ?)",
+        (f"+{days} days",)
+    )
+    for row in rows:
+        seat_cache.note_event_date(row["id"], row["event_date"])
+    return [row["id"] for row in rows]
+
+
+def _worker_loop():
+    while True:
+        _process(_take_batch(_queue.get()))
+
+
+def _schedule_loop():
+    while True:
+        try:
+            enqueue(upcoming_event_ids())
+        except Exception as e:
+            print(f"定时预热失败: {e}")
+        time.sleep(WARM_INTERVAL_SECONDS)
+
+
+def start():
+    """启动预热线程和定时预热任务（重复调用无副作用）"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        for i in range(WARM_WORKERS):
+            threading.Thread(target=_worker_loop, name=f"cache-warmer-{i}", daemon=True).start()
+        threading.Thread(target=_schedule_loop, name="cache-warmer-schedule", daemon=True).start()
+        _started = True
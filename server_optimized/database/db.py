@@ -1,28 +1,123 @@
 import os
+import random
 import sqlite3
 import sys
+import threading
+import time
 from pathlib import Path
 
 # 导入根目录的 cache 模块
 BASE_DIR2 = Path(__file__).parent.parent  # 项目根目录（server_optimized）
 sys.path.append(str(BASE_DIR2))  # 将项目根目录添加到系统路径
-from seat_cache import batch_update_seat_cache  # 直接导入
+from seat_cache import batch_update_seat_cache, seat_types_of  # 直接导入
+from seat_changes import record_seat_changes
+import stock_counters
+import metrics
+from database.schema import ensure_schema
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # database/ 目录
 DB_PATH = os.path.join(BASE_DIR, "concert.db")  # 指向 database/app.db
 
+# sqlite3's own busy timeout; write paths use a short one and retry with backoff instead
+SQLITE_BUSY_TIMEOUT = 5.0
+BUSY_ATTEMPT_TIMEOUT = 0.05
+# busy retry policy: full-jitter exponential backoff until the deadline, then DatabaseBusy
+BUSY_DEADLINE_SECONDS = 2.0
+BUSY_BASE_DELAY = 0.005
+BUSY_MAX_DELAY = 0.25
+BUSY_RETRY_AFTER_SECONDS = 1
+# total busy waiting allowed for one HTTP request across all of its DB calls
+REQUEST_BUSY_BUDGET_SECONDS = 3.0
+# seats per order, and orders per transaction for bulk bookings
+MAX_ORDER_SEATS = 4
+BULK_CHUNK_SIZE = 500
 
-def connect_db():
-    return sqlite3.connect(DB_PATH)
+_request_state = threading.local()
 
 
-def execute_query(query, params=()):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute(query, params)
-    conn.commit()
-    last_id = cursor.lastrowid
-    conn.close()
+class DatabaseBusy(Exception):
+    """the write lock could not be taken before the deadline; the request may be retried later"""
+
+    def __init__(self, site, waited):
+        super().__init__(f"Database is busy ({site}), please retry")
+        self.site = site
+        self.waited = waited
+        self.retry_after = BUSY_RETRY_AFTER_SECONDS
+
+
+def is_busy_error(error):
+    """SQLITE_BUSY / SQLITE_LOCKED surface as OperationalError with these messages"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("database is locked" in message
+                                                            or "database is busy" in message
+                                                            or "database table is locked" in message)
+
+
+def set_request_deadline(seconds=None):
+    """bound the total busy waiting of the current request's DB calls (None clears it)"""
+    _request_state.deadline = time.monotonic() + seconds if seconds is not None else None
+
+
+def retry_on_busy(site, operation, deadline=None):
+    """
+    run operation(), retrying busy/locked errors with jittered exponential backoff
+    until the per-call deadline or the request deadline, whichever comes first;
+    lock wait time is recorded per call site
+    """
+    start = time.monotonic()
+    give_up = start + (BUSY_DEADLINE_SECONDS if deadline is None else deadline)
+    request_deadline = getattr(_request_state, "deadline", None)
+    if request_deadline is not None:
+        give_up = min(give_up, request_deadline)
+    attempt = 0
+    while True:
+        try:
+            result = operation()
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e):
+                raise
+            now = time.monotonic()
+            delay = random.uniform(0, min(BUSY_MAX_DELAY, BUSY_BASE_DELAY * 2 ** attempt))
+            attempt += 1
+            if now + delay >= give_up:
+                metrics.observe(f"db.lock_wait_seconds.{site}", now - start)
+                metrics.inc(f"db.busy_failures.{site}")
+                raise DatabaseBusy(site, now - start)
+            metrics.inc(f"db.busy_retries.{site}")
+            time.sleep(delay)
+            continue
+        metrics.observe(f"db.lock_wait_seconds.{site}", time.monotonic() - start)
+        return result
+
+
+def connect_db(timeout=SQLITE_BUSY_TIMEOUT):
+    conn = sqlite3.connect(DB_PATH, timeout=timeout)
+    ensure_schema(conn, DB_PATH)
+    return conn
+
+
+def begin_immediate(conn, site):
+    """take the write lock up front, retrying while another writer holds it"""
+    retry_on_busy(site, lambda: conn.execute("BEGIN IMMEDIATE"))
+
+
+def execute_query(query, params=(), site="execute_query"):
+    conn = connect_db(timeout=BUSY_ATTEMPT_TIMEOUT)
+
+    def write():
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            conn.commit()
+            return cursor.lastrowid
+        except sqlite3.OperationalError:
+            conn.rollback()
+            raise
+
+    try:
+        last_id = retry_on_busy(site, write)
+    finally:
+        conn.close()
     return last_id
 
 
@@ -44,27 +139,121 @@ def get_user_id(username):
     return result[0]['user_id']
 
 
+#event info plus the price of each seat type, as kept in the event meta cache
+def get_event_meta(event_id):
+    event = fetch_query("SELECT * FROM Events WHERE id = ?", (event_id,))
+    if not event:
+        return None
+    seat_types = fetch_query("SELECT type, price FROM SeatTypes WHERE event_id = ? ORDER BY type", (event_id,))
+    return {"event": dict(event[0]), "seat_types": [dict(row) for row in seat_types]}
+
+
 # FR-TK-003
 def reserve_seats(event_id, seat_ids, username, user_id):
     """
     Handle seat reservation with transaction locking to ensure data consistency
     """
-    conn = connect_db()
+    # fast-fail on sold-out seat types before opening a connection
+    needs = _stock_needs(event_id, seat_ids)
+    claimed = stock_counters.claim(event_id, needs) if needs else None
+    if claimed:
+        return {"status": "fail", "sold_out": True,
+                "message": "Reservation failed: seat type sold out"}
+
+    try:
+        result = _reserve_seats(event_id, seat_ids, username, user_id, seed_counters=claimed is None)
+    except DatabaseBusy:
+        if claimed is not None:
+            stock_counters.restore(event_id, needs)
+        raise
+    if claimed is not None and result["status"] != "success":
+        stock_counters.restore(event_id, needs)
+    return result
+
+
+def _stock_needs(event_id, seat_ids):
+    """{seat type: count} from the cached layout, None when a seat is unknown to the cache"""
+    seat_types = seat_types_of(event_id, seat_ids)
+    if seat_types is None or len(seat_types) != len(set(seat_ids)):
+        return None
+    needs = {}
+    for seat_type in seat_types.values():
+        needs[seat_type] = needs.get(seat_type, 0) + 1
+    return needs
+
+
+def _fetch_seat_rows(cur, event_id, seat_ids):
+    """{seat_id: (id, is_reserved, type, price)} for the seats of event_id among seat_ids"""
+    placeholders = ",".join("?" for _ in seat_ids)
+    cur.execute(f"""
+        SELECT s.id, s.is_reserved, s.type, st.price
+        FROM Seats s
+        JOIN SeatTypes st
+          ON st.event_id = s.event_id AND st.type = s.type
+        WHERE s.event_id=? AND s.id IN ({placeholders})
+    """, [event_id] + list(seat_ids))
+    return {row[0]: row for row in cur.fetchall()}
+
+
+def _record_sales(cur, event_id, day, lines, cancelled=False):
+    """
+    Fold order lines into SalesAggregates inside the caller's transaction:
+    lines is [(seat_type, price)], one upsert per seat type
+    """
+    totals = {}
+    for seat_type, price in lines:
+        count, amount = totals.get(seat_type, (0, 0))
+        totals[seat_type] = (count + 1, amount + price)
+    rows = [(event_id, seat_type, day, 0, 0, count, amount) if cancelled
+            else (event_id, seat_type, day, count, amount, 0, 0)
+            for seat_type, (count, amount) in totals.items()]
+    cur.executemany("""
+        INSERT INTO SalesAggregates (event_id, seat_type, day, tickets_sold, revenue, tickets_cancelled, refunded)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (event_id, seat_type, day) DO UPDATE SET
+            tickets_sold = tickets_sold + excluded.tickets_sold,
+            revenue = revenue + excluded.revenue,
+            tickets_cancelled = tickets_cancelled + excluded.tickets_cancelled,
+            refunded = refunded + excluded.refunded
+    """, rows)
+
+
+def _insert_orders(cur, event_id, orders):
+    """
+    Write validated orders inside the caller's transaction, set-based:
+    orders is [(user_id, seat rows from _fetch_seat_rows)], returns ([(order_id, total_price)], {type: seats sold})
+    """
+    # one timestamp for the whole batch, so the sales aggregates use the orders' own sale day
+    created_at = cur.execute("SELECT datetime('now')").fetchone()[0]
+    created, details, sold = [], [], {}
+    for user_id, rows in orders:
+        total_price = sum(price for _, _, _, price in rows)
+        cur.execute(
+            "INSERT INTO Orders (event_id, user_id, created_at, total_price) VALUES (?, ?, ?, ?)",
+            (event_id, user_id, created_at, total_price)
+        )
+        order_id = cur.lastrowid
+        created.append((order_id, total_price))
+        for seat_id, _, seat_type, price in rows:
+            details.append((order_id, seat_id, seat_type, price))
+            sold[seat_type] = sold.get(seat_type, 0) + 1
+    cur.executemany("INSERT INTO OrderDetails (order_id, seat_id, seat_type, price) VALUES (?, ?, ?, ?)", details)
+    cur.executemany("UPDATE Seats SET is_reserved=1 WHERE id=?", [(seat_id,) for _, seat_id, _, _ in details])
+    cur.executemany("UPDATE SeatTypes SET stock = stock - ? WHERE event_id=? AND type=?",
+                    [(count, event_id, seat_type) for seat_type, count in sold.items()])
+    _record_sales(cur, event_id, created_at[:10], [(seat_type, price) for _, _, seat_type, price in details])
+    return created, sold
+
+
+def _reserve_seats(event_id, seat_ids, username, user_id, seed_counters=False):
+    conn = connect_db(timeout=BUSY_ATTEMPT_TIMEOUT)
     try:
         cur = conn.cursor()
         # Start transaction with immediate lock to avoid race conditions
-        cur.execute("BEGIN IMMEDIATE")
+        begin_immediate(conn, "reserve_seats")
 
         # fetch seat info for validation
-        placeholders = ",".join("?" for _ in seat_ids)
-        cur.execute(f"""
-            SELECT s.id, s.is_reserved, s.type, st.price
-            FROM Seats s
-            JOIN SeatTypes st 
-              ON st.event_id = s.event_id AND st.type = s.type
-            WHERE s.event_id=? AND s.id IN ({placeholders})
-        """, [event_id] + seat_ids)
-        rows = cur.fetchall()
+        rows = list(_fetch_seat_rows(cur, event_id, seat_ids).values())
 
         # check seat existence and availability
         if len(rows) != len(seat_ids):
@@ -74,42 +263,222 @@ def reserve_seats(event_id, seat_ids, username, user_id):
             conn.rollback()
             return {"status": "fail", "message": "Reservation failed: one or more seats already taken"}
 
-        # calculate total price
-        total_price = 0
-        for seat_id, is_reserved, seat_type, price in rows:
-            #print(seat_id, seat_type, price)
-            total_price += price
+        # create order record, order items and update seat/stock
+        [(order_id, total_price)], _ = _insert_orders(cur, event_id, [(user_id, rows)])
 
-        # create order record
-        cur.execute(
-            "INSERT INTO Orders (event_id, user_id, created_at, total_price) VALUES (?, ?, datetime('now'), ?)",
-            (event_id, user_id, total_price)
-        )
-        order_id = cur.lastrowid
+        stocks = None
+        if seed_counters:
+            cur.execute("SELECT type, stock FROM SeatTypes WHERE event_id=?", (event_id,))
+            stocks = dict(cur.fetchall())
 
-        # insert order items and update seat/stock
-        for seat_id, _, seat_type, price in rows:
-            # Add order item with price lookup
-            cur.execute("""
-                INSERT INTO OrderDetails (order_id, seat_id, seat_type, price) 
-                VALUES (?, ?, ?, ?)
-            """, (order_id, seat_id, seat_type, price))
-            # Mark seat as reserved
-            cur.execute("UPDATE Seats SET is_reserved=1 WHERE id=?", (seat_id,))
-            # Reduce stock for the seat type
-            cur.execute("UPDATE SeatTypes SET stock = stock - 1 WHERE event_id=? AND type=?", (event_id, seat_type))
-
-        # Step 5: commit transaction
-        conn.commit()
+        # Step 5: commit transaction (in rollback-journal mode COMMIT waits for readers to drain)
+        retry_on_busy("reserve_seats.commit", conn.commit)
+        if stocks:
+            stock_counters.seed(event_id, stocks)
 
         # 单个更新 → 批量更新
         seat_updates = [(seat_id, 1) for seat_id in seat_ids]
         batch_update_seat_cache(event_id, seat_updates)
+        record_seat_changes(event_id, seat_updates)
 
         return {"status": "success", "order_id": order_id, 'total_price': total_price}
+    except DatabaseBusy:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         print("Error in reserve_seats:", e)  # 打印具体错误
         return {"status": "error", "message": f"Unexpected error: {str(e)}"}
     finally:
         conn.close()
+
+
+def reserve_orders(event_id, orders, chunk_size=None):
+    """
+    Book many orders for one event in a few chunked transactions with partial success:
+    orders is [{"username", "seat_ids"}], returns one result dict per order in the same order
+    """
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    results = [None] * len(orders)
+    for start in range(0, len(orders), chunk_size):
+        chunk = range(start, min(start + chunk_size, len(orders)))
+        try:
+            _reserve_chunk(event_id, orders, chunk, results)
+        except DatabaseBusy as e:
+            for i in chunk:
+                results[i] = {"status": "error", "message": str(e), "retry_after": e.retry_after}
+    return results
+
+
+def _order_failure(seat_ids, user_id, seats, taken):
+    """why one order of a bulk booking cannot be applied, None when it can"""
+    if user_id is None:
+        return "Unknown user"
+    if not seat_ids:
+        return "seat_ids required"
+    if len(seat_ids) > MAX_ORDER_SEATS:
+        return f"Cannot purchase more than {MAX_ORDER_SEATS} seats"
+    if len(set(seat_ids)) != len(seat_ids) or any(seat_id not in seats for seat_id in seat_ids):
+        return "Invalid seat selection: some seats not found"
+    if any(seats[seat_id][1] == 1 or seat_id in taken for seat_id in seat_ids):
+        return "Reservation failed: one or more seats already taken"
+    return None
+
+
+def _reserve_chunk(event_id, orders, chunk, results):
+    conn = connect_db(timeout=BUSY_ATTEMPT_TIMEOUT)
+    try:
+        cur = conn.cursor()
+        begin_immediate(conn, "reserve_orders")
+        usernames = list({orders[i].get("username") for i in chunk})
+        cur.execute(f"SELECT username, user_id FROM Users WHERE username IN ({','.join('?' for _ in usernames)})",
+                    usernames)
+        user_ids = dict(cur.fetchall())
+        seats = _fetch_seat_rows(cur, event_id, {seat_id for i in chunk for seat_id in orders[i].get("seat_ids") or []})
+
+        # validate in order: earlier orders of the batch win seats over later ones
+        accepted, taken = [], set()
+        for i in chunk:
+            seat_ids = orders[i].get("seat_ids") or []
+            user_id = user_ids.get(orders[i].get("username"))
+            failure = _order_failure(seat_ids, user_id, seats, taken)
+            if failure:
+                results[i] = {"status": "fail", "message": failure}
+                continue
+            taken.update(seat_ids)
+            accepted.append((i, user_id, [seats[seat_id] for seat_id in seat_ids]))
+
+        created, sold = _insert_orders(cur, event_id, [(user_id, rows) for _, user_id, rows in accepted])
+        retry_on_busy("reserve_orders.commit", conn.commit)
+    except DatabaseBusy:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        print("Error in reserve_orders:", e)
+        for i in chunk:
+            results[i] = {"status": "error", "message": f"Unexpected error: {str(e)}"}
+        return
+    finally:
+        conn.close()
+
+    for (i, _, _), (order_id, total_price) in zip(accepted, created):
+        results[i] = {"status": "success", "order_id": order_id, "total_price": total_price,
+                      "seat_ids": orders[i]["seat_ids"]}
+    if taken:
+        # one cache patch per chunk, same batched path as single bookings
+        seat_updates = [(seat_id, 1) for seat_id in taken]
+        batch_update_seat_cache(event_id, seat_updates)
+        record_seat_changes(event_id, seat_updates)
+        stock_counters.consume(event_id, sold)
+
+
+# FR-OM-002
+def release_order(order_id):
+    """
+    Cancel an order and return the seats released by cancel_order_trigger
+    """
+    conn = connect_db(timeout=BUSY_ATTEMPT_TIMEOUT)
+    try:
+        cur = conn.cursor()
+        begin_immediate(conn, "release_order")
+        cur.execute("SELECT event_id, status, date(created_at) FROM Orders WHERE id=?", (order_id,))
+        order = cur.fetchone()
+        cur.execute("UPDATE Orders SET status = 0 WHERE id = ?", (order_id,))
+
+        # only a confirmed -> cancelled transition fires the trigger and frees seats
+        released = []
+        if order and order[1] == 1:
+            cur.execute("SELECT seat_id, seat_type, price FROM OrderDetails WHERE order_id=?", (order_id,))
+            lines = cur.fetchall()
+            rows = [(seat_id, seat_type) for seat_id, seat_type, _ in lines if seat_id is not None]
+            released = [seat_id for seat_id, _ in rows]
+            _record_sales(cur, order[0], order[2], [(seat_type, price) for _, seat_type, price in lines],
+                          cancelled=True)
+        retry_on_busy("release_order.commit", conn.commit)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    event_id = order[0] if order else None
+    if released:
+        # patch exactly the released seats, same batched path as bookings
+        seat_updates = [(seat_id, 0) for seat_id in released]
+        batch_update_seat_cache(event_id, seat_updates)
+        record_seat_changes(event_id, seat_updates)
+        needs = {}
+        for _, seat_type in rows:
+            needs[seat_type] = needs.get(seat_type, 0) + 1
+        stock_counters.restore(event_id, needs)
+    return event_id, released
+
+
+def cancel_event_orders_batch(event_id, batch_size):
+    """
+    Cancel the next batch of confirmed orders of event_id in one write transaction, set-based.
+    The job's keyset cursor (created_at, id) in EventCancellations advances in the same transaction,
+    so a crashed job resumes exactly where it stopped.
+    returns {"orders": cancelled, "seat_ids": released seats, "refunded": amount}
+    """
+    conn = connect_db(timeout=BUSY_ATTEMPT_TIMEOUT)
+    try:
+        cur = conn.cursor()
+        begin_immediate(conn, "cancel_event_orders")
+        cur.execute("SELECT last_created_at, last_order_id FROM EventCancellations WHERE event_id=?", (event_id,))
+        last_created_at, last_order_id = cur.fetchone() or (None, None)
+        if last_created_at is None:
+            cur.execute("""
+                SELECT id, created_at FROM Orders WHERE event_id=? AND status=1
+                ORDER BY created_at, id LIMIT ?
+            """, (event_id, batch_size))
+        else:
+            cur.execute("""
+                SELECT id, created_at FROM Orders WHERE event_id=? AND status=1 AND (created_at, id) > (?, ?)
+                ORDER BY created_at, id LIMIT ?
+            """, (event_id, last_created_at, last_order_id, batch_size))
+        orders = cur.fetchall()
+        if not orders:
+            conn.rollback()
+            return {"orders": 0, "seat_ids": [], "refunded": 0}
+
+        order_ids = [order_id for order_id, _ in orders]
+        placeholders = ",".join("?" for _ in order_ids)
+        cur.execute(f"SELECT order_id, seat_id, seat_type, price FROM OrderDetails WHERE order_id IN ({placeholders})",
+                    order_ids)
+        lines = cur.fetchall()
+
+        # cancel_order_trigger skips this event while in_batch is set; seats and stock are restored below
+        cur.execute("UPDATE EventCancellations SET in_batch = 1 WHERE event_id=?", (event_id,))
+        cur.execute(f"UPDATE Orders SET status = 0 WHERE id IN ({placeholders})", order_ids)
+        seat_ids = [seat_id for _, seat_id, _, _ in lines if seat_id is not None]
+        cur.executemany("UPDATE Seats SET is_reserved = 0 WHERE id = ?", [(seat_id,) for seat_id in seat_ids])
+        restored = {}
+        for _, _, seat_type, _ in lines:
+            restored[seat_type] = restored.get(seat_type, 0) + 1
+        cur.executemany("UPDATE SeatTypes SET stock = stock + ? WHERE event_id=? AND type=?",
+                        [(count, event_id, seat_type) for seat_type, count in restored.items()])
+
+        # refunds count against each order's sale day, as in release_order
+        days = {order_id: created_at[:10] for order_id, created_at in orders}
+        lines_by_day = {}
+        for order_id, _, seat_type, price in lines:
+            lines_by_day.setdefault(days[order_id], []).append((seat_type, price))
+        for day, day_lines in lines_by_day.items():
+            _record_sales(cur, event_id, day, day_lines, cancelled=True)
+
+        refunded = sum(price for _, _, _, price in lines)
+        cur.execute("""
+            UPDATE EventCancellations
+            SET in_batch = 0, cancelled_orders = cancelled_orders + ?, released_seats = released_seats + ?,
+                refunded = refunded + ?, last_created_at = ?, last_order_id = ?, updated_at = datetime('now')
+            WHERE event_id=?
+        """, (len(orders), len(seat_ids), refunded, orders[-1][1], orders[-1][0], event_id))
+        retry_on_busy("cancel_event_orders.commit", conn.commit)
+        return {"orders": len(orders), "seat_ids": seat_ids, "refunded": refunded}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
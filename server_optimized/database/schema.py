@@ -0,0 +1,207 @@
+"""
+Schema additions applied lazily on first connection to each database file.
+Every statement is idempotent, so existing databases upgrade in place.
+"""
+import threading
+
+# columns of Events covered by the full-text index (append artist/venue here once they exist)
+EVENT_SEARCH_COLUMNS = ("name",)
+
+_migrated = set()
+_lock = threading.Lock()
+
+
+def _event_search_index(cur):
+    """FTS5 index over event text columns, kept in sync with Events by triggers"""
+    exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'EventsFts'"
+    ).fetchone()
+    columns = ", ".join(EVENT_SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in EVENT_SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in EVENT_SEARCH_COLUMNS)
+    cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS EventsFts USING fts5(
+            {columns}, content='Events', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON Events BEGIN
+            INSERT INTO EventsFts(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON Events BEGIN
+            INSERT INTO EventsFts(EventsFts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE OF {columns} ON Events BEGIN
+            INSERT INTO EventsFts(EventsFts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO EventsFts(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    if not exists:
+        # index events that were inserted before the table existed
+        cur.execute("INSERT INTO EventsFts(EventsFts) VALUES ('rebuild')")
+
+
+def _event_listing_indexes(cur):
+    """keyset pagination on (event_date, id) and per-event price/stock filters"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_date_id ON Events(event_date, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_seat_types_event_price ON SeatTypes(event_id, price, stock)")
+
+
+def _order_listing_indexes(cur):
+    """keyset pagination of orders on (created_at, id), per user / per event / all, covering the listed columns"""
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_user_created
+        ON Orders(user_id, created_at, id, status, event_id, total_price)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_event_created
+        ON Orders(event_id, created_at, id, status, user_id, total_price)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_created
+        ON Orders(created_at, id, status, event_id, user_id, total_price)
+    """)
+
+
+def _order_details_index(cur):
+    """order lines by order id (export, cancellation), covering the exported columns"""
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_details_order
+        ON OrderDetails(order_id, id, seat_id, seat_type, price)
+    """)
+
+
+def rebuild_sales_aggregates(cur):
+    """recompute SalesAggregates from Orders/OrderDetails (run inside the caller's write transaction)"""
+    cur.execute("DELETE FROM SalesAggregates")
+    cur.execute("""
+        INSERT INTO SalesAggregates (event_id, seat_type, day, tickets_sold, revenue, tickets_cancelled, refunded)
+        SELECT o.event_id, d.seat_type, date(o.created_at), COUNT(*), SUM(d.price),
+               SUM(o.status = 0), SUM(CASE WHEN o.status = 0 THEN d.price ELSE 0 END)
+        FROM Orders o
+        JOIN OrderDetails d ON d.order_id = o.id
+        WHERE o.event_id IN (SELECT id FROM Events)
+        GROUP BY o.event_id, d.seat_type, date(o.created_at)
+    """)
+
+
+def _sales_aggregates(cur):
+    """
+    per event / seat type / sale day totals, maintained by the booking and cancellation transactions;
+    cancellations count against the day the order was placed, so a rebuild reproduces the same rows
+    """
+    exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'SalesAggregates'"
+    ).fetchone()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS SalesAggregates (
+            event_id INTEGER NOT NULL,
+            seat_type INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            tickets_sold INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            tickets_cancelled INTEGER NOT NULL DEFAULT 0,
+            refunded INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (event_id, seat_type, day)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_aggregates_day ON SalesAggregates(day)")
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS sales_aggregates_event_delete AFTER DELETE ON Events BEGIN
+            DELETE FROM SalesAggregates WHERE event_id = old.id;
+        END
+    """)
+    if not exists:
+        # aggregate orders placed before the table existed
+        rebuild_sales_aggregates(cur)
+
+
+def _event_cancellation_jobs(cur):
+    """
+    progress of event-wide cancellation jobs (durable, so a job resumes after a crash);
+    while a job's batch transaction sets in_batch, cancel_order_trigger skips that event's orders
+    and the batch restores seats and stock set-wise instead of once per order;
+    a job that stopped on an unexpected error is 'failed' with the error kept for the status endpoint
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS EventCancellations (
+            event_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'running',
+            in_batch INTEGER NOT NULL DEFAULT 0,
+            cancelled_orders INTEGER NOT NULL DEFAULT 0,
+            released_seats INTEGER NOT NULL DEFAULT 0,
+            refunded INTEGER NOT NULL DEFAULT 0,
+            last_created_at TEXT,
+            last_order_id INTEGER,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            error TEXT
+        )
+    """)
+    # tables created before failed jobs recorded their error
+    if "error" not in [row[1] for row in cur.execute("PRAGMA table_info(EventCancellations)")]:
+        cur.execute("ALTER TABLE EventCancellations ADD COLUMN error TEXT")
+    trigger = cur.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'cancel_order_trigger'"
+    ).fetchone()
+    if trigger and "EventCancellations" in trigger[0]:
+        return
+    cur.execute("DROP TRIGGER IF EXISTS cancel_order_trigger")
+    cur.execute("""
+        CREATE TRIGGER cancel_order_trigger
+        AFTER UPDATE ON Orders
+        FOR EACH ROW
+        WHEN OLD.status = 1 AND NEW.status = 0 AND NOT EXISTS (
+            SELECT 1 FROM EventCancellations WHERE event_id = OLD.event_id AND in_batch = 1
+        )
+        BEGIN
+            -- release seats
+            UPDATE Seats
+            SET is_reserved = 0
+            WHERE id IN (
+                SELECT seat_id FROM OrderDetails WHERE order_id = OLD.id
+            );
+
+            -- increase stock
+            UPDATE SeatTypes
+            SET stock = stock + (
+                SELECT COUNT(*) FROM OrderDetails
+                WHERE order_id = OLD.id AND seat_type = SeatTypes.type
+            )
+            WHERE SeatTypes.event_id = OLD.event_id;
+        END
+    """)
+
+
+MIGRATIONS = [
+    _event_search_index,
+    _event_listing_indexes,
+    _order_listing_indexes,
+    _order_details_index,
+    _sales_aggregates,
+    _event_cancellation_jobs,
+]
+
+
+def ensure_schema(conn, db_path):
+    """apply MIGRATIONS once per database file per process"""
+    if db_path in _migrated:
+        return
+    with _lock:
+        if db_path in _migrated:
+            return
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for migration in MIGRATIONS:
+                migration(cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        _migrated.add(db_path)
@@ -0,0 +1,145 @@
+"""
+整场退票：场次延期/取消时由管理员发起，后台线程按批取消该场次的全部有效订单。
+每批一个短事务，集合式释放座位、加回库存并记录退款，批与批之间让出写锁，其他场次的订票最多等待一批。
+进度（游标、已取消订单数、退款额）与每批订单在同一事务中写入 EventCancellations，崩溃后从游标继续；
+座位缓存和余票计数器在任务结束时统一更新一次。
+批处理出现意外错误时任务标记为failed并记录错误，重新发起或进程重启时从游标继续。
+"""
+import threading
+import time
+
+import cache_auditor
+import metrics
+import seat_allocator
+import seat_cache
+from database.db import DatabaseBusy, cancel_event_orders_batch, execute_query, fetch_query
+from seat_changes import record_seat_changes, reset_event_log
+
+# 每批取消的订单数
+CANCEL_BATCH_SIZE = 200
+# 批与批之间的间隔（秒），让等待写锁的订票事务先提交
+BATCH_PAUSE_SECONDS = 0.01
+# 执行权租约：多个worker同时恢复同一任务时只有一个在跑；崩溃后租约过期即可重新发起
+LEASE_PREFIX = "event_cancel:lease:"
+LEASE_SECONDS = 60
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_threads = {}  # 格式: {event_id(str): threading.Thread}
+_threads_lock = threading.Lock()
+
+
+def get_job(event_id):
+    """任务进度，含剩余的有效订单数；没有任务时返回None"""
+    rows = fetch_query("SELECT * FROM EventCancellations WHERE event_id = ?", (event_id,))
+    if not rows:
+        return None
+    job = dict(rows[0])
+    job.pop("in_batch", None)
+    job["remaining_orders"] = fetch_query(
+        "SELECT COUNT(*) AS n FROM Orders WHERE event_id = ? AND status = 1", (event_id,)
+    )[0]["n"]
+    return job
+
+
+def start(event_id):
+    """
+    建立（或重新打开）任务记录并在后台线程执行，返回任务进度
+    已完成的任务再次发起时从原游标继续，取消之后新下的订单
+    """
+    execute_query("""
+        INSERT INTO EventCancellations (event_id, status) VALUES (?, ?)
+        ON CONFLICT (event_id) DO UPDATE SET status = excluded.status, finished_at = NULL, error = NULL
+    """, (event_id, RUNNING))
+    _spawn(event_id)
+    return get_job(event_id)
+
+
+def _spawn(event_id):
+    key = str(event_id)
+    with _threads_lock:
+        thread = _threads.get(key)
+        if thread is not None and thread.is_alive():
+            return thread
+        thread = threading.Thread(target=run_job, args=(event_id,), name=f"event-cancel-{key}", daemon=True)
+        _threads[key] = thread
+        thread.start()
+        return thread
+
+
+def wait(event_id, timeout=None):
+    """等待本进程中该场次的任务线程结束"""
+    thread = _threads.get(str(event_id))
+    if thread is not None:
+        thread.join(timeout)
+
+
+def run_job(event_id, batch_size=None):
+    """
+    在当前线程按批执行任务直到没有有效订单，完成返回True
+    其他worker持有租约、或批处理出错（任务标记为failed）时返回False
+    """
+    batch_size = batch_size or CANCEL_BATCH_SIZE
+    lease = f"{LEASE_PREFIX}{event_id}"
+    if not seat_cache.redis_client.set(lease, 1, nx=True, ex=LEASE_SECONDS):
+        return False
+    try:
+        rows = fetch_query("SELECT cancelled_orders FROM EventCancellations WHERE event_id = ?", (event_id,))
+        resumed = bool(rows and rows[0]["cancelled_orders"])
+        released = []
+        try:
+            while True:
+                try:
+                    batch = cancel_event_orders_batch(event_id, batch_size)
+                except DatabaseBusy as e:
+                    metrics.inc("event_cancellation.busy")
+                    time.sleep(e.retry_after)
+                    continue
+                seat_cache.redis_client.expire(lease, LEASE_SECONDS)
+                released.extend(batch["seat_ids"])
+                metrics.inc("event_cancellation.orders", batch["orders"])
+                if batch["orders"] < batch_size:
+                    break
+                time.sleep(BATCH_PAUSE_SECONDS)
+        except Exception as e:
+            # 出错的批已回滚，之前提交的批保留；记录错误供进度查询，已释放的座位照常更新缓存
+            metrics.inc("event_cancellation.failures")
+            print(f"整场退票任务失败: event_id={event_id}, {e}")
+            execute_query("""
+                UPDATE EventCancellations SET status = ?, error = ?, updated_at = datetime('now')
+                WHERE event_id = ?
+            """, (FAILED, f"{type(e).__name__}: {e}", event_id))
+            _refresh_caches(event_id, released, resumed)
+            return False
+
+        execute_query("""
+            UPDATE EventCancellations
+            SET status = ?, error = NULL, finished_at = datetime('now'), updated_at = datetime('now')
+            WHERE event_id = ?
+        """, (DONE, event_id))
+        _refresh_caches(event_id, released, resumed)
+        return True
+    finally:
+        seat_cache.redis_client.delete(lease)
+
+
+def _refresh_caches(event_id, released, resumed):
+    """任务结束后统一更新一次座位缓存、变更日志和余票计数器"""
+    if resumed:
+        # 之前的运行释放的座位不在本次记录中，整体失效让下一次读取回源
+        seat_cache.clear_event_cache(event_id)
+        reset_event_log(event_id)
+        seat_allocator.forget(event_id)
+    elif released:
+        seat_updates = [(seat_id, 0) for seat_id in released]
+        seat_cache.batch_update_seat_cache(event_id, seat_updates)
+        record_seat_changes(event_id, seat_updates)
+    cache_auditor.reconcile_stock_counters([event_id])
+
+
+def resume_jobs():
+    """进程启动时继续未完成和失败的任务"""
+    for row in fetch_query("SELECT event_id FROM EventCancellations WHERE status IN (?, ?)", (RUNNING, FAILED)):
+        _spawn(row["event_id"])
@@ -0,0 +1,146 @@
+"""
+场次搜索：名称默认走FTS5全文索引（词前缀匹配、多个词须同时命中），
+match=substring 保留原有的子串匹配行为；日期格式的关键字按场次日期精确查询。
+结果按 (event_date, id) 排序，带limit或cursor时用键集游标分页，深翻页与首页代价相同；
+都不带时与原来一样返回全部结果。sort=relevance 按全文相关度返回前limit条（不分页）。
+"""
+import re
+
+import query_args
+from database.db import fetch_query
+from query_args import DATE_PATTERN, date_arg, decode_cursor, int_arg
+
+# 名称匹配方式：fts(默认) 或 substring(兼容旧行为)
+MATCH_MODES = ("fts", "substring")
+# 排序方式：date(默认，支持游标分页) 或 relevance(仅全文检索，返回第一页)
+SORT_MODES = ("date", "relevance")
+# 每页条数：只带cursor时的默认值与上限
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 500
+
+_TOKEN = re.compile(r"\w+")
+
+
+def query_kind(keyword):
+    """关键字类型：date 或 name"""
+    return "date" if DATE_PATTERN.match(keyword) else "name"
+
+
+def fts_match_expression(keyword):
+    """关键字转为FTS5查询：每个词加引号并按前缀匹配，多个词之间为AND；没有可检索的词时返回None"""
+    tokens = _TOKEN.findall(keyword)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def encode_cursor(event):
+    """由一页的最后一条结果生成不透明游标"""
+    return query_args.encode_cursor(event["event_date"], event["id"])
+
+
+def parse_search_args(args):
+    """
+    解析 /search_events 的分页、排序和过滤参数，参数不合法时抛出ValueError
+    返回 {"match", "sort", "limit", "after", "filters": {date_from, date_to, price_min, price_max, has_availability}}
+    不带limit和cursor时limit为None，返回全部结果（如管理端列出所有场次）
+    """
+    match = args.get("match", "fts")
+    if match not in MATCH_MODES:
+        raise ValueError(f"Invalid match mode: {match}")
+    sort = args.get("sort", "date")
+    if sort not in SORT_MODES:
+        raise ValueError(f"Invalid sort: {sort}")
+    cursor = args.get("cursor")
+    paginate = "limit" in args or cursor is not None
+    limit = int_arg(args, "limit", minimum=1) or DEFAULT_PAGE_SIZE
+    filters = {
+        "date_from": date_arg(args, "date_from"),
+        "date_to": date_arg(args, "date_to"),
+        "price_min": int_arg(args, "price_min"),
+        "price_max": int_arg(args, "price_max"),
+        "has_availability": args.get("has_availability", "").lower() in ("1", "true", "yes"),
+    }
+    return {
+        "match": match,
+        "sort": sort,
+        "limit": min(limit, MAX_PAGE_SIZE) if paginate else None,
+        "after": decode_cursor(cursor) if cursor else None,
+        "filters": filters,
+    }
+
+
+def _filter_conditions(filters, conditions, params):
+    """把过滤条件追加到WHERE子句"""
+    if filters.get("date_from"):
+        conditions.append("e.event_date >= ?")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        conditions.append("e.event_date <= ?")
+        params.append(filters["date_to"])
+    # 票价区间与有余票针对同一座位类型：即“该价位还有票”
+    seat_type_conditions = []
+    if filters.get("price_min") is not None:
+        seat_type_conditions.append("st.price >= ?")
+        params.append(filters["price_min"])
+    if filters.get("price_max") is not None:
+        seat_type_conditions.append("st.price <= ?")
+        params.append(filters["price_max"])
+    if filters.get("has_availability"):
+        seat_type_conditions.append("st.stock > 0")
+    if seat_type_conditions:
+        conditions.append(
+            "EXISTS (SELECT 1 FROM SeatTypes st WHERE st.event_id = e.id AND "
+            + " AND ".join(seat_type_conditions) + ")"
+        )
+
+
+def search_events(keyword, match="fts", filters=None, after=None, limit=None, sort="date"):
+    """
+    按规范化后的关键字查询场次，返回 (dict列表, 下一页游标或None)
+    after为上一页游标解码出的 (event_date, id)；limit为None时不分页
+    """
+    conditions, params = [], []
+    relevance = False
+    if query_kind(keyword) == "date":
+        conditions.append("e.event_date = ?")
+        params.append(keyword)
+    else:
+        expression = fts_match_expression(keyword) if match == "fts" else None
+        if expression is not None:
+            relevance = sort == "relevance"
+            if relevance:
+                conditions.append("EventsFts MATCH ?")
+            else:
+                conditions.append("e.id IN (SELECT rowid FROM EventsFts WHERE EventsFts MATCH ?)")
+            params.append(expression)
+        elif keyword:
+            # 子串匹配（纯符号关键字同样走这里，保持原有行为）
+            conditions.append("LOWER(e.name) LIKE LOWER(?)")
+            params.append(f"%{keyword}%")
+    _filter_conditions(filters or {}, conditions, params)
+
+    if relevance:
+        # 相关度排序只返回第一页，不提供游标
+        sql = "SELECT e.* FROM EventsFts JOIN Events e ON e.id = EventsFts.rowid"
+        order = " ORDER BY EventsFts.rank, e.event_date, e.id"
+        after = None
+    else:
+        sql = "SELECT e.* FROM Events e"
+        order = " ORDER BY e.event_date, e.id"
+        if after is not None:
+            conditions.append("(e.event_date, e.id) > (?, ?)")
+            params.extend(after)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += order
+    if limit is not None:
+        # 多取一条判断是否还有下一页
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    results = [dict(row) for row in fetch_query(sql, params)]
+    if limit is None or len(results) <= limit:
+        return results, None
+    results = results[:limit]
+    return results, None if relevance else encode_cursor(results[-1])
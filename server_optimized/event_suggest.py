@@ -0,0 +1,241 @@
+"""
+场次名称联想：进程内有序前缀索引，名称开头及其中每个词的起始位置各建一条索引项。
+索引是不可变快照，读取只取当前引用后二分查找、不加锁；增删改场次时由写锁串行生成新快照并整体替换。
+快照由定长有序分块组成，增量更新只复制分块列表和受影响的分块，与索引规模基本无关。
+场次表版本号与快照不一致（如其他worker修改了场次）时由后台线程整体重建，重建期间继续使用旧快照；
+版本号每VERSION_CHECK_SECONDS秒最多查询一次，读取路径通常不访问缓存后端。
+"""
+import bisect
+import re
+import threading
+import time
+from itertools import islice
+
+import metrics
+import search_cache
+from database.db import fetch_query
+
+# 默认及最多返回的联想条数
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+# 索引项只保留前KEY_CHARS个字符，更长的前缀查询时再逐条核对名称
+KEY_CHARS = 24
+# 每个名称最多为前MAX_WORDS个词建索引项
+MAX_WORDS = 8
+# 每个分块的索引项数，增量插入使分块超过两倍时一分为二
+BLOCK_SIZE = 512
+# 检查场次表版本号的最短间隔（秒）：其他worker的修改最迟在该间隔后开始重建
+VERSION_CHECK_SECONDS = 1.0
+
+_WORD = re.compile(r"\w+")
+
+
+def index_keys(name):
+    """名称对应的索引项：整名及每个词起始处的后缀（小写、截断）"""
+    lowered = name.lower()
+    keys = {lowered[:KEY_CHARS]}
+    for word in islice(_WORD.finditer(lowered), MAX_WORDS):
+        keys.add(lowered[word.start():word.start() + KEY_CHARS])
+    return keys
+
+
+def _has_prefix(name, prefix):
+    lowered = name.lower()
+    return lowered.startswith(prefix) or any(
+        lowered.startswith(prefix, word.start()) for word in islice(_WORD.finditer(lowered), MAX_WORDS)
+    )
+
+
+class PrefixIndex:
+    """
+    不可变的前缀索引快照：blocks为有序分块 [(keys, ids), ...]，分块发布后不再修改
+    names为写入方维护的 {event_id: name}，各快照共享，读取方只用它取名称
+    """
+
+    __slots__ = ("blocks", "firsts", "names", "version", "size")
+
+    def __init__(self, blocks, names, version):
+        self.blocks = blocks
+        self.firsts = [keys[0] for keys, _ in blocks]  # 各分块的首个索引项，用于定位分块
+        self.names = names
+        self.version = version
+        self.size = sum(len(keys) for keys, _ in blocks)
+
+    @classmethod
+    def build(cls, events, version):
+        """由 [(event_id, name), ...] 整体构建"""
+        entries = sorted((key, event_id) for event_id, name in events for key in index_keys(name))
+        keys = [key for key, _ in entries]
+        ids = [event_id for _, event_id in entries]
+        blocks = [(keys[i:i + BLOCK_SIZE], ids[i:i + BLOCK_SIZE]) for i in range(0, len(keys), BLOCK_SIZE)]
+        return cls(blocks, dict(events), version)
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, prefix, limit=SUGGEST_LIMIT):
+        """前缀（已小写）匹配的前limit个场次，按索引项字典序"""
+        probe = prefix[:KEY_CHARS]
+        blocks, names = self.blocks, self.names
+        if not blocks:
+            return []
+        block = max(bisect.bisect_right(self.firsts, probe) - 1, 0)
+        position = bisect.bisect_left(blocks[block][0], probe)
+        seen, results = set(), []
+        while block < len(blocks):
+            keys, ids = blocks[block]
+            for position in range(position, len(keys)):
+                if not keys[position].startswith(probe) or len(results) >= limit:
+                    return results
+                event_id = ids[position]
+                name = names.get(event_id)
+                if name is None or event_id in seen:
+                    continue
+                if len(prefix) > KEY_CHARS and not _has_prefix(name, prefix):
+                    continue
+                seen.add(event_id)
+                results.append({"id": event_id, "name": name})
+            block, position = block + 1, 0
+        return results
+
+    def with_event(self, event_id, name, version):
+        """返回增加/修改（name为None时删除）一个场次后的新快照，原快照的分块不变"""
+        old_name = self.names.get(event_id)
+        blocks = self.blocks
+        if old_name != name:
+            blocks, firsts = list(blocks), list(self.firsts)
+            if old_name is not None:
+                for key in index_keys(old_name):
+                    _remove_entry(blocks, firsts, key, event_id)
+            if name is not None:
+                for key in index_keys(name):
+                    _insert_entry(blocks, firsts, key, event_id)
+            if name is None:
+                self.names.pop(event_id, None)
+            else:
+                self.names[event_id] = name
+        return PrefixIndex(blocks, self.names, version)
+
+
+def _remove_entry(blocks, firsts, key, event_id):
+    # 相同的索引项可能跨越多个分块，从可能包含key的第一个分块向后找
+    block = max(bisect.bisect_left(firsts, key) - 1, 0)
+    while block < len(blocks):
+        keys, ids = blocks[block]
+        position = bisect.bisect_left(keys, key)
+        while position < len(keys) and keys[position] == key:
+            if ids[position] == event_id:
+                keys, ids = keys[:position] + keys[position + 1:], ids[:position] + ids[position + 1:]
+                if keys:
+                    blocks[block] = (keys, ids)
+                    firsts[block] = keys[0]
+                else:
+                    del blocks[block]
+                    del firsts[block]
+                return
+            position += 1
+        block += 1
+
+
+def _insert_entry(blocks, firsts, key, event_id):
+    if not blocks:
+        blocks.append(([key], [event_id]))
+        firsts.append(key)
+        return
+    block = max(bisect.bisect_right(firsts, key) - 1, 0)
+    keys, ids = list(blocks[block][0]), list(blocks[block][1])
+    position = bisect.bisect_right(keys, key)
+    keys.insert(position, key)
+    ids.insert(position, event_id)
+    if len(keys) > BLOCK_SIZE * 2:
+        half = len(keys) // 2
+        blocks[block:block + 1] = [(keys[:half], ids[:half]), (keys[half:], ids[half:])]
+        firsts[block:block + 1] = [keys[0], keys[half]]
+    else:
+        blocks[block] = (keys, ids)
+        firsts[block] = keys[0]
+
+
+_index = None  # 当前快照，只整体替换
+_write_lock = threading.Lock()
+_refresher = None  # 正在进行的后台重建线程
+_refresher_lock = threading.Lock()
+_version_checked_at = 0.0  # 上次查询场次表版本号的时间（time.monotonic）
+
+
+def _publish(index):
+    global _index
+    _index = index
+    metrics.set_gauge("event_suggest.entries", len(index))
+
+
+def rebuild(version):
+    """从Events整体重建索引（其他线程已重建到该版本时直接返回）"""
+    with _write_lock:
+        if _index is not None and _index.version == version:
+            return _index
+        start = time.perf_counter()
+        rows = fetch_query("SELECT id, name FROM Events")
+        _publish(PrefixIndex.build([(row["id"], row["name"]) for row in rows], version))
+        metrics.observe("event_suggest.rebuild_seconds", time.perf_counter() - start)
+        return _index
+
+
+def _refresh_in_background(version):
+    global _refresher
+    with _refresher_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return
+        _refresher = threading.Thread(target=rebuild, args=(version,), name="event-suggest-rebuild", daemon=True)
+        _refresher.start()
+
+
+def current_index():
+    """
+    当前索引快照：尚未建立时同步构建；场次表版本变化时后台重建，先返回旧快照
+    距上次查询版本号不足VERSION_CHECK_SECONDS秒时直接返回快照（本进程的修改已由apply_change同步）
+    """
+    global _version_checked_at
+    index = _index
+    now = time.monotonic()
+    if index is not None and now - _version_checked_at < VERSION_CHECK_SECONDS:
+        return index
+    _version_checked_at = now
+    version = search_cache.events_version()
+    if index is None:
+        return rebuild(version)
+    if index.version != version:
+        _refresh_in_background(version)
+    return index
+
+
+def apply_change(event_id, name, version):
+    """
+    本进程增删改场次后增量更新索引（name为None表示删除），version为本次递增后的场次表版本号
+    索引尚未建立或中间有未同步的版本时不处理，由下次读取整体重建
+    """
+    with _write_lock:
+        index = _index
+        if index is None or index.version != version - 1:
+            return
+        start = time.perf_counter()
+        _publish(index.with_event(int(event_id), name, version))
+        metrics.observe("event_suggest.update_seconds", time.perf_counter() - start)
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT):
+    """前缀联想，返回 [{"id", "name"}, ...]"""
+    prefix = search_cache.normalize_keyword(prefix)
+    if not prefix:
+        return []
+    return current_index().lookup(prefix, min(limit, MAX_SUGGEST_LIMIT))
+
+
+def reset():
+    """丢弃本进程的索引（切换数据库时调用）"""
+    global _index, _version_checked_at
+    if _refresher is not None:
+        _refresher.join()
+    with _write_lock:
+        _index = None
+    _version_checked_at = 0.0
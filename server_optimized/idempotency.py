@@ -0,0 +1,139 @@
+"""
+订票幂等键：客户端超时重试时携带相同的Idempotency-Key，同一用户同一键只执行一次订票。
+首次请求先以NX写入处理中标记，完成后写入结果（带TTL）；重复请求直接返回保存的结果，
+首次请求仍在处理时重复请求等待其结果，而不是再开一个数据库事务。
+结果同时按会话建立别名，同一会话的重试连会话校验也不必查询数据库。
+"""
+import hashlib
+import json
+import secrets
+import time
+
+import redis
+
+import metrics
+import seat_cache
+
+IDEMPOTENCY_PREFIX = "idem:"
+# 结果保存时长
+RESULT_TTL = 24 * 3600
+# 处理中标记的有效期：首次请求所在worker崩溃时，超过该时间后允许重新执行
+IN_FLIGHT_TTL = 30
+# 重复请求等待首次请求结果的最长时间，以及轮询间隔（逐步加长）
+WAIT_TIMEOUT = 10
+POLL_INTERVAL = 0.02
+MAX_POLL_INTERVAL = 0.25
+MAX_KEY_LENGTH = 255
+# 只保存确定性的结果：成功、已受理的异步任务，以及参数/座位状态导致的失败；排队、锁定冲突和服务端错误可以重试
+STORED_STATUS_CODES = (200, 202, 400)
+
+# begin() 的返回状态
+STARTED = "started"
+REPLAY = "replay"
+MISMATCH = "mismatch"
+IN_PROGRESS = "in_progress"
+
+
+def _record_key(username, key):
+    return f"{IDEMPOTENCY_PREFIX}{username}:{key}"
+
+
+def _session_key(session_id, key):
+    return f"{IDEMPOTENCY_PREFIX}session:{session_id}:{key}"
+
+
+def fingerprint(data):
+    """请求体指纹：同一个键只能用于同一个请求"""
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _load(key):
+    value = seat_cache.redis_client.get(key)
+    return json.loads(value) if value else None
+
+
+def session_replay(session_id, key, request_fingerprint):
+    """同一会话的重试：返回已完成且请求体一致的结果记录，否则返回None"""
+    if not session_id:
+        return None
+    username = seat_cache.redis_client.get(_session_key(session_id, key))
+    if username is None:
+        return None
+    record = _load(_record_key(username, key))
+    if record is None or record["state"] != "done" or record["fingerprint"] != request_fingerprint:
+        return None
+    metrics.inc("idempotency.replayed")
+    return record
+
+
+def begin(username, key, request_fingerprint):
+    """
+    开始处理一个幂等请求，返回 (状态, 记录)：
+    STARTED 由本请求执行（记录含token，完成后传给finish）；REPLAY 返回已保存的结果；
+    MISMATCH 该键已用于不同的请求体；IN_PROGRESS 等待超时，首次请求仍未完成
+    """
+    client = seat_cache.redis_client
+    record_key = _record_key(username, key)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    interval = POLL_INTERVAL
+    waited = False
+    while True:
+        token = secrets.token_urlsafe(12)
+        pending = {"state": "pending", "token": token, "fingerprint": request_fingerprint}
+        if client.set(record_key, json.dumps(pending), nx=True, ex=IN_FLIGHT_TTL):
+            return STARTED, pending
+        record = _load(record_key)
+        if record is None:
+            # 恰好过期或被放弃，重新抢占
+            continue
+        if record["fingerprint"] != request_fingerprint:
+            metrics.inc("idempotency.mismatched")
+            return MISMATCH, record
+        if record["state"] == "done":
+            metrics.inc("idempotency.replayed")
+            if waited:
+                metrics.inc("idempotency.waited")
+            return REPLAY, record
+        if time.monotonic() >= deadline:
+            metrics.inc("idempotency.wait_timeouts")
+            return IN_PROGRESS, record
+        waited = True
+        time.sleep(interval)
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+
+def _owned(pipe, record_key, token):
+    value = pipe.get(record_key)
+    return value is not None and json.loads(value).get("token") == token
+
+
+def finish(username, key, pending, session_id, body, status_code):
+    """
+    首次请求完成：确定性的结果保存RESULT_TTL并建立会话别名，其他结果删除处理中标记以便重试
+    处理中标记已过期并被其他请求接管时不覆盖
+    """
+    record_key = _record_key(username, key)
+    store = status_code in STORED_STATUS_CODES
+    for _ in range(seat_cache.UPDATE_RETRIES):
+        pipe = seat_cache.redis_client.pipeline()
+        try:
+            pipe.watch(record_key)
+            if not _owned(pipe, record_key, pending["token"]):
+                return
+            pipe.multi()
+            if store:
+                record = {"state": "done", "fingerprint": pending["fingerprint"],
+                          "status_code": status_code, "body": body}
+                pipe.setex(record_key, RESULT_TTL, json.dumps(record))
+                if session_id:
+                    pipe.setex(_session_key(session_id, key), RESULT_TTL, username)
+            else:
+                pipe.delete(record_key)
+            pipe.execute()
+            metrics.inc("idempotency.stored" if store else "idempotency.abandoned")
+            return
+        except redis.WatchError:
+            continue
+        finally:
+            pipe.reset()
@@ -0,0 +1,286 @@
+"""
+进程内缓存后端：在没有Redis服务的环境下（单进程部署、本地开发、测试）
+提供与redis-py兼容的最小命令子集，seat_cache等模块无需区分后端。
+"""
+import fnmatch
+import heapq
+import threading
+import time
+from datetime import timedelta
+
+from redis.exceptions import WatchError
+
+
+# 每次写入时最多顺带清理的已过期键数（类似Redis的主动过期），不访问的过期键也能及时释放
+EXPIRE_PURGE_BATCH = 20
+
+
+def _to_seconds(value):
+    """把timedelta/数字统一转换为秒"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class LocalRedis:
+    """线程安全的内存键值存储，接口与redis.StrictRedis(decode_responses=True)保持一致"""
+
+    def __init__(self):
+        self._data = {}  # key -> value
+        self._expire_at = {}  # key -> 过期时间戳(time.monotonic)
+        self._versions = {}  # key -> 修改次数，用于实现WATCH
+        self._expiry_heap = []  # [(过期时间戳, key)]，键的过期时间变化后旧条目在弹出时忽略
+        self._lock = threading.RLock()
+
+    # ---------- 内部工具 ----------
+    def _alive(self, key):
+        expire_at = self._expire_at.get(key)
+        if expire_at is not None and expire_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expire_at.pop(key, None)
+            self._touch(key)
+        return key in self._data
+
+    def _touch(self, key):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _version(self, key):
+        with self._lock:
+            self._alive(key)
+            return self._versions.get(key, 0)
+
+    def _set_expiry(self, key, ttl):
+        expire_at = time.monotonic() + _to_seconds(ttl)
+        self._expire_at[key] = expire_at
+        heapq.heappush(self._expiry_heap, (expire_at, key))
+        self._purge_expired()
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        heap = self._expiry_heap
+        for _ in range(EXPIRE_PURGE_BATCH):
+            if not heap or heap[0][0] > now:
+                return
+            _, key = heapq.heappop(heap)
+            self._alive(key)
+
+    def _store(self, key, value, ttl=None):
+        self._data[key] = value
+        if ttl is None:
+            self._expire_at.pop(key, None)
+        else:
+            self._set_expiry(key, ttl)
+        self._touch(key)
+
+    # ---------- 通用命令 ----------
+    def ping(self):
+        return True
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key) if self._alive(key) else None
+
+    def mget(self, keys, *args):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        keys.extend(args)
+        with self._lock:
+            return [self._data.get(k) if self._alive(k) else None for k in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        with self._lock:
+            exists = self._alive(key)
+            if (nx and exists) or (xx and not exists):
+                return None
+            ttl = ex if ex is not None else (_to_seconds(px) / 1000 if px is not None else None)
+            self._store(key, value, ttl)
+            return True
+
+    def setex(self, key, time_, value):
+        return self.set(key, value, ex=time_)
+
+    def delete(self, *keys):
+        removed = 0
+        with self._lock:
+            for key in keys:
+                if self._alive(key):
+                    removed += 1
+                    self._data.pop(key, None)
+                    self._expire_at.pop(key, None)
+                    self._touch(key)
+        return removed
+
+    def exists(self, *keys):
+        with self._lock:
+            return sum(1 for k in keys if self._alive(k))
+
+    def expire(self, key, time_):
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._set_expiry(key, time_)
+            return True
+
+    def ttl(self, key):
+        with self._lock:
+            if not self._alive(key):
+                return -2
+            expire_at = self._expire_at.get(key)
+            if expire_at is None:
+                return -1
+            return max(0, int(round(expire_at - time.monotonic())))
+
+    def incrby(self, key, amount=1):
+        with self._lock:
+            current = int(self._data[key]) if self._alive(key) else 0
+            current += amount
+            # INCR不改变已有的过期时间
+            self._data[key] = str(current)
+            self._touch(key)
+            return current
+
+    def incr(self, key, amount=1):
+        return self.incrby(key, amount)
+
+    def decrby(self, key, amount=1):
+        return self.incrby(key, -amount)
+
+    def decr(self, key, amount=1):
+        return self.incrby(key, -amount)
+
+    # ---------- 有序集合 ----------
+    @staticmethod
+    def _score_bound(value):
+        """解析分数区间端点，返回(分数, 是否开区间)，支持 -inf/+inf 和 "(" 前缀"""
+        value = str(value)
+        exclusive = value.startswith("(")
+        if exclusive:
+            value = value[1:]
+        return float(value), exclusive
+
+    def _zset(self, key, create=False):
+        if self._alive(key):
+            return self._data[key]
+        if not create:
+            return None
+        self._data[key] = {}
+        return self._data[key]
+
+    def _zrange_members(self, zset, min_, max_):
+        low, low_open = self._score_bound(min_)
+        high, high_open = self._score_bound(max_)
+        return sorted(
+            ((score, member) for member, score in zset.items()
+             if (score > low if low_open else score >= low) and (score < high if high_open else score <= high))
+        )
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            zset = self._zset(key, create=True)
+            added = sum(1 for member in mapping if str(member) not in zset)
+            zset.update({str(member): float(score) for member, score in mapping.items()})
+            self._touch(key)
+            return added
+
+    def zrem(self, key, *members):
+        with self._lock:
+            zset = self._zset(key)
+            if zset is None:
+                return 0
+            removed = sum(1 for member in members if zset.pop(str(member), None) is not None)
+            if removed:
+                self._touch(key)
+            return removed
+
+    def zscore(self, key, member):
+        with self._lock:
+            zset = self._zset(key)
+            return zset.get(str(member)) if zset is not None else None
+
+    def zcard(self, key):
+        with self._lock:
+            zset = self._zset(key)
+            return len(zset) if zset is not None else 0
+
+    def zrangebyscore(self, key, min_, max_):
+        with self._lock:
+            zset = self._zset(key)
+            if zset is None:
+                return []
+            return [member for _, member in self._zrange_members(zset, min_, max_)]
+
+    def zremrangebyscore(self, key, min_, max_):
+        with self._lock:
+            zset = self._zset(key)
+            if zset is None:
+                return 0
+            members = self._zrange_members(zset, min_, max_)
+            for _, member in members:
+                del zset[member]
+            if members:
+                self._touch(key)
+            return len(members)
+
+    def keys(self, pattern="*"):
+        with self._lock:
+            return [k for k in list(self._data) if self._alive(k) and fnmatch.fnmatchcase(k, pattern)]
+
+    def scan_iter(self, match="*", count=None):
+        return iter(self.keys(match))
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    """模拟redis-py的Pipeline：WATCH后立即执行，MULTI后缓冲到execute时原子执行"""
+
+    def __init__(self, client):
+        self.client = client
+        self.watching = {}
+        self.explicit_multi = False
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def watch(self, *keys):
+        for key in keys:
+            self.watching[key] = self.client._version(key)
+        return True
+
+    def unwatch(self):
+        self.watching = {}
+        return True
+
+    def multi(self):
+        self.explicit_multi = True
+
+    def reset(self):
+        self.watching = {}
+        self.explicit_multi = False
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            # 与redis-py一致：WATCH之后、MULTI之前的命令立即执行
+            if self.watching and not self.explicit_multi:
+                return command(*args, **kwargs)
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        with self.client._lock:
+            try:
+                for key, version in self.watching.items():
+                    if self.client._version(key) != version:
+                        raise WatchError("Watched variable changed.")
+                return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+            finally:
+                self.reset()
@@ -0,0 +1,137 @@
+"""
+进程内运行指标：计数器、仪表、直方图与速率，通过 /metrics 以JSON导出，
+供压测脚本和运维查看订票链路各环节的负载情况。
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import Blueprint, jsonify
+
+metrics_bp = Blueprint("metrics", __name__)
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 速率统计窗口（秒）
+METER_WINDOW_SECONDS = 60
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = defaultdict(float)
+_histograms = {}
+_meters = {}
+_collectors = {}  # 格式: {name: fn()}，导出时调用，返回该模块的统计信息
+
+
+class Histogram:
+    """固定分桶直方图"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0,
+            "max": round(self.max, 6),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class Meter:
+    """按秒分桶的滑动窗口速率"""
+
+    def __init__(self):
+        self.total = 0
+        self.window = deque()  # [second, count]
+
+    def mark(self, n, now):
+        second = int(now)
+        self.total += n
+        if self.window and self.window[-1][0] == second:
+            self.window[-1][1] += n
+        else:
+            self.window.append([second, n])
+        self._trim(second)
+
+    def _trim(self, second):
+        while self.window and self.window[0][0] <= second - METER_WINDOW_SECONDS:
+            self.window.popleft()
+
+    def to_dict(self, now):
+        self._trim(int(now))
+        recent = sum(count for _, count in self.window)
+        return {"total": self.total, "per_second": round(recent / METER_WINDOW_SECONDS, 3)}
+
+
+def inc(name, amount=1):
+    """计数器累加"""
+    with _lock:
+        _counters[name] += amount
+
+
+def set_gauge(name, value):
+    """设置仪表当前值"""
+    with _lock:
+        _gauges[name] = value
+
+
+def add_gauge(name, delta):
+    """仪表增减（如在线连接数）"""
+    with _lock:
+        _gauges[name] += delta
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """记录一次直方图观测值"""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def mark(name, n=1):
+    """记录事件发生次数，用于计算每秒速率"""
+    with _lock:
+        meter = _meters.get(name)
+        if meter is None:
+            meter = _meters[name] = Meter()
+        meter.mark(n, time.time())
+
+
+def register_collector(name, collector):
+    """注册导出时才计算的统计（如缓存容量报告）"""
+    _collectors[name] = collector
+
+
+def snapshot():
+    """导出全部指标"""
+    now = time.time()
+    with _lock:
+        data = {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": {name: h.to_dict() for name, h in _histograms.items()},
+            "meters": {name: m.to_dict(now) for name, m in _meters.items()},
+        }
+    data["collectors"] = {name: collector() for name, collector in _collectors.items()}
+    return data
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def show_metrics():
+    return jsonify({"status": "success", "data": snapshot()})
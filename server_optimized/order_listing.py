@@ -0,0 +1,191 @@
+"""
+订单列表：按 (created_at, id) 排序并用键集游标分页，支持场次、状态和下单日期过滤。
+每种查询都有对应的覆盖索引（见 database/schema.py），翻到第几页代价都相同；
+不带limit/cursor（或paginate=0）时保留原来一次返回全部订单的行为。
+导出（/export_orders）按同样的顺序分批读取订单及明细，以CSV或NDJSON流式输出。
+"""
+import csv
+import io
+import json
+import sqlite3
+
+import query_args
+from database.db import connect_db, fetch_query
+from query_args import date_arg, decode_cursor, int_arg
+
+# 订单状态过滤：0-已取消 1-已确认 2-全部
+STATUS_FILTERS = ("0", "1", "2")
+# 每页条数：未指定时的默认值与上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# 导出时每批读取的订单数
+EXPORT_BATCH_SIZE = 500
+EXPORT_FORMATS = ("csv", "ndjson")
+# CSV每行为一条订单明细（订单字段重复），没有明细的订单输出一行、明细列为空
+EXPORT_CSV_COLUMNS = ("order_id", "created_at", "status", "event_id", "event_name", "username",
+                      "total_price", "seat_id", "seat_type", "price")
+
+
+def encode_cursor(order):
+    """由一页的最后一条订单生成不透明游标"""
+    return query_args.encode_cursor(order["created_at"], order["id"])
+
+
+def _filter_args(args, status):
+    return {
+        "status": None if status == "2" else int(status),
+        "event_id": int_arg(args, "event_id", minimum=1),
+        "date_from": date_arg(args, "date_from"),
+        "date_to": date_arg(args, "date_to"),
+    }
+
+
+def parse_order_args(args):
+    """
+    解析 /show_orders 的分页和过滤参数，参数不合法时抛出ValueError
+    返回 {"paginate", "limit", "after", "filters": {status, event_id, date_from, date_to}}
+    带limit或cursor时分页；都不带时与原来一样返回全部订单，paginate=1/0 可显式指定
+    """
+    status = args.get("status")
+    if status not in STATUS_FILTERS:
+        raise ValueError("Need a status")
+    cursor = args.get("cursor")
+    paginate = args.get("paginate")
+    if paginate is None:
+        paginate = "limit" in args or cursor is not None
+    else:
+        paginate = paginate not in ("0", "false", "no")
+    limit = int_arg(args, "limit", minimum=1) or DEFAULT_PAGE_SIZE
+    return {
+        "paginate": paginate,
+        "limit": min(limit, MAX_PAGE_SIZE) if paginate else None,
+        "after": decode_cursor(cursor) if cursor and paginate else None,
+        "filters": _filter_args(args, status),
+    }
+
+
+def parse_export_args(args):
+    """
+    解析 /export_orders 的格式和过滤参数，参数不合法时抛出ValueError
+    返回 {"format", "filters": {status, event_id, date_from, date_to}}；status默认为全部
+    """
+    export_format = args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format: {export_format}")
+    status = args.get("status", "2")
+    if status not in STATUS_FILTERS:
+        raise ValueError(f"Invalid status: {status}")
+    return {"format": export_format, "filters": _filter_args(args, status)}
+
+
+def _page_query(user_id, filters, after, limit):
+    """一页订单的SQL与参数：先在覆盖索引上取出一页订单，再按主键关联场次名称和用户名"""
+    filters = filters or {}
+    # 只列出场次和用户仍存在的订单（与原来的内连接一致），在分页前过滤以免页内缺条
+    conditions = ["EXISTS (SELECT 1 FROM Events e WHERE e.id = o.event_id)",
+                  "EXISTS (SELECT 1 FROM Users u WHERE u.user_id = o.user_id)"]
+    params = []
+    if user_id is not None:
+        conditions.append("o.user_id = ?")
+        params.append(user_id)
+    if filters.get("event_id") is not None:
+        conditions.append("o.event_id = ?")
+        params.append(filters["event_id"])
+    if filters.get("status") is not None:
+        conditions.append("o.status = ?")
+        params.append(filters["status"])
+    if filters.get("date_from"):
+        conditions.append("o.created_at >= ?")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        # created_at 带时分秒，截止日期当天整天都算
+        conditions.append("o.created_at < date(?, '+1 day')")
+        params.append(filters["date_to"])
+    if after is not None:
+        conditions.append("(o.created_at, o.id) > (?, ?)")
+        params.extend(after)
+
+    page = ("SELECT o.id, o.user_id, o.event_id, o.total_price, o.status, o.created_at FROM Orders o"
+            " WHERE " + " AND ".join(conditions) + " ORDER BY o.created_at, o.id")
+    if limit is not None:
+        page += " LIMIT ?"
+        params.append(limit)
+    sql = f"""
+        SELECT e.name, o.total_price, o.created_at, u.username, o.id, o.event_id, o.status
+        FROM ({page}) o
+        JOIN Events e ON e.id = o.event_id
+        JOIN Users u ON u.user_id = o.user_id
+        ORDER BY o.created_at, o.id
+    """
+    return sql, params
+
+
+def list_orders(user_id=None, filters=None, after=None, limit=None):
+    """
+    按 (created_at, id) 顺序查询订单，返回 (dict列表, 下一页游标或None)
+    user_id为None时查询所有用户的订单；after为上一页游标解码出的 (created_at, id)；limit为None时不分页
+    """
+    # 多取一条判断是否还有下一页
+    sql, params = _page_query(user_id, filters, after, None if limit is None else limit + 1)
+    results = [dict(row) for row in fetch_query(sql, params)]
+    if limit is None or len(results) <= limit:
+        return results, None
+    results = results[:limit]
+    return results, encode_cursor(results[-1])
+
+
+def iter_order_batches(filters=None, batch_size=None):
+    """
+    导出用：按 (created_at, id) 顺序逐批读取订单及其明细，每批为 [(订单dict, 明细dict列表)]
+    每批只执行两条短查询，批与批之间不持有读锁，导出大量订单时不会长时间阻塞写事务
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    conn = connect_db()
+    conn.row_factory = sqlite3.Row
+    try:
+        after = None
+        while True:
+            sql, params = _page_query(None, filters, after, batch_size)
+            orders = [dict(row) for row in conn.execute(sql, params).fetchall()]
+            if not orders:
+                return
+            placeholders = ",".join("?" * len(orders))
+            details = {}
+            for row in conn.execute(f"""
+                SELECT order_id, seat_id, seat_type, price FROM OrderDetails
+                WHERE order_id IN ({placeholders}) ORDER BY order_id, id
+            """, [order["id"] for order in orders]):
+                details.setdefault(row["order_id"], []).append(
+                    {"seat_id": row["seat_id"], "seat_type": row["seat_type"], "price": row["price"]})
+            yield [(order, details.get(order["id"], [])) for order in orders]
+            if len(orders) < batch_size:
+                return
+            after = (orders[-1]["created_at"], orders[-1]["id"])
+    finally:
+        conn.close()
+
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def export_lines(export_format, filters=None, batch_size=None):
+    """导出内容的生成器，逐行产出文本；任何时刻内存中只有一批订单"""
+    if export_format == "csv":
+        yield _csv_line(EXPORT_CSV_COLUMNS)
+    for batch in iter_order_batches(filters, batch_size):
+        for order, details in batch:
+            if export_format == "ndjson":
+                yield json.dumps({"order_id": order["id"], "created_at": order["created_at"],
+                                  "status": order["status"], "event_id": order["event_id"],
+                                  "event_name": order["name"], "username": order["username"],
+                                  "total_price": order["total_price"], "details": details},
+                                 ensure_ascii=False) + "\n"
+                continue
+            head = [order["id"], order["created_at"], order["status"], order["event_id"], order["name"],
+                    order["username"], order["total_price"]]
+            for detail in details or [None]:
+                tail = [detail["seat_id"], detail["seat_type"], detail["price"]] if detail else ["", "", ""]
+                yield _csv_line(head + tail)
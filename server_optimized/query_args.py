@@ -0,0 +1,50 @@
+"""
+列表接口共用的查询参数解析与键集游标：游标把一页最后一条的 (排序键, id) 编码为不透明字符串，
+搜索场次和订单列表共用同一格式。
+"""
+import base64
+import binascii
+import json
+import re
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def encode_cursor(sort_value, row_id):
+    """由一页最后一条结果的 (排序键, id) 生成不透明游标"""
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """游标还原为 (排序键, id)，格式错误时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(sort_value, str) or not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return sort_value, row_id
+
+
+def date_arg(args, name):
+    """YYYY-MM-DD 格式的日期参数，未提供时返回None"""
+    value = args.get(name)
+    if value is not None and not DATE_PATTERN.match(value):
+        raise ValueError(f"{name} must be YYYY-MM-DD")
+    return value
+
+
+def int_arg(args, name, minimum=0):
+    """不小于minimum的整数参数，未提供时返回None"""
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if value < minimum:
+        raise ValueError(f"{name} must be >= {minimum}")
+    return value
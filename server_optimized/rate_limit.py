@@ -0,0 +1,111 @@
+"""
+请求限流：订票、查座、搜索等路由按类别设置令牌桶，按登录用户（无有效会话时按IP）计数。
+桶状态存放在缓存后端，多worker共享；每次判断只读写一个键。超限返回429并带Retry-After。
+"""
+import math
+import os
+import time
+
+import redis
+from flask import request, jsonify
+
+import metrics
+import seat_cache
+from database.db import fetch_query
+
+RATE_LIMIT_PREFIX = "ratelimit:"
+# 设为0关闭限流
+RATE_LIMITING = os.environ.get("RATE_LIMITING", "1") == "1"
+# 各类路由的令牌桶：(桶容量, 每秒补充令牌数)
+ROUTE_LIMITS = {
+    "booking": (10, 1),
+    "seats": (30, 5),
+    "search": (60, 10),
+}
+# 路由 -> 限流类别，未列出的路由不限流
+ROUTE_CLASSES = {
+    "/book_ticket": "booking",
+    "/book_best_available": "booking",
+    "/hold_seats": "booking",
+    "/get_seats": "seats",
+    "/search_events": "search",
+    "/suggest_events": "search",
+}
+# 会话对应用户名的缓存时长（秒），避免每次判断都查询数据库
+SESSION_USER_TTL = 300
+
+
+def _session_user(session_id):
+    """会话对应的用户名，会话无效时返回None"""
+    key = f"{RATE_LIMIT_PREFIX}session:{session_id}"
+    username = seat_cache.redis_client.get(key)
+    if username is None:
+        session_info = fetch_query("SELECT username FROM Sessions WHERE session_id = ?", (session_id,))
+        if not session_info:
+            return None
+        username = session_info[0]['username']
+        seat_cache.redis_client.set(key, username, ex=SESSION_USER_TTL)
+    return username
+
+
+def client_identity():
+    """限流对象：有效会话按用户，否则按IP"""
+    session_id = request.headers.get("Session-ID")
+    username = _session_user(session_id) if session_id else None
+    if username is not None:
+        return f"user:{username}"
+    return f"ip:{request.remote_addr}"
+
+
+def take(route_class, identity, now=None):
+    """
+    从令牌桶取一个令牌，返回 (是否放行, 需等待的秒数)
+    桶以"令牌数:时间戳"保存在一个键中，读取时按流逝时间补充；并发更新冲突超过重试次数时放行
+    """
+    capacity, rate = ROUTE_LIMITS[route_class]
+    key = f"{RATE_LIMIT_PREFIX}{route_class}:{identity}"
+    # 桶补满之后键自然过期，等价于满桶
+    ttl = math.ceil(capacity / rate) + 1
+    for _ in range(seat_cache.UPDATE_RETRIES):
+        current = now or time.time()
+        pipe = seat_cache.redis_client.pipeline()
+        try:
+            pipe.watch(key)
+            value = pipe.get(key)
+            tokens = capacity
+            if value is not None:
+                stored, last = (float(part) for part in value.split(":"))
+                tokens = min(capacity, stored + max(0.0, current - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            pipe.multi()
+            pipe.set(key, f"{tokens:.4f}:{current:.4f}", ex=ttl)
+            pipe.execute()
+            return allowed, 0 if allowed else (1 - tokens) / rate
+        except redis.WatchError:
+            continue
+        finally:
+            pipe.reset()
+    metrics.inc("rate_limit.contended")
+    return True, 0
+
+
+def limit_request():
+    """before_request钩子：超限时返回429响应，否则返回None继续处理"""
+    route_class = ROUTE_CLASSES.get(request.path)
+    if not RATE_LIMITING or route_class is None or request.method == "OPTIONS":
+        return None
+    try:
+        allowed, wait = take(route_class, client_identity())
+    except redis.RedisError as e:
+        # 缓存不可用时不因限流拒绝正常请求
+        print(f"限流判断失败: {e}")
+        return None
+    if allowed:
+        return None
+    metrics.inc("rate_limit.limited")
+    metrics.inc(f"rate_limit.limited.{route_class}")
+    response = jsonify({'status': 'fail', 'message': 'Too many requests, please retry later'})
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response, 429
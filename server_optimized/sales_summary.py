@@ -0,0 +1,89 @@
+"""
+销售统计：只读取 SalesAggregates（按场次、座位类型、下单日期汇总），不扫描订单表，
+看板刷新的代价与订单量无关。汇总表由订票和取消事务同步维护。
+重建汇总表：python sales_summary.py rebuild
+"""
+import sys
+
+from database.db import connect_db, fetch_query, begin_immediate, retry_on_busy
+from database.schema import rebuild_sales_aggregates
+from query_args import date_arg, int_arg
+
+# 可选的分组维度（group_by=event,seat_type,day 的任意组合）
+GROUP_COLUMNS = {"event": "event_id", "seat_type": "seat_type", "day": "day"}
+
+
+def parse_summary_args(args):
+    """解析 /admin/sales_summary 的分组和过滤参数，参数不合法时抛出ValueError"""
+    group_by = [name for name in args.get("group_by", "event").split(",") if name]
+    for name in group_by:
+        if name not in GROUP_COLUMNS:
+            raise ValueError(f"Invalid group_by: {name}")
+    return {"group_by": list(dict.fromkeys(group_by)),
+            "event_id": int_arg(args, "event_id", minimum=1),
+            "date_from": date_arg(args, "date_from"), "date_to": date_arg(args, "date_to")}
+
+
+def summarize(group_by=("event",), event_id=None, date_from=None, date_to=None):
+    """按分组返回 (行列表, 合计)；每行含售出/取消张数、销售额/退款额及净值"""
+    conditions, params = [], []
+    if event_id is not None:
+        conditions.append("event_id = ?")
+        params.append(event_id)
+    if date_from:
+        conditions.append("day >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("day <= ?")
+        params.append(date_to)
+    columns = [GROUP_COLUMNS[name] for name in group_by]
+    sql = "SELECT " + "".join(f"{column}, " for column in columns) + """
+        SUM(tickets_sold) AS tickets_sold, SUM(tickets_cancelled) AS tickets_cancelled,
+        SUM(revenue) AS revenue, SUM(refunded) AS refunded
+        FROM SalesAggregates"""
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if columns:
+        sql += " GROUP BY " + ", ".join(columns) + " ORDER BY " + ", ".join(columns)
+
+    rows = []
+    totals = {"tickets_sold": 0, "tickets_cancelled": 0, "revenue": 0, "refunded": 0}
+    for row in fetch_query(sql, params):
+        row = dict(row)
+        if row["tickets_sold"] is None:
+            # 没有分组且没有数据时SUM为NULL
+            continue
+        for name in totals:
+            totals[name] += row[name]
+        rows.append(_with_net(row))
+    return rows, _with_net(totals)
+
+
+def _with_net(row):
+    row["net_tickets"] = row["tickets_sold"] - row["tickets_cancelled"]
+    row["net_revenue"] = row["revenue"] - row["refunded"]
+    return row
+
+
+def rebuild():
+    """清空并按订单表重新计算汇总表，返回重建后的行数"""
+    conn = connect_db()
+    try:
+        cur = conn.cursor()
+        begin_immediate(conn, "rebuild_sales_aggregates")
+        rebuild_sales_aggregates(cur)
+        count = cur.execute("SELECT COUNT(*) FROM SalesAggregates").fetchone()[0]
+        retry_on_busy("rebuild_sales_aggregates.commit", conn.commit)
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python sales_summary.py rebuild")
+        sys.exit(2)
+    print(f"SalesAggregates rebuilt: {rebuild()} rows")
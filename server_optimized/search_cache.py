@@ -0,0 +1,76 @@
+"""
+场次搜索结果缓存：按规范化后的查询条件缓存Events查询结果，进程内LRU有界。
+add_event/edit_event/delete_event 递增缓存后端中的场次版本号，所有worker的旧结果随之失效。
+依赖库存的查询（has_availability）不随场次版本失效，由调用方跳过缓存。
+"""
+import threading
+from collections import OrderedDict
+
+import metrics
+import seat_cache
+
+# 缓存的查询条数上限，超出时淘汰最久未使用的
+SEARCH_CACHE_SIZE = 512
+# 场次表版本号键
+EVENTS_VERSION_KEY = "events:version"
+
+_entries = OrderedDict()  # 格式: {query_key: (version, results, query_seconds)}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def normalize_keyword(keyword):
+    """关键字规范化：去首尾空白、小写（名称匹配本身不区分大小写）"""
+    return keyword.strip().lower()
+
+
+def events_version():
+    """当前场次表版本号"""
+    return int(seat_cache.redis_client.get(EVENTS_VERSION_KEY) or 0)
+
+
+def bump_events_version():
+    """场次表发生变化后调用，使所有缓存的搜索结果失效"""
+    return seat_cache.redis_client.incr(EVENTS_VERSION_KEY)
+
+
+def _record(hit, saved_seconds=0.0):
+    with _lock:
+        _stats["hits" if hit else "misses"] += 1
+        total = _stats["hits"] + _stats["misses"]
+        ratio = _stats["hits"] / total
+    metrics.inc("search_cache.hits" if hit else "search_cache.misses")
+    metrics.set_gauge("search_cache.hit_ratio", round(ratio, 4))
+    if hit:
+        metrics.inc("search_cache.saved_query_seconds", saved_seconds)
+
+
+def get(query_key, version):
+    """命中返回缓存的结果列表（调用方不得修改），否则返回None"""
+    with _lock:
+        entry = _entries.get(query_key)
+        if entry is not None and entry[0] == version:
+            _entries.move_to_end(query_key)
+        else:
+            entry = None
+    if entry is None:
+        _record(False)
+        return None
+    _record(True, entry[2])
+    return entry[1]
+
+
+def put(query_key, version, results, query_seconds):
+    """写入查询结果，query_seconds为本次查库耗时，命中时计入节省的时间"""
+    with _lock:
+        _entries[query_key] = (version, results, query_seconds)
+        _entries.move_to_end(query_key)
+        while len(_entries) > SEARCH_CACHE_SIZE:
+            _entries.popitem(last=False)
+        metrics.set_gauge("search_cache.entries", len(_entries))
+
+
+def clear():
+    """清空本进程的搜索缓存"""
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,199 @@
+"""
+最优座位自动分配：按场次维护进程内的空闲连续座位索引，/book_best_available 直接取最优的相邻座位块。
+每个(座位类型, 行)保存空闲连续段；每个座位类型、每个张数k各有一个有序候选列表，
+元素为可容纳k张的连续段中最优的位置，排序键 (行号, 与该行中心的距离, 起始列)。
+分配只取候选列表的头部（二分定位），订票/退票通过座位变更监听器增量更新受影响的一行。
+候选位置含他人锁定的座位时，在锁定处断开该连续段另选位置，不会整段跳过。
+其他worker的变更不经过监听器：分配的座位在事务中已被占用时丢弃索引重建，索引超过最大存活时间也会重建。
+"""
+import bisect
+import threading
+import time
+
+import metrics
+import seat_changes
+
+# 单次最多分配的座位数（与单笔订单上限一致）
+MAX_BLOCK_SEATS = 4
+# 索引最长使用时间（秒），到期后按缓存座位图重建，纳入其他worker的退票
+INDEX_MAX_AGE_SECONDS = 30
+# 分配的座位已被其他worker占用时，重建索引后重新分配的次数
+ALLOCATION_RETRIES = 3
+
+
+def _placement(start, end, center, count):
+    """连续段[start, end]中放置count个座位的最优位置（最靠近行中心），返回排序键 (距离, 起始列)"""
+    ideal = round(center - (count - 1) / 2)
+    first = min(max(ideal, start), end - count + 1)
+    return abs(first + (count - 1) / 2 - center), first
+
+
+class FreeRunIndex:
+    """单个场次的空闲连续座位索引"""
+
+    def __init__(self, event_id, seats):
+        self.event_id = event_id
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.positions = {}  # seat_id -> (type, row, col)
+        self.grid = {}  # (type, row) -> {col: seat_id}
+        self.free = {}  # (type, row) -> 空闲列集合
+        self.runs = {}  # (type, row) -> [(start, end), ...]
+        self.centers = {}  # (type, row) -> 行中心列
+        self.candidates = {}  # type -> {k: [(row, distance, first, end), ...]}
+        for seat in seats:
+            line = (seat["type"], seat["row"])
+            self.positions[seat["id"]] = (seat["type"], seat["row"], seat["col"])
+            self.grid.setdefault(line, {})[seat["col"]] = seat["id"]
+            free = self.free.setdefault(line, set())
+            if not seat["is_reserved"]:
+                free.add(seat["col"])
+        for line, cols in self.grid.items():
+            self.centers[line] = (min(cols) + max(cols)) / 2
+            self.runs[line] = []
+            self.candidates.setdefault(line[0], {k: [] for k in range(1, MAX_BLOCK_SEATS + 1)})
+            self._set_runs(line, self._compute_runs(line))
+
+    def has_type(self, seat_type):
+        return seat_type in self.candidates
+
+    def _compute_runs(self, line):
+        # 列号不连续处（如过道）视为断开
+        runs, free = [], self.free[line]
+        for col in sorted(free):
+            if runs and runs[-1][1] == col - 1:
+                runs[-1] = (runs[-1][0], col)
+            else:
+                runs.append((col, col))
+        return runs
+
+    def _candidate_keys(self, line, run):
+        row, (start, end) = line[1], run
+        for count in range(1, min(end - start + 1, MAX_BLOCK_SEATS) + 1):
+            distance, first = _placement(start, end, self.centers[line], count)
+            yield count, (row, distance, first, end)
+
+    def _set_runs(self, line, runs):
+        """替换一行的空闲连续段，同步候选列表"""
+        by_count = self.candidates[line[0]]
+        for run in self.runs[line]:
+            for count, key in self._candidate_keys(line, run):
+                keys = by_count[count]
+                del keys[bisect.bisect_left(keys, key)]
+        for run in runs:
+            for count, key in self._candidate_keys(line, run):
+                bisect.insort(by_count[count], key)
+        self.runs[line] = runs
+
+    def mark(self, seat_ids, reserved):
+        """座位售出/释放，只重算受影响的行；未知座位忽略"""
+        touched = set()
+        for seat_id in seat_ids:
+            position = self.positions.get(seat_id)
+            if position is None:
+                continue
+            line = position[:2]
+            if reserved:
+                self.free[line].discard(position[2])
+            else:
+                self.free[line].add(position[2])
+            touched.add(line)
+        for line in touched:
+            self._set_runs(line, self._compute_runs(line))
+
+    def best_block(self, seat_type, count, exclude=()):
+        """
+        最优的count个相邻空闲座位ID，没有时返回[]
+        候选位置含exclude座位（如他人锁定）时，在同一连续段中避开这些座位另选位置
+        """
+        best = None  # (排序键, 座位ID列表)
+        for row, distance, first, end in self.candidates[seat_type][count]:
+            # 段内另选的位置不优于该段的候选位置，之后的候选不可能更优
+            if best is not None and (row, distance, first) >= best[0]:
+                break
+            line = (seat_type, row)
+            cols = self.grid[line]
+            seats = [cols[col] for col in range(first, first + count)]
+            if not exclude or exclude.isdisjoint(seats):
+                return seats
+            start = next(run[0] for run in self.runs[line] if run[1] == end)
+            for key, block in self._placements_avoiding(line, start, end, count, exclude):
+                if best is None or key < best[0]:
+                    best = (key, block)
+        return best[1] if best else []
+
+    def _placements_avoiding(self, line, start, end, count, exclude):
+        """连续段[start, end]在exclude座位处断开后，每个能容纳count张的子段中的最优位置"""
+        cols = self.grid[line]
+        sub_start = start
+        for col in range(start, end + 2):
+            if col <= end and cols[col] not in exclude:
+                continue
+            if col - sub_start >= count:
+                distance, first = _placement(sub_start, col - 1, self.centers[line], count)
+                yield (line[1], distance, first), [cols[c] for c in range(first, first + count)]
+            sub_start = col + 1
+
+
+_indexes = {}  # 格式: {event_id(str): FreeRunIndex}
+_indexes_lock = threading.Lock()
+
+
+def get_index(event_id, load_seats):
+    """场次的索引，不存在或已过期时由load_seats(event_id)返回的座位图构建；场次不存在时返回None"""
+    key = str(event_id)
+    index = _indexes.get(key)
+    if index is not None and time.monotonic() - index.built_at < INDEX_MAX_AGE_SECONDS:
+        return index
+    seats = load_seats(event_id)
+    if not seats:
+        return None
+    start = time.perf_counter()
+    index = FreeRunIndex(key, seats)
+    metrics.observe("seat_allocator.build_seconds", time.perf_counter() - start)
+    with _indexes_lock:
+        _indexes[key] = index
+    return index
+
+
+def allocate(index, seat_type, count, exclude=()):
+    """取出最优的相邻座位块并在索引中预先标记为已售，避免本进程的并发请求分到同一块"""
+    with index.lock:
+        seats = index.best_block(seat_type, count, exclude)
+        if seats:
+            index.mark(seats, True)
+    metrics.inc("seat_allocator.allocated" if seats else "seat_allocator.exhausted")
+    return seats
+
+
+def release(index, seat_ids, stale=False):
+    """订票未成功：归还预先标记的座位；stale表示座位已被其他worker占用，丢弃索引以便重建"""
+    if stale:
+        forget(index.event_id)
+        metrics.inc("seat_allocator.stale")
+        return
+    with index.lock:
+        index.mark(seat_ids, False)
+
+
+def forget(event_id):
+    """丢弃场次的索引（删除场次或检测到索引过期时调用）"""
+    with _indexes_lock:
+        _indexes.pop(str(event_id), None)
+
+
+def reset():
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def _on_seat_changes(event_id, first_version, last_version, seat_updates):
+    index = _indexes.get(str(event_id))
+    if index is None:
+        return
+    with index.lock:
+        index.mark([seat_id for seat_id, is_reserved in seat_updates if is_reserved], True)
+        index.mark([seat_id for seat_id, is_reserved in seat_updates if not is_reserved], False)
+
+
+seat_changes.add_listener(_on_seat_changes)
@@ -6,20 +6,53 @@
 """
 import redis
 import json
+import math
 import subprocess
 import os
+import threading
 import time
-from datetime import timedelta
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import metrics
+from local_cache import LocalRedis
+from seat_codec import SeatLayout, decode_reservations, encode_reservations, reservation_token
 
 # Redis服务器可执行文件路径
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))  # 获取当前文件(seat_cache.py)所在目录(server_optimized)
 PARENT_DIR = os.path.dirname(CURRENT_DIR)  # 获取server_optimized的父目录
 REDIS_SERVER_PATH = os.path.join(PARENT_DIR, "redis", "redis-server.exe")  # 拼接Redis可执行文件路径
 
-# 缓存键前缀
+# 缓存后端：redis(默认) 或 memory(进程内，适用于单进程部署和测试)
+CACHE_BACKEND = os.environ.get("SEAT_CACHE_BACKEND", "redis").lower()
+
+# 缓存键前缀：座位售出位图
 SEAT_CACHE_PREFIX = "event:seats:"
-# 缓存过期时间(秒) - 防止极端情况下缓存不一致
+# 场次静态座位布局（座位ID/行/列/类型），位图按其顺序编码
+LAYOUT_PREFIX = "event:layout:"
+# 进程内缓存的已解码布局数量上限
+LAYOUT_CACHE_SIZE = 256
+# 场次可用座位摘要键前缀（搜索结果预览用，避免读取整张座位图）
+AVAILABILITY_PREFIX = "event:avail:"
+# 场次信息及各座位类型票价键前缀
+EVENT_META_PREFIX = "event:meta:"
+# 缓存过期时间(秒) - 防止极端情况下缓存不一致；作为自适应TTL的基准值
 CACHE_EXPIRE_SECONDS = 300
+# 自适应TTL上下限(秒)：已结束场次取下限，临近开演且访问频繁的场次最长可达上限
+MIN_CACHE_TTL = 60
+MAX_CACHE_TTL = 3600
+# 开演前多少天视为临近场次
+HOT_EVENT_DAYS = 7
+# 访问热度：指数衰减半衰期(秒)，以及每分钟请求数达到多少视为热点
+ACCESS_HALF_LIFE_SECONDS = 120
+HOT_REQUESTS_PER_MINUTE = 60
+# 座位图缓存的内存预算(字节)，超出时优先淘汰冷门场次
+CACHE_MEMORY_BUDGET_BYTES = int(os.environ.get("SEAT_CACHE_MEMORY_BUDGET", 256 * 1024 * 1024))
+# 乐观锁更新冲突时的重试次数，仍失败则删除缓存，由下次读取重新加载
+UPDATE_RETRIES = 3
+# 连接池：所有蓝图共享同一个客户端，连接耗尽时最多等待REDIS_POOL_TIMEOUT秒
+REDIS_MAX_CONNECTIONS = 64
+REDIS_POOL_TIMEOUT = 5
 
 
 def check_redis_connection(client):
@@ -54,7 +87,15 @@ def start_redis_server():
 
 def init_redis_client():
     """初始化Redis客户端并确保服务可用"""
-    client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True, socket_connect_timeout=5)
+    if CACHE_BACKEND == "memory":
+        print("使用进程内缓存后端")
+        return LocalRedis()
+
+    pool = redis.BlockingConnectionPool(
+        host='localhost', port=6379, db=0, decode_responses=True, socket_connect_timeout=5,
+        max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT, health_check_interval=30
+    )
+    client = redis.StrictRedis(connection_pool=pool)
 
     # 检查连接状态
     if check_redis_connection(client):
@@ -74,73 +115,467 @@ def init_redis_client():
         raise ConnectionError("无法启动Redis服务器")
 
 
+# ---------- 自适应TTL与内存预算 ----------
+# 以下统计均为本进程视角：多worker部署时各自按自己写入的缓存做预算
+_policy_lock = threading.Lock()
+_access = {}  # 格式: {event_id(str): [热度分, 上次访问时间]}
+_event_dates = {}  # 格式: {event_id(str): date}
+_sizes = {}  # 格式: {event_id(str): 座位图字节数}
+_reload_seconds = {}  # 格式: {event_id(str): 最近一次回源加载耗时}
+
+
+def _decayed(score, last, now):
+    return score * math.exp(-(now - last) * math.log(2) / ACCESS_HALF_LIFE_SECONDS)
+
+
+def record_access(event_id, now=None):
+    """记录一次场次座位图访问，用于估计请求速率"""
+    now = now or time.time()
+    key = str(event_id)
+    with _policy_lock:
+        score, last = _access.get(key, (0.0, now))
+        _access[key] = [_decayed(score, last, now) + 1, now]
+
+
+def _rate(score, last, now):
+    # 衰减计数的稳态值 = 速率 × 平均寿命(半衰期/ln2)
+    return _decayed(score, last, now) * 60 * math.log(2) / ACCESS_HALF_LIFE_SECONDS
+
+
+def requests_per_minute(event_id, now=None):
+    """按衰减计数估算的每分钟请求数"""
+    now = now or time.time()
+    with _policy_lock:
+        score, last = _access.get(str(event_id), (0.0, now))
+    return _rate(score, last, now)
+
+
+def note_event_date(event_id, event_date):
+    """登记场次日期（YYYY-MM-DD），供TTL按开演远近调整"""
+    try:
+        parsed = date.fromisoformat(str(event_date))
+    except ValueError:
+        return
+    with _policy_lock:
+        _event_dates[str(event_id)] = parsed
+
+
+def note_reload_cost(event_id, seconds):
+    """登记一次回源加载座位图的耗时"""
+    with _policy_lock:
+        _reload_seconds[str(event_id)] = seconds
+
+
+def seat_cache_ttl(event_id, now=None):
+    """
+    场次缓存TTL：已结束场次取下限；临近开演翻倍；访问频繁再放大，几乎无人访问则减半
+    缓存由订票/退票原地更新并有后台巡检兜底，热点场次可以安全地长时间缓存
+    """
+    event_date = _event_dates.get(str(event_id))
+    if event_date is not None and event_date < date.today():
+        return MIN_CACHE_TTL
+    ttl = CACHE_EXPIRE_SECONDS
+    if event_date is not None and (event_date - date.today()).days <= HOT_EVENT_DAYS:
+        ttl *= 2
+    rate = requests_per_minute(event_id, now)
+    if rate >= HOT_REQUESTS_PER_MINUTE:
+        ttl *= 4
+    elif rate < 1:
+        ttl //= 2
+    return max(MIN_CACHE_TTL, min(MAX_CACHE_TTL, int(ttl)))
+
+
+def _eviction_order(now):
+    """淘汰顺序：已结束场次优先，其次按访问热度从低到高"""
+    today = date.today()
+    with _policy_lock:
+        candidates = list(_sizes)
+        scores = {k: _decayed(*_access.get(k, (0.0, now)), now) for k in candidates}
+        past = {k for k in candidates if k in _event_dates and _event_dates[k] < today}
+    return sorted(candidates, key=lambda k: (k not in past, scores[k]))
+
+
+def _forget(event_id):
+    with _policy_lock:
+        _sizes.pop(str(event_id), None)
+
+
+def prune_policy_state(cached_ids, now=None):
+    """
+    丢弃已不在缓存中的场次的统计（TTL到期或被淘汰），返回丢弃的场次数
+    cached_ids为当前缓存了座位图的场次ID；每分钟仍有至少1次访问的场次保留热度，重新加载时沿用
+    （低于1次时TTL与没有记录相同）
+    """
+    now = now or time.time()
+    cached = {str(event_id) for event_id in cached_ids}
+    with _policy_lock:
+        gone = (set(_sizes) | set(_access) | set(_event_dates) | set(_reload_seconds)) - cached
+        for key in gone:
+            _sizes.pop(key, None)
+            _event_dates.pop(key, None)
+            _reload_seconds.pop(key, None)
+            if key in _access and _rate(*_access[key], now) < 1:
+                del _access[key]
+    return len(gone)
+
+
+def enforce_memory_budget():
+    """座位图总大小超出预算时淘汰冷门场次，返回被淘汰的场次"""
+    with _policy_lock:
+        total = sum(_sizes.values())
+    if total <= CACHE_MEMORY_BUDGET_BYTES:
+        return []
+    evicted = []
+    for event_id in _eviction_order(time.time()):
+        if total <= CACHE_MEMORY_BUDGET_BYTES:
+            break
+        total -= _sizes.get(event_id, 0)
+        clear_event_cache(event_id)
+        evicted.append(event_id)
+    metrics.inc("seat_cache.evictions", len(evicted))
+    return evicted
+
+
+def reset_policy_state():
+    """清空本进程的访问热度和容量统计（切换缓存客户端时调用）"""
+    with _policy_lock:
+        _access.clear()
+        _event_dates.clear()
+        _sizes.clear()
+        _reload_seconds.clear()
+    with _layouts_lock:
+        _layouts.clear()
+
+
+def cache_stats():
+    """缓存容量报告：键数量、每场次字节数、TTL及预计回源成本"""
+    now = time.time()
+    with _policy_lock:
+        sizes = dict(_sizes)
+        reload_seconds = dict(_reload_seconds)
+    events = []
+    for event_id, size in sizes.items():
+        ttl = seat_cache_ttl(event_id, now)
+        cost = reload_seconds.get(event_id, 0.0)
+        events.append({
+            "event_id": event_id,
+            "bytes": size,
+            "ttl": ttl,
+            "requests_per_minute": round(requests_per_minute(event_id, now), 2),
+            "reload_seconds": round(cost, 6),
+        })
+    events.sort(key=lambda e: e["bytes"], reverse=True)
+    total_bytes = sum(sizes.values())
+    return {
+        "cached_events": len(sizes),
+        # 每个场次包含布局、售出位图、余票摘要、场次信息四个键
+        "approx_keys": len(sizes) * 4,
+        "total_bytes": total_bytes,
+        "avg_bytes_per_event": total_bytes // len(sizes) if sizes else 0,
+        "memory_budget_bytes": CACHE_MEMORY_BUDGET_BYTES,
+        # 全部失效时重新加载的总耗时，以及按TTL到期的稳态回源负载(DB秒/秒)
+        "full_reload_seconds": round(sum(e["reload_seconds"] for e in events), 6),
+        "reload_load_per_second": round(sum(e["reload_seconds"] / e["ttl"] for e in events), 6),
+        "largest_events": events[:20],
+    }
+
+
+metrics.register_collector("seat_cache", cache_stats)
+
+
+# ---------- 座位图编码 ----------
+# 布局写入后不再变化，解码结果按指纹缓存在进程内，读取座位图通常只需取回并解码位图
+_layouts = OrderedDict()  # 格式: {event_id(str): SeatLayout}
+_layouts_lock = threading.Lock()
+
+
+def _remember_layout(event_id, layout):
+    key = str(event_id)
+    with _layouts_lock:
+        _layouts[key] = layout
+        _layouts.move_to_end(key)
+        while len(_layouts) > LAYOUT_CACHE_SIZE:
+            _layouts.popitem(last=False)
+
+
+def _load_layouts(tokens, client=None):
+    """
+    按位图携带的指纹获取布局（tokens为{event_id: 指纹}）：进程内命中直接使用，
+    其余一次MGET取回；布局缺失或指纹不符的场次不出现在结果中
+    """
+    layouts, missing = {}, []
+    with _layouts_lock:
+        for event_id, token in tokens.items():
+            layout = _layouts.get(str(event_id))
+            if layout is not None and layout.token == token:
+                _layouts.move_to_end(str(event_id))
+                layouts[event_id] = layout
+            else:
+                missing.append(event_id)
+    if missing:
+        values = (client or redis_client).mget([f"{LAYOUT_PREFIX}{event_id}" for event_id in missing])
+        for event_id, value in zip(missing, values):
+            if not value:
+                continue
+            layout = SeatLayout.decode(value)
+            if layout.token == tokens[event_id]:
+                _remember_layout(event_id, layout)
+                layouts[event_id] = layout
+    return layouts
+
+
+def _decode_seat_maps(values):
+    """values为{event_id: 位图或None}，解码为{event_id: 座位列表或None}"""
+    layouts = _load_layouts({event_id: reservation_token(v) for event_id, v in values.items() if v})
+    result = {}
+    for event_id, value in values.items():
+        layout = layouts.get(event_id)
+        flags = decode_reservations(value, layout) if layout is not None else None
+        result[event_id] = layout.to_seats(flags) if flags is not None else None
+    return result
+
+
 def get_seats_from_cache(event_id):
-    """从缓存获取座位状态"""
+    """从缓存获取座位状态；只有命中时记录访问，请求中不存在的场次不会留下统计"""
     cache_key = f"{SEAT_CACHE_PREFIX}{event_id}"
     cached_data = redis_client.get(cache_key)
-    return json.loads(cached_data) if cached_data else None
+    if not cached_data:
+        return None
+    record_access(event_id)
+    return _decode_seat_maps({event_id: cached_data})[event_id]
+
+
+def get_many_seats_from_cache(event_ids):
+    """批量获取多个场次的座位状态（一次MGET往返），返回{event_id: 座位列表或None}"""
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
+    values = redis_client.mget([f"{SEAT_CACHE_PREFIX}{event_id}" for event_id in event_ids])
+    return _decode_seat_maps(dict(zip(event_ids, values)))
+
+
+def seat_types_of(event_id, seat_ids):
+    """按缓存中的布局查询座位类型，返回{seat_id: type}；布局未缓存时返回None，布局中没有的座位不出现在结果中"""
+    with _layouts_lock:
+        layout = _layouts.get(str(event_id))
+    if layout is None:
+        value = redis_client.get(f"{LAYOUT_PREFIX}{event_id}")
+        if not value:
+            return None
+        layout = SeatLayout.decode(value)
+        _remember_layout(event_id, layout)
+    index = layout.index
+    return {seat_id: layout.types[index[seat_id]] for seat_id in seat_ids if seat_id in index}
+
+
+def get_availability_summaries(event_ids):
+    """批量获取多个场次的可用座位摘要（一次MGET往返），返回{event_id: 摘要或None}"""
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
+    values = redis_client.mget([f"{AVAILABILITY_PREFIX}{event_id}" for event_id in event_ids])
+    return {event_id: json.loads(v) if v else None for event_id, v in zip(event_ids, values)}
+
+
+def availability_summary(seats_data):
+    """根据座位图计算可用座位摘要"""
+    available = sum(1 for seat in seats_data if not seat["is_reserved"])
+    return {"total_seats": len(seats_data), "available_seats": available}
+
+
+def _queue_state_writes(pipe, event_id, layout, flags, expire):
+    """把售出位图及其摘要的写入命令加入pipeline"""
+    bitmap = encode_reservations(layout, flags)
+    summary = {"total_seats": len(flags), "available_seats": len(flags) - sum(flags)}
+    pipe.setex(f"{SEAT_CACHE_PREFIX}{event_id}", expire, bitmap)
+    pipe.setex(f"{AVAILABILITY_PREFIX}{event_id}", expire, json.dumps(summary))
+    with _policy_lock:
+        _sizes[str(event_id)] = len(layout.encoded) + len(bitmap)
+
+
+def _queue_seat_writes(pipe, event_id, seats_data):
+    """把座位布局、售出位图及摘要的写入命令加入pipeline"""
+    if not seats_data:
+        pipe.delete(f"{SEAT_CACHE_PREFIX}{event_id}", f"{LAYOUT_PREFIX}{event_id}", f"{AVAILABILITY_PREFIX}{event_id}")
+        _forget(event_id)
+        return
+    expire = timedelta(seconds=seat_cache_ttl(event_id))
+    layout, flags = SeatLayout.from_seats(seats_data)
+    _remember_layout(event_id, layout)
+    pipe.setex(f"{LAYOUT_PREFIX}{event_id}", expire, layout.encoded)
+    _queue_state_writes(pipe, event_id, layout, flags, expire)
 
 
 def set_seats_to_cache(event_id, seats_data):
     """将座位状态写入缓存"""
-    cache_key = f"{SEAT_CACHE_PREFIX}{event_id}"
-    redis_client.setex(
-        cache_key,
-        timedelta(seconds=CACHE_EXPIRE_SECONDS),
-        json.dumps(seats_data)
-    )
+    pipe = redis_client.pipeline(transaction=False)
+    _queue_seat_writes(pipe, event_id, seats_data)
+    pipe.execute()
+    enforce_memory_budget()
+
+
+def set_many_seats_to_cache(seats_by_event):
+    """批量写入多个场次的座位状态（一次pipeline往返），seats_by_event为{event_id: 座位列表}"""
+    if not seats_by_event:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for event_id, seats_data in seats_by_event.items():
+        _queue_seat_writes(pipe, event_id, seats_data)
+    pipe.execute()
+    enforce_memory_budget()
 
 
 def update_seat_cache(event_id, seat_id, is_reserved):
     """更新缓存中单个座位的状态"""
+    return batch_update_seat_cache(event_id, [(seat_id, is_reserved)])
+
+
+def batch_update_seat_cache(event_id, seat_updates):
+    """批量更新缓存中的座位状态（seat_updates为[(seat_id, is_reserved), ...]），只改写售出位图"""
     cache_key = f"{SEAT_CACHE_PREFIX}{event_id}"
-    # 使用Redis的事务保证原子性
-    pipe = redis_client.pipeline()
-    pipe.watch(cache_key)
+    updates = dict(seat_updates)
+    for _ in range(UPDATE_RETRIES):
+        pipe = redis_client.pipeline()
+        try:
+            pipe.watch(cache_key)
+            cached_data = pipe.get(cache_key)
+            if not cached_data:
+                return True
+            layout = _load_layouts({event_id: reservation_token(cached_data)}, pipe).get(event_id)
+            if layout is None:
+                break  # 布局已失效，位图无法解读
+            flags = decode_reservations(cached_data, layout)
+            index = layout.index
+            for seat_id, is_reserved in updates.items():
+                position = index.get(seat_id)
+                if position is not None:
+                    flags[position] = 1 if is_reserved else 0
+            # MULTI之后的写入才受WATCH保护，期间缓存被改写则重试
+            pipe.multi()
+            expire = timedelta(seconds=seat_cache_ttl(event_id))
+            pipe.expire(f"{LAYOUT_PREFIX}{event_id}", expire)
+            _queue_state_writes(pipe, event_id, layout, flags, expire)
+            pipe.execute()
+            return True
+        except redis.WatchError:
+            metrics.inc("seat_cache.update_conflicts")
+        except Exception as e:
+            print(f"更新场次{event_id}座位缓存失败: {e}")
+            break
+        finally:
+            pipe.reset()
+
+    # 无法安全更新时删除缓存，宁可多一次回源也不保留错误数据
+    metrics.inc("seat_cache.update_failures")
     try:
-        cached_data = pipe.get(cache_key)
-        if cached_data:
-            seats = json.loads(cached_data)
-            # 找到并更新目标座位
-            for seat in seats:
-                if seat["id"] == seat_id:
-                    seat["is_reserved"] = is_reserved
-                    break
-            pipe.setex(cache_key, timedelta(seconds=CACHE_EXPIRE_SECONDS), json.dumps(seats))
-        pipe.execute()
-    except Exception:
-        pipe.reset()
-    finally:
-        pipe.reset()
+        clear_event_cache(event_id)
+    except Exception as e:
+        print(f"清除场次{event_id}缓存失败: {e}")
+    return False
 
 
-def batch_update_seat_cache(event_id, seat_updates):
-    """批量更新缓存中的座位状态（seat_updates为[(seat_id, is_reserved), ...]）"""
+def seat_checksum(seats_data):
+    """座位图校验值(座位数, 已售数, 已售ID和, 已售ID平方和)，与数据库聚合结果直接比较"""
+    total = reserved = id_sum = id_square_sum = 0
+    for seat in seats_data:
+        total += 1
+        if seat["is_reserved"]:
+            reserved += 1
+            id_sum += seat["id"]
+            id_square_sum += seat["id"] * seat["id"]
+    return total, reserved, id_sum, id_square_sum
+
+
+def cached_event_ids():
+    """当前缓存了座位图的场次ID"""
+    return [key[len(SEAT_CACHE_PREFIX):] for key in redis_client.scan_iter(match=f"{SEAT_CACHE_PREFIX}*", count=500)]
+
+
+def repair_seat_cache(event_id, load_seats):
+    """
+    用数据库座位图修复缓存：WATCH缓存后再读库，期间有订票/退票改写缓存则放弃本次修复
+    返回不一致的座位数；缓存已失效或发生并发修改时返回None
+    """
     cache_key = f"{SEAT_CACHE_PREFIX}{event_id}"
     pipe = redis_client.pipeline()
-    pipe.watch(cache_key)
     try:
+        pipe.watch(cache_key)
         cached_data = pipe.get(cache_key)
-        if cached_data:
-            seats = json.loads(cached_data)
-            # 批量更新座位状态
-            for seat_id, is_reserved in seat_updates:
-                for seat in seats:
-                    if seat["id"] == seat_id:
-                        seat["is_reserved"] = is_reserved
-                        break
-            pipe.setex(cache_key, timedelta(seconds=CACHE_EXPIRE_SECONDS), json.dumps(seats))
-        pipe.execute()
-    except Exception:
-        pipe.reset()
+        if not cached_data:
+            return None
+        layout = _load_layouts({event_id: reservation_token(cached_data)}, pipe).get(event_id)
+        flags = decode_reservations(cached_data, layout) if layout is not None else None
+        cached = {seat["id"]: seat["is_reserved"] for seat in layout.to_seats(flags)} if flags is not None else {}
+        db_seats = load_seats(event_id)
+        expected = {seat["id"]: seat["is_reserved"] for seat in db_seats}
+        drifted = sum(1 for seat_id in cached.keys() | expected.keys() if cached.get(seat_id) != expected.get(seat_id))
+        if drifted:
+            pipe.multi()
+            _queue_seat_writes(pipe, event_id, db_seats)
+            pipe.execute()
+        return drifted
+    except redis.WatchError:
+        return None
     finally:
         pipe.reset()
 
 
+def get_event_meta_from_cache(event_id):
+    """从缓存获取场次信息和票价"""
+    cached_data = redis_client.get(f"{EVENT_META_PREFIX}{event_id}")
+    return json.loads(cached_data) if cached_data else None
+
+
+def set_event_meta_to_cache(event_id, meta):
+    """将场次信息和票价写入缓存（meta为{"event": {...}, "seat_types": [{"type", "price"}, ...]}）"""
+    note_event_date(event_id, meta["event"]["event_date"])
+    redis_client.setex(f"{EVENT_META_PREFIX}{event_id}", timedelta(seconds=seat_cache_ttl(event_id)), json.dumps(meta))
+
+
+def patch_event_meta(event_id, event_fields=None, prices=None):
+    """
+    原地更新缓存中的场次信息（event_fields）和票价（prices为{type: price}），座位图保持不变
+    未缓存时无需处理；并发冲突重试仍失败时删除该键并返回False
+    """
+    cache_key = f"{EVENT_META_PREFIX}{event_id}"
+    for _ in range(UPDATE_RETRIES):
+        pipe = redis_client.pipeline()
+        try:
+            pipe.watch(cache_key)
+            cached_data = pipe.get(cache_key)
+            if not cached_data:
+                return True
+            meta = json.loads(cached_data)
+            meta["event"].update(event_fields or {})
+            for seat_type in meta["seat_types"]:
+                if seat_type["type"] in (prices or {}):
+                    seat_type["price"] = prices[seat_type["type"]]
+            pipe.multi()
+            note_event_date(event_id, meta["event"]["event_date"])
+            pipe.setex(cache_key, timedelta(seconds=seat_cache_ttl(event_id)), json.dumps(meta))
+            pipe.execute()
+            return True
+        except redis.WatchError:
+            metrics.inc("seat_cache.update_conflicts")
+        except Exception as e:
+            print(f"更新场次{event_id}信息缓存失败: {e}")
+            break
+        finally:
+            pipe.reset()
+    metrics.inc("seat_cache.update_failures")
+    redis_client.delete(cache_key)
+    return False
+
+
 def clear_event_cache(event_id):
     """清除指定场次的缓存"""
     cache_key = f"{SEAT_CACHE_PREFIX}{event_id}"
-    redis_client.delete(cache_key)
+    redis_client.delete(
+        cache_key, f"{LAYOUT_PREFIX}{event_id}", f"{AVAILABILITY_PREFIX}{event_id}", f"{EVENT_META_PREFIX}{event_id}"
+    )
+    _forget(event_id)
+    with _layouts_lock:
+        _layouts.pop(str(event_id), None)
 
 
 # 初始化Redis客户端
@@ -0,0 +1,106 @@
+"""
+场次座位变更日志：每个场次一个有界环形缓冲区，记录订票/退票引起的座位状态变化。
+版本号在场次内单调递增，/get_seats?since=<version> 据此只返回增量。
+"""
+import threading
+import time
+from collections import deque
+
+# 每个场次保留的变更条数，客户端落后超过该范围时返回全量快照
+CHANGE_LOG_SIZE = 2000
+
+_logs = {}  # 格式: {event_id(str): SeatChangeLog}
+_logs_lock = threading.Lock()
+# 没有变更日志的场次共用的版本号；丢弃日志时前移，持有旧版本的客户端随之取全量快照
+_base_version = int(time.time() * 1000)
+# 变更监听器: fn(event_id, first_version, last_version, seat_updates)
+_listeners = []
+
+
+class SeatChangeLog:
+    """单个场次的座位变更环形缓冲区"""
+
+    def __init__(self, event_id=None, maxlen=CHANGE_LOG_SIZE, version=None):
+        self.event_id = event_id
+        # 以毫秒时间戳作为起始版本，进程重启后版本号仍大于旧客户端持有的版本
+        self.version = int(time.time() * 1000) if version is None else version
+        self.floor = self.version  # 不大于floor的版本已不可用
+        self.maxlen = maxlen
+        self.entries = deque()  # (version, seat_id, is_reserved)
+        self.lock = threading.Lock()
+
+    def append(self, seat_updates):
+        with self.lock:
+            first_version = self.version + 1
+            for seat_id, is_reserved in seat_updates:
+                self.version += 1
+                self.entries.append((self.version, seat_id, int(is_reserved)))
+                if len(self.entries) > self.maxlen:
+                    self.floor = self.entries.popleft()[0]
+            # 持锁通知，保证监听器按版本顺序收到变更
+            for listener in _listeners:
+                listener(self.event_id, first_version, self.version, seat_updates)
+            return self.version
+
+    def since(self, version):
+        """返回(当前版本, 变更列表)；版本已被淘汰或来自未知时间线时返回None"""
+        with self.lock:
+            if version < self.floor or version > self.version:
+                return None
+            latest = {}
+            for entry_version, seat_id, is_reserved in reversed(self.entries):
+                if entry_version <= version:
+                    break
+                latest.setdefault(seat_id, is_reserved)
+            changes = [{"id": seat_id, "is_reserved": is_reserved} for seat_id, is_reserved in latest.items()]
+            return self.version, changes
+
+
+def _get_log(event_id, create=False):
+    """场次的变更日志；只有记录变更时才创建，读取不会为任意event_id建立日志"""
+    key = str(event_id)
+    log = _logs.get(key)
+    if log is None and create:
+        with _logs_lock:
+            log = _logs.get(key)
+            if log is None:
+                # 从共用版本号开始，之前读到共用版本号的客户端可以取到完整增量
+                log = SeatChangeLog(key, version=_base_version)
+                _logs[key] = log
+    return log
+
+
+def add_listener(listener):
+    """注册座位变更监听器（如SSE推送通道）"""
+    _listeners.append(listener)
+
+
+def record_seat_changes(event_id, seat_updates):
+    """追加座位状态变更（seat_updates为[(seat_id, is_reserved), ...]），返回最新版本"""
+    if not seat_updates:
+        return get_version(event_id)
+    return _get_log(event_id, create=True).append(seat_updates)
+
+
+def get_version(event_id):
+    """获取场次当前的变更版本；尚无变更的场次返回共用版本号"""
+    log = _get_log(event_id)
+    return log.version if log is not None else _base_version
+
+
+def get_changes_since(event_id, version):
+    """获取指定版本之后的座位变更，无法提供增量时返回None"""
+    log = _get_log(event_id)
+    if log is not None:
+        return log.since(version)
+    # 没有日志：持有共用版本号的客户端没有错过任何变更
+    return (version, []) if version == _base_version else None
+
+
+def reset_event_log(event_id):
+    """丢弃场次的变更日志（删除场次或整体失效缓存时调用）"""
+    global _base_version
+    with _logs_lock:
+        log = _logs.pop(str(event_id), None)
+        # 共用版本号前移并超过被丢弃日志的版本，持有该场次旧版本的客户端改取全量快照
+        _base_version = max(int(time.time() * 1000), _base_version + 1, log.version + 1 if log else 0)
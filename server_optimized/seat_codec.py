@@ -0,0 +1,113 @@
+"""
+座位图紧凑编码：静态布局（座位ID/行/列/类型）与售出状态分开存储。
+布局在加载时写入一次；售出状态是按布局顺序打包的位图，订票/退票只改写位图。
+缓存客户端使用decode_responses=True，二进制内容统一经base64编码为字符串。
+"""
+import base64
+import json
+import zlib
+from itertools import chain
+
+# 超过该字节数才尝试压缩（小位图压缩后反而更大）
+COMPRESS_MIN_BYTES = 256
+
+# 每个字节值对应的8个比特（低位在前），解码位图时整体查表
+_BITS = [tuple((value >> k) & 1 for k in range(8)) for value in range(256)]
+
+
+def _pack(raw):
+    """bytes -> 字符串：b前缀为原始数据，z前缀为zlib压缩数据"""
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return "z" + base64.b64encode(compressed).decode("ascii")
+    return "b" + base64.b64encode(raw).decode("ascii")
+
+
+def _unpack(text):
+    raw = base64.b64decode(text[1:])
+    return zlib.decompress(raw) if text[0] == "z" else raw
+
+
+def pack_flags(flags):
+    """0/1列表打包为位图"""
+    bits = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+
+def unpack_flags(bits, count):
+    """位图还原为长度为count的0/1列表"""
+    return list(chain.from_iterable(_BITS[b] for b in bits))[:count]
+
+
+class SeatLayout:
+    """场次的静态座位布局，按列存储"""
+
+    __slots__ = ("event_id", "ids", "rows", "cols", "types", "token", "encoded", "_index")
+
+    def __init__(self, event_id, ids, rows, cols, types, encoded=None):
+        self.event_id = event_id
+        self.ids = ids
+        self.rows = rows
+        self.cols = cols
+        self.types = types
+        self.encoded = encoded or _pack(json.dumps([event_id, ids, rows, cols, types], separators=(",", ":")).encode())
+        # 布局指纹：位图中携带，座位集合变化后旧位图自动失配
+        self.token = f"{zlib.crc32(self.encoded.encode()):08x}"
+        self._index = None
+
+    @classmethod
+    def from_seats(cls, seats):
+        """由数据库座位行（dict列表）构造布局，同时返回按布局顺序的售出状态"""
+        layout = cls(
+            seats[0]["event_id"],
+            [s["id"] for s in seats],
+            [s["row"] for s in seats],
+            [s["col"] for s in seats],
+            [s["type"] for s in seats],
+        )
+        return layout, [1 if s["is_reserved"] else 0 for s in seats]
+
+    @classmethod
+    def decode(cls, text):
+        event_id, ids, rows, cols, types = json.loads(_unpack(text))
+        return cls(event_id, ids, rows, cols, types, encoded=text)
+
+    @property
+    def index(self):
+        """座位ID -> 布局位置"""
+        if self._index is None:
+            self._index = {seat_id: i for i, seat_id in enumerate(self.ids)}
+        return self._index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_seats(self, flags):
+        """还原为与 SELECT * FROM Seats 相同结构的dict列表"""
+        event_id = self.event_id
+        return [
+            {"id": i, "event_id": event_id, "row": r, "col": c, "type": t, "is_reserved": f}
+            for i, r, c, t, f in zip(self.ids, self.rows, self.cols, self.types, flags)
+        ]
+
+
+def encode_reservations(layout, flags):
+    """售出状态编码为 "<布局指纹>:<位图>" """
+    return f"{layout.token}:{_pack(pack_flags(flags))}"
+
+
+def reservation_token(text):
+    """取出售出状态所对应的布局指纹"""
+    return text.split(":", 1)[0]
+
+
+def decode_reservations(text, layout):
+    """解码售出状态，布局指纹不符时返回None"""
+    token, packed = text.split(":", 1)
+    if token != layout.token:
+        return None
+    return unpack_flags(_unpack(packed), len(layout))
@@ -0,0 +1,160 @@
+"""
+选座临时锁定：用户选中座位时先锁定HOLD_TTL_SECONDS秒，其他用户看到的座位为不可选，
+订票时凭hold_id把锁定转为订单，避免多人抢同一座位时大量失败的数据库事务。
+每个座位一个带TTL的键（SET NX）负责互斥，到期由缓存后端的键过期机制自动释放；
+场次的锁定座位另有一个按到期时间排序的有序集合，读取时按分数过滤，写入时顺带删除过期成员，无需定期扫描。
+"""
+import json
+import os
+import secrets
+import time
+
+import redis
+
+import metrics
+import seat_cache
+
+HOLD_PREFIX = "hold:"
+# 锁定时长（秒）
+HOLD_TTL_SECONDS = int(os.environ.get("SEAT_HOLD_TTL", 120))
+# 单次最多锁定的座位数（与单笔订单上限一致）
+MAX_HOLD_SEATS = 4
+
+
+def _seat_key(event_id, seat_id):
+    return f"{HOLD_PREFIX}seat:{event_id}:{seat_id}"
+
+
+def _hold_key(hold_id):
+    return f"{HOLD_PREFIX}id:{hold_id}"
+
+
+def _index_key(event_id):
+    return f"{HOLD_PREFIX}event:{event_id}"
+
+
+def _user_key(event_id, username):
+    return f"{HOLD_PREFIX}user:{event_id}:{username}"
+
+
+def held_seat_ids(event_id, now=None):
+    """场次当前被锁定的座位ID集合"""
+    now = now or time.time()
+    return {int(seat_id) for seat_id in seat_cache.redis_client.zrangebyscore(_index_key(event_id), f"({now}", "+inf")}
+
+
+def conflicting_seats(event_id, seat_ids, hold_id=None):
+    """seat_ids中被其他锁定（不是hold_id）占用的座位"""
+    if not seat_ids:
+        return []
+    owners = seat_cache.redis_client.mget([_seat_key(event_id, seat_id) for seat_id in seat_ids])
+    return [seat_id for seat_id, owner in zip(seat_ids, owners) if owner and owner != hold_id]
+
+
+def user_hold_id(event_id, username):
+    """用户在该场次当前的锁定ID"""
+    return seat_cache.redis_client.get(_user_key(event_id, username))
+
+
+def get_hold(hold_id):
+    """锁定记录 {hold_id, event_id, seat_ids, username, expires_at}，已过期或不存在时返回None"""
+    if not hold_id:
+        return None
+    value = seat_cache.redis_client.get(_hold_key(hold_id))
+    return json.loads(value) if value else None
+
+
+def _take_over(event_id, seat_ids, hold_id, previous):
+    """
+    把用户上一次锁定（previous）中的座位转给新锁定；键已过期的座位直接占用
+    返回仍被他人锁定的座位；有冲突时不改动任何座位
+    """
+    seat_keys = [_seat_key(event_id, seat_id) for seat_id in seat_ids]
+    for _ in range(seat_cache.UPDATE_RETRIES):
+        pipe = seat_cache.redis_client.pipeline()
+        try:
+            pipe.watch(*seat_keys)
+            owners = pipe.mget(seat_keys)
+            conflicts = [seat_id for seat_id, owner in zip(seat_ids, owners) if owner and owner != previous]
+            if conflicts:
+                return conflicts
+            pipe.multi()
+            for key in seat_keys:
+                pipe.set(key, hold_id, ex=HOLD_TTL_SECONDS)
+            pipe.execute()
+            return []
+        except redis.WatchError:
+            continue
+        finally:
+            pipe.reset()
+    return list(seat_ids)
+
+
+def create_hold(event_id, seat_ids, username):
+    """
+    锁定座位，返回 (锁定记录, 冲突座位列表)；任一座位已被他人锁定时整体失败、不锁定任何座位
+    同一用户在同一场次只保留最新的一次锁定：用户已锁定的座位直接转入新锁定，
+    新锁定成功后才释放上一次锁定，失败时上一次锁定保持不变
+    """
+    client = seat_cache.redis_client
+    previous = user_hold_id(event_id, username)
+
+    hold_id = secrets.token_urlsafe(12)
+    now = time.time()
+    expires_at = now + HOLD_TTL_SECONDS
+    pipe = client.pipeline(transaction=False)
+    for seat_id in seat_ids:
+        pipe.set(_seat_key(event_id, seat_id), hold_id, nx=True, ex=HOLD_TTL_SECONDS)
+    acquired = pipe.execute()
+    taken = [seat_id for seat_id, ok in zip(seat_ids, acquired) if not ok]
+    conflicts = _take_over(event_id, taken, hold_id, previous) if taken else []
+    if conflicts:
+        client.delete(*[_seat_key(event_id, seat_id) for seat_id, ok in zip(seat_ids, acquired) if ok])
+        metrics.inc("seat_holds.conflicts")
+        return None, conflicts
+
+    hold = {"hold_id": hold_id, "event_id": str(event_id), "seat_ids": list(seat_ids),
+            "username": username, "expires_at": expires_at}
+    pipe = client.pipeline(transaction=False)
+    pipe.setex(_hold_key(hold_id), HOLD_TTL_SECONDS, json.dumps(hold))
+    pipe.setex(_user_key(event_id, username), HOLD_TTL_SECONDS, hold_id)
+    pipe.zadd(_index_key(event_id), {str(seat_id): expires_at for seat_id in seat_ids})
+    # 顺带清理已过期的成员；整个集合在最后一个锁定到期后随之过期
+    pipe.zremrangebyscore(_index_key(event_id), "-inf", now)
+    pipe.expire(_index_key(event_id), HOLD_TTL_SECONDS)
+    pipe.execute()
+    if previous:
+        # 只删除仍属于上一次锁定的座位键，已转入新锁定的座位保留
+        release_hold(previous, username)
+    metrics.inc("seat_holds.created")
+    return hold, []
+
+
+def release_hold(hold_id, username=None):
+    """释放锁定（订票成功或用户取消），只删除仍属于该锁定的座位键；返回是否释放"""
+    hold = get_hold(hold_id)
+    if hold is None or (username is not None and hold["username"] != username):
+        return False
+    event_id, seat_ids = hold["event_id"], hold["seat_ids"]
+    seat_keys = [_seat_key(event_id, seat_id) for seat_id in seat_ids]
+    for _ in range(seat_cache.UPDATE_RETRIES):
+        pipe = seat_cache.redis_client.pipeline()
+        try:
+            pipe.watch(*seat_keys)
+            owners = pipe.mget(seat_keys)
+            owned = [seat_id for seat_id, owner in zip(seat_ids, owners) if owner == hold_id]
+            pipe.multi()
+            if owned:
+                pipe.delete(*[_seat_key(event_id, seat_id) for seat_id in owned])
+                pipe.zrem(_index_key(event_id), *[str(seat_id) for seat_id in owned])
+            pipe.delete(_hold_key(hold_id))
+            pipe.execute()
+            break
+        except redis.WatchError:
+            continue
+        finally:
+            pipe.reset()
+    if seat_cache.redis_client.get(_user_key(event_id, hold["username"])) == hold_id:
+        seat_cache.redis_client.delete(_user_key(event_id, hold["username"]))
+    metrics.inc("seat_holds.released")
+    return True
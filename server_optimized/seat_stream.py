@@ -0,0 +1,151 @@
+"""
+座位状态SSE推送：每个场次一个共享通道，订阅变更日志一次，
+变更帧只编码一次后分发给该场次的所有连接，避免每个观众各自轮询缓存。
+"""
+import json
+import threading
+from collections import deque
+
+import metrics
+import seat_changes
+
+# 心跳间隔（秒），防止代理断开空闲连接
+STREAM_HEARTBEAT_SECONDS = 15
+# 每个通道缓存的变更帧数量，慢连接落后更多时要求客户端重连
+FRAME_BUFFER_SIZE = 500
+
+_channels = {}  # 格式: {event_id(str): EventChannel}
+_channels_lock = threading.Lock()
+
+
+def format_frame(event, version, payload):
+    """编码一条SSE消息，id为变更版本，断线重连时浏览器通过Last-Event-ID带回"""
+    return f"id: {version}\nevent: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+def compact_seats(seats):
+    """座位图压缩为[id, row, col, type, is_reserved]数组，省去重复的字段名"""
+    return [[s["id"], s["row"], s["col"], s["type"], s["is_reserved"]] for s in seats]
+
+
+class EventChannel:
+    """单个场次的推送通道"""
+
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.cond = threading.Condition()
+        self.frames = deque(maxlen=FRAME_BUFFER_SIZE)  # (first_version, last_version, frame)
+        self.subscribers = 0
+        self.snapshot = None  # (version, frame)
+
+    def publish(self, first_version, last_version, seat_updates):
+        payload = {"version": last_version, "changes": [[seat_id, int(r)] for seat_id, r in seat_updates]}
+        frame = format_frame("delta", last_version, payload)
+        with self.cond:
+            self.frames.append((first_version, last_version, frame))
+            self.cond.notify_all()
+
+    def snapshot_frame(self, version, seats):
+        """同一版本的快照只编码一次"""
+        cached = self.snapshot
+        if cached and cached[0] == version:
+            return cached[1]
+        frame = format_frame("snapshot", version, {"version": version, "seats": compact_seats(seats)})
+        self.snapshot = (version, frame)
+        return frame
+
+    def wait_frames(self, version, timeout):
+        """
+        等待版本之后的变更帧，返回(帧列表, 是否需要重新同步)
+        缓冲区已淘汰所需的帧时需要重新同步
+        """
+        with self.cond:
+            if not self.frames or self.frames[-1][1] <= version:
+                self.cond.wait(timeout)
+            pending = [f for f in self.frames if f[1] > version]
+        if pending and pending[0][0] > version + 1:
+            return [], True
+        return pending, False
+
+
+def _on_seat_changes(event_id, first_version, last_version, seat_updates):
+    channel = _channels.get(event_id)
+    if channel is not None:
+        channel.publish(first_version, last_version, seat_updates)
+
+
+seat_changes.add_listener(_on_seat_changes)
+
+
+def subscribe(event_id):
+    """加入场次通道（没有则创建）"""
+    key = str(event_id)
+    with _channels_lock:
+        channel = _channels.get(key)
+        if channel is None:
+            channel = _channels[key] = EventChannel(key)
+        channel.subscribers += 1
+    metrics.add_gauge("seat_stream.subscribers", 1)
+    metrics.set_gauge("seat_stream.channels", len(_channels))
+    return channel
+
+
+def unsubscribe(channel):
+    """离开通道，最后一个连接断开时释放通道"""
+    with _channels_lock:
+        channel.subscribers -= 1
+        if channel.subscribers <= 0 and _channels.get(channel.event_id) is channel:
+            del _channels[channel.event_id]
+    metrics.add_gauge("seat_stream.subscribers", -1)
+    metrics.set_gauge("seat_stream.channels", len(_channels))
+
+
+def cached_snapshot(event_id, version):
+    """已有连接的通道若持有同版本快照，新连接直接复用，不再读取缓存"""
+    channel = _channels.get(str(event_id))
+    if channel is not None and channel.snapshot and channel.snapshot[0] == version:
+        return channel.snapshot[1]
+    return None
+
+
+def stream(event_id, version, seats=None, snapshot=None, heartbeat=None):
+    """
+    SSE生成器：先发送快照（或重连时的增量），之后推送通道中的变更帧
+    seats为None且snapshot为None时表示客户端已持有version版本的座位图
+    """
+    heartbeat = heartbeat or STREAM_HEARTBEAT_SECONDS
+    channel = subscribe(event_id)
+    try:
+        if snapshot is not None:
+            yield snapshot
+            metrics.mark("seat_stream.events_delivered")
+        elif seats is not None:
+            yield channel.snapshot_frame(version, seats)
+            metrics.mark("seat_stream.events_delivered")
+
+        # 补发读取快照到订阅通道之间提交的变更
+        caught_up = seat_changes.get_changes_since(event_id, version)
+        if caught_up is None:
+            yield format_frame("resync", version, {"version": version})
+            return
+        if caught_up[1]:
+            version = caught_up[0]
+            changes = [[c["id"], c["is_reserved"]] for c in caught_up[1]]
+            yield format_frame("delta", version, {"version": version, "changes": changes})
+            metrics.mark("seat_stream.events_delivered")
+
+        while True:
+            frames, resync = channel.wait_frames(version, heartbeat)
+            if resync:
+                # 连接过慢，通知客户端带Last-Event-ID重连
+                yield format_frame("resync", version, {"version": version})
+                return
+            if not frames:
+                yield ": keep-alive\n\n"
+                continue
+            for _, last_version, frame in frames:
+                yield frame
+                version = last_version
+            metrics.mark("seat_stream.events_delivered", len(frames))
+    finally:
+        unsubscribe(channel)
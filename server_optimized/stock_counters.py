@@ -0,0 +1,178 @@
+"""
+余票计数器：每个场次、每种座位类型的剩余票数镜像在缓存中，订票事务开始前原子扣减。
+剩余不足的类型直接拒绝，不再打开数据库连接、抢写锁；检查与扣减在同一个WATCH/MULTI事务中，
+计数器不会被并发的超量请求暂时扣成负数而误判其他请求售罄。事务未成功时加回。
+场次所有类型都售罄时写入售罄标记，/get_seats 和搜索结果据此直接标注售罄。
+计数器只用于快速失败，是否能订仍以数据库事务为准；巡检线程定期按 SeatTypes.stock 校正。
+"""
+import json
+
+import redis
+
+import metrics
+import seat_cache
+
+STOCK_PREFIX = "event:stock:"
+# 场次有计数器的座位类型列表（JSON）
+STOCK_TYPES_PREFIX = "event:stock_types:"
+SOLD_OUT_PREFIX = "event:soldout:"
+# 计数器有效期（秒），写入和校正时续期；过期后由下一次订票或校正重新建立
+COUNTER_TTL = 24 * 3600
+# claim的WATCH冲突重试次数，用尽后交给数据库事务判断
+CLAIM_RETRIES = 5
+
+
+def _key(event_id, seat_type):
+    return f"{STOCK_PREFIX}{event_id}:{seat_type}"
+
+
+def _types(event_id, client=None):
+    value = (client or seat_cache.redis_client).get(f"{STOCK_TYPES_PREFIX}{event_id}")
+    return json.loads(value) if value else None
+
+
+def _queue_counter_writes(pipe, event_id, stocks, nx=False):
+    pipe.set(f"{STOCK_TYPES_PREFIX}{event_id}", json.dumps(sorted(stocks)), ex=COUNTER_TTL)
+    for seat_type, stock in stocks.items():
+        pipe.set(_key(event_id, seat_type), stock, ex=COUNTER_TTL, nx=nx)
+
+
+def seed(event_id, stocks):
+    """按数据库剩余票数（stocks为{type: stock}）建立缺失的计数器，已有的计数器不覆盖"""
+    pipe = seat_cache.redis_client.pipeline(transaction=False)
+    _queue_counter_writes(pipe, event_id, stocks, nx=True)
+    pipe.execute()
+    refresh_sold_out(event_id)
+
+
+def remaining(event_id):
+    """场次各类型的剩余票数{type: 剩余}，没有计数器时返回None"""
+    types = _types(event_id)
+    if types is None:
+        return None
+    values = seat_cache.redis_client.mget([_key(event_id, seat_type) for seat_type in types])
+    if any(value is None for value in values):
+        return None
+    return {seat_type: int(value) for seat_type, value in zip(types, values)}
+
+
+def refresh_sold_out(event_id):
+    """按计数器重新判断场次是否售罄并更新售罄标记"""
+    stocks = remaining(event_id)
+    if stocks and all(stock <= 0 for stock in stocks.values()):
+        seat_cache.redis_client.set(f"{SOLD_OUT_PREFIX}{event_id}", 1, ex=COUNTER_TTL)
+    else:
+        seat_cache.redis_client.delete(f"{SOLD_OUT_PREFIX}{event_id}")
+
+
+def is_sold_out(event_id):
+    return bool(seat_cache.redis_client.get(f"{SOLD_OUT_PREFIX}{event_id}"))
+
+
+def sold_out_events(event_ids):
+    """批量查询售罄标记（一次MGET），返回{event_id: 是否售罄}"""
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
+    values = seat_cache.redis_client.mget([f"{SOLD_OUT_PREFIX}{event_id}" for event_id in event_ids])
+    return {event_id: bool(value) for event_id, value in zip(event_ids, values)}
+
+
+def claim(event_id, needs):
+    """
+    订票前扣减计数器（needs为{type: 张数}），成功返回[]；有类型剩余不足时不扣减，返回这些类型
+    计数器缺失或并发冲突重试用尽时返回None，交给数据库事务判断
+    """
+    keys = [_key(event_id, seat_type) for seat_type in needs]
+    for _ in range(CLAIM_RETRIES):
+        pipe = seat_cache.redis_client.pipeline()
+        try:
+            pipe.watch(*keys)
+            values = pipe.mget(keys)
+            if any(value is None for value in values):
+                return None
+            sold_out = [seat_type for (seat_type, count), value in zip(needs.items(), values) if int(value) < count]
+            if sold_out:
+                metrics.inc("stock_counters.fast_fails")
+                return sold_out
+            # MULTI之后的扣减受WATCH保护，期间计数器被改写则重新检查
+            pipe.multi()
+            for key, count in zip(keys, needs.values()):
+                pipe.decrby(key, count)
+            left = pipe.execute()
+        except redis.WatchError:
+            metrics.inc("stock_counters.claim_conflicts")
+            continue
+        finally:
+            pipe.reset()
+        if any(value == 0 for value in left):
+            refresh_sold_out(event_id)
+        return []
+    return None
+
+
+def consume(event_id, sold):
+    """不经过claim写入的订单（如批量订票）提交后扣减计数器；计数器缺失时不处理"""
+    client = seat_cache.redis_client
+    keys = [_key(event_id, seat_type) for seat_type in sold]
+    existing = client.mget(keys)
+    pipe = client.pipeline(transaction=False)
+    for key, count, value in zip(keys, sold.values(), existing):
+        if value is not None:
+            pipe.decrby(key, count)
+    left = pipe.execute()
+    if any(value <= 0 for value in left):
+        refresh_sold_out(event_id)
+
+
+def restore(event_id, needs):
+    """加回票数（订票事务未成功、订单取消）；计数器缺失时不处理，等待重新建立"""
+    client = seat_cache.redis_client
+    keys = [_key(event_id, seat_type) for seat_type in needs]
+    existing = client.mget(keys)
+    pipe = client.pipeline(transaction=False)
+    for key, count, value in zip(keys, needs.values(), existing):
+        if value is not None:
+            pipe.incrby(key, count)
+    left = pipe.execute()
+    # 从售罄恢复为有票时清除售罄标记
+    if any(value > 0 for value in left) and is_sold_out(event_id):
+        refresh_sold_out(event_id)
+
+
+def reconcile(event_id, stocks):
+    """
+    用数据库剩余票数校正计数器，返回偏差的票数之和；stocks为None表示场次已删除
+    WATCH期间有订票扣减计数器时放弃本次校正（返回None），下一轮再校正
+    """
+    if stocks is None:
+        clear(event_id)
+        return None
+    pipe = seat_cache.redis_client.pipeline()
+    keys = [_key(event_id, seat_type) for seat_type in stocks]
+    try:
+        pipe.watch(*keys)
+        current = pipe.mget(keys)
+        drift = sum(abs(int(value) - stock) for value, stock in zip(current, stocks.values()) if value is not None)
+        pipe.multi()
+        _queue_counter_writes(pipe, event_id, stocks)
+        pipe.execute()
+    except redis.WatchError:
+        return None
+    finally:
+        pipe.reset()
+    refresh_sold_out(event_id)
+    return drift
+
+
+def counted_event_ids():
+    """当前建有计数器的场次ID"""
+    prefix = STOCK_TYPES_PREFIX
+    return [key[len(prefix):] for key in seat_cache.redis_client.scan_iter(match=f"{prefix}*", count=500)]
+
+
+def clear(event_id):
+    """删除场次的计数器和售罄标记（删除场次时调用）"""
+    types = _types(event_id) or []
+    seat_cache.redis_client.delete(f"{STOCK_TYPES_PREFIX}{event_id}", f"{SOLD_OUT_PREFIX}{event_id}",
+                                   *[_key(event_id, seat_type) for seat_type in types])
@@ -0,0 +1,128 @@
+import pytest
+import os
+import tempfile
+import shutil
+import sys
+
+# 测试使用进程内缓存后端，无需启动Redis服务
+os.environ.setdefault("SEAT_CACHE_BACKEND", "memory")
+# 后台任务在测试中按需手动触发
+os.environ.setdefault("BACKGROUND_JOBS", "0")
+
+# 添加父目录到 Python 路径，以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import connect_db, execute_query, fetch_query
+from app import app
+from local_cache import LocalRedis
+import seat_cache
+import search_cache
+import event_suggest
+import seat_allocator
+
+
+@pytest.fixture
+def test_db():
+    """创建测试数据库"""
+    original_db_path = os.path.join(os.path.dirname(__file__), '..', 'database', 'concert.db')
+
+    # 复制原始数据库到临时位置
+    temp_dir = tempfile.mkdtemp()
+    test_db_path = os.path.join(temp_dir, 'test_concert.db')
+    shutil.copy2(original_db_path, test_db_path)
+
+    import database.db
+    original_path = database.db.DB_PATH
+    database.db.DB_PATH = test_db_path
+
+    yield test_db_path
+
+    database.db.DB_PATH = original_path
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    """每个测试使用独立的缓存，避免场次ID复用导致串数据"""
+    original_client = seat_cache.redis_client
+    seat_cache.redis_client = LocalRedis()
+    seat_cache.reset_policy_state()
+    search_cache.clear()
+    event_suggest.reset()
+    seat_allocator.reset()
+    yield seat_cache.redis_client
+    seat_cache.redis_client = original_client
+
+
+@pytest.fixture
+def client(test_db):
+    """创建测试客户端"""
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+
+
+def _login(client, username, password, is_admin):
+    execute_query("DELETE FROM Sessions WHERE username = ?", (username,))
+    execute_query("DELETE FROM Users WHERE username = ?", (username,))
+    execute_query(
+        "INSERT INTO Users (username, password, is_admin) VALUES (?, ?, ?)",
+        (username, password, is_admin)
+    )
+    response = client.post('/login', json={'username': username, 'password': password})
+    if response.status_code == 200:
+        return response.get_json()['session_id']
+    raise Exception(f"Failed to create session for {username}")
+
+
+@pytest.fixture
+def admin_session(client):
+    """创建管理员会话"""
+    return _login(client, 'test_admin', 'admin123', 1)
+
+
+@pytest.fixture
+def user_session(client):
+    """创建普通用户会话"""
+    return _login(client, 'testuser', 'user123', 0)
+
+
+def create_event(name, rows=3, cols=10, event_date='2025-12-25', prices=(1000, 600, 300)):
+    """直接写库创建场次：每种座位类型rows行、每行cols个座位"""
+    conn = connect_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO Events (name, poster_url, event_date, start_time) VALUES (?, ?, ?, ?)",
+            (name, '/posters/test.png', event_date, '20:00')
+        )
+        event_id = cur.lastrowid
+        row_offset = 0
+        for seat_type, price in enumerate(prices, start=1):
+            cur.execute(
+                "INSERT INTO SeatTypes (event_id, type, price, stock) VALUES (?, ?, ?, ?)",
+                (event_id, seat_type, price, rows * cols)
+            )
+            cur.executemany(
+                "INSERT INTO Seats (event_id, row, col, type, is_reserved) VALUES (?, ?, ?, ?, 0)",
+                [(event_id, row_offset + r, c, seat_type) for r in range(1, rows + 1) for c in range(1, cols + 1)]
+            )
+            row_offset += rows
+        conn.commit()
+        return event_id
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def sample_event(test_db):
+    """创建示例活动（90个座位）"""
+    return create_event('Test Optimized Concert')
+
+
+def seat_ids_of(event_id, limit=None):
+    """按ID顺序获取场次的座位ID"""
+    rows = fetch_query("SELECT id FROM Seats WHERE event_id = ? ORDER BY id", (event_id,))
+    ids = [row['id'] for row in rows]
+    return ids[:limit] if limit else ids
@@ -0,0 +1,48 @@
+import booking_queue
+import metrics
+from conftest import seat_ids_of
+
+
+class TestBookingQueue:
+    """测试异步订票队列"""
+
+    def test_async_booking_returns_job_and_completes_in_order(self, client, user_session, admin_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 2)
+        first = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids, 'async': True},
+                            headers={'Session-ID': user_session})
+        second = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids[1:]},
+                             headers={'Session-ID': admin_session, 'Prefer': 'respond-async'})
+        assert first.status_code == 202 and second.status_code == 202
+        first_job, second_job = first.get_json()['job_id'], second.get_json()['job_id']
+
+        status = client.get(f'/booking_status/{first_job}', headers={'Session-ID': user_session}).get_json()['data']
+        assert status['status'] == 'queued' and status['queue_depth'] == 2
+        # 只有提交者能查询任务
+        assert client.get(f'/booking_status/{first_job}', headers={'Session-ID': admin_session}).status_code == 404
+
+        assert booking_queue.run_pending() == 2
+        status = client.get(f'/booking_status/{first_job}', headers={'Session-ID': user_session}).get_json()['data']
+        assert status['status'] == 'done' and status['status_code'] == 200
+        assert status['result']['status'] == 'success'
+        status = client.get(f'/booking_status/{second_job}', headers={'Session-ID': admin_session}).get_json()['data']
+        assert status['status_code'] == 400
+
+        snapshot = metrics.snapshot()
+        assert snapshot['histograms']['booking_queue.wait_seconds']['count'] >= 2
+        assert snapshot['gauges']['booking_queue.depth'] == 0
+
+    def test_validation_errors_are_synchronous(self, client, user_session, sample_event):
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': [], 'async': True},
+                               headers={'Session-ID': user_session})
+        assert response.status_code == 400
+        assert booking_queue.queue_depth() == 0
+
+    def test_full_queue_is_rejected(self, client, user_session, sample_event, monkeypatch):
+        import queue
+        monkeypatch.setattr(booking_queue, '_queue', queue.Queue(maxsize=1))
+        body = {'event_id': sample_event, 'async': True}
+        headers = {'Session-ID': user_session}
+        seat_ids = seat_ids_of(sample_event, 2)
+        assert client.post('/book_ticket', json=dict(body, seat_ids=seat_ids[:1]), headers=headers).status_code == 202
+        response = client.post('/book_ticket', json=dict(body, seat_ids=seat_ids[1:]), headers=headers)
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
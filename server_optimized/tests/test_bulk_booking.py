@@ -0,0 +1,69 @@
+import database.db
+import seat_cache
+import stock_counters
+from conftest import seat_ids_of
+from database.db import fetch_query
+
+
+class TestBulkBooking:
+    """测试批量团体订票"""
+
+    def test_partial_success_in_chunked_transactions(self, client, admin_session, user_session, sample_event,
+                                                     monkeypatch):
+        monkeypatch.setattr(database.db, 'BULK_CHUNK_SIZE', 2)
+        seat_ids = seat_ids_of(sample_event, 8)
+        client.get(f'/get_seats?event_id={sample_event}')
+        orders = [
+            {'username': 'testuser', 'seat_ids': seat_ids[0:2]},
+            {'username': 'test_admin', 'seat_ids': seat_ids[1:3]},   # 与前一单重复
+            {'username': 'nobody', 'seat_ids': seat_ids[3:4]},       # 用户不存在
+            {'username': 'testuser', 'seat_ids': seat_ids[3:8]},     # 超过4张
+            {'username': 'test_admin', 'seat_ids': seat_ids[4:8]},
+        ]
+        response = client.post('/admin/bulk_book', json={'event_id': sample_event, 'orders': orders},
+                               headers={'Session-ID': admin_session})
+        data = response.get_json()
+        assert response.status_code == 200 and data['status'] == 'partial'
+        assert [r['status'] for r in data['results']] == ['success', 'fail', 'fail', 'fail', 'success']
+        assert data['succeeded'] == 2 and data['results'][1]['index'] == 1
+
+        # 数据库、座位缓存和库存计数器一致
+        booked = seat_ids[0:2] + seat_ids[4:8]
+        rows = fetch_query(f"SELECT id FROM Seats WHERE event_id = ? AND is_reserved = 1", (sample_event,))
+        assert sorted(row['id'] for row in rows) == sorted(booked)
+        cached = {seat['id']: seat['is_reserved'] for seat in seat_cache.get_seats_from_cache(sample_event)}
+        assert all(cached[seat_id] == 1 for seat_id in booked) and cached[seat_ids[2]] == 0
+        stock = fetch_query("SELECT stock FROM SeatTypes WHERE event_id = ? AND type = 1", (sample_event,))[0]['stock']
+        assert stock == 24
+        order_id = data['results'][0]['order_id']
+        assert fetch_query("SELECT COUNT(*) AS n FROM OrderDetails WHERE order_id = ?", (order_id,))[0]['n'] == 2
+
+    def test_malformed_seat_ids_fail_per_order(self, client, admin_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 2)
+        orders = [
+            {'username': 'testuser', 'seat_ids': seat_ids[0]},
+            {'username': 'testuser', 'seat_ids': [str(seat_ids[0])]},
+            {'username': 'testuser', 'seat_ids': [[seat_ids[0]]]},
+            {'username': 'test_admin', 'seat_ids': seat_ids},
+        ]
+        response = client.post('/admin/bulk_book', json={'event_id': sample_event, 'orders': orders},
+                               headers={'Session-ID': admin_session})
+        data = response.get_json()
+        assert response.status_code == 200 and data['status'] == 'partial'
+        assert [r['status'] for r in data['results']] == ['fail', 'fail', 'fail', 'success']
+        assert data['results'][0]['message'] == 'seat_ids must be a list of integers'
+
+    def test_consumes_stock_counters(self, client, admin_session, user_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 3)
+        client.get(f'/get_seats?event_id={sample_event}')
+        client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids[:1]},
+                    headers={'Session-ID': user_session})
+        client.post('/admin/bulk_book', json={'event_id': sample_event,
+                                              'orders': [{'username': 'testuser', 'seat_ids': seat_ids[1:]}]},
+                    headers={'Session-ID': admin_session})
+        assert stock_counters.remaining(sample_event)[1] == 27
+
+    def test_admin_only(self, client, user_session, sample_event):
+        response = client.post('/admin/bulk_book', json={'event_id': sample_event, 'orders': []},
+                               headers={'Session-ID': user_session})
+        assert response.status_code == 403
@@ -0,0 +1,39 @@
+import pytest
+import cache_auditor
+import seat_cache
+from database.db import execute_query, fetch_query
+from conftest import seat_ids_of
+
+
+class TestCacheAuditor:
+    """测试缓存/数据库一致性巡检"""
+
+    def _cache(self, event_id):
+        seats = fetch_query("SELECT * FROM Seats WHERE event_id = ? ORDER BY id", (event_id,))
+        seat_cache.set_seats_to_cache(event_id, [dict(row) for row in seats])
+
+    def test_consistent_cache_untouched(self, sample_event):
+        """一致的缓存只做校验值比对"""
+        self._cache(sample_event)
+        report = cache_auditor.run_once()
+        assert report == {'checked': 1, 'drifted': 0, 'repaired_seats': 0}
+
+    def test_drift_is_repaired(self, sample_event):
+        """绕过缓存直接改库产生的漂移会被修复"""
+        self._cache(sample_event)
+        seat_id = seat_ids_of(sample_event, 1)[0]
+        execute_query("UPDATE Seats SET is_reserved = 1 WHERE id = ?", (seat_id,))
+
+        report = cache_auditor.run_once()
+        assert report['drifted'] == 1
+        assert report['repaired_seats'] == 1
+        cached = {s['id']: s['is_reserved'] for s in seat_cache.get_seats_from_cache(sample_event)}
+        assert cached[seat_id] == 1
+        assert seat_cache.get_availability_summaries([sample_event])[sample_event]['available_seats'] == 89
+
+    def test_deleted_event_cache_dropped(self, sample_event):
+        """已删除场次的缓存被清除"""
+        self._cache(sample_event)
+        execute_query("DELETE FROM Seats WHERE event_id = ?", (sample_event,))
+        cache_auditor.run_once()
+        assert seat_cache.get_seats_from_cache(sample_event) is None
@@ -0,0 +1,61 @@
+import pytest
+import cache_warmer
+import seat_cache
+from conftest import create_event
+
+
+class TestCacheWarmer:
+    """测试后台缓存预热"""
+
+    def test_search_enqueues_instead_of_loading(self, client, sample_event):
+        """搜索只提交预热请求，预热线程处理后缓存才被填充"""
+        response = client.get('/search_events?keyword=Test Optimized')
+        assert response.status_code == 200
+        assert seat_cache.get_seats_from_cache(sample_event) is None
+
+        assert cache_warmer.run_pending() >= 1
+        assert len(seat_cache.get_seats_from_cache(sample_event)) == 90
+
+    def test_enqueue_deduplicates(self, sample_event):
+        """同一场次在队列中只保留一份"""
+        assert cache_warmer.enqueue([sample_event, sample_event, str(sample_event)]) == 1
+        assert cache_warmer.run_pending() == 1
+        # 处理完成后可以再次入队
+        assert cache_warmer.enqueue([sample_event]) == 1
+        cache_warmer.run_pending()
+
+    def test_upcoming_events(self, test_db):
+        """定时预热只选择临近开演的场次"""
+        from datetime import date, timedelta
+        soon = create_event('Test Soon Concert', rows=1, event_date=(date.today() + timedelta(days=1)).isoformat())
+        later = create_event('Test Later Concert', rows=1, event_date=(date.today() + timedelta(days=30)).isoformat())
+        upcoming = cache_warmer.upcoming_event_ids()
+        assert soon in upcoming
+        assert later not in upcoming
+
+
+class TestBatchCacheOperations:
+    """测试多场次批量缓存接口"""
+
+    def test_multi_set_and_get(self, test_db):
+        """一次写入、一次读取多个场次"""
+        seats = {
+            1: [{'id': 1, 'event_id': 1, 'row': 1, 'col': 1, 'type': 'VIP', 'is_reserved': 0},
+                {'id': 2, 'event_id': 1, 'row': 1, 'col': 2, 'type': 'VIP', 'is_reserved': 1}],
+            2: [{'id': 3, 'event_id': 2, 'row': 1, 'col': 1, 'type': 'B', 'is_reserved': 0}],
+        }
+        seat_cache.set_many_seats_to_cache(seats)
+        result = seat_cache.get_many_seats_from_cache([1, 2, 3])
+        assert result == {1: seats[1], 2: seats[2], 3: None}
+        summaries = seat_cache.get_availability_summaries([1, 2, 3])
+        assert summaries[1] == {'total_seats': 2, 'available_seats': 1}
+        assert summaries[3] is None
+
+    def test_search_results_include_availability(self, client, sample_event):
+        """已缓存场次的搜索结果带余票摘要"""
+        cache_warmer.enqueue([sample_event])
+        cache_warmer.run_pending()
+        data = client.get('/search_events?keyword=Test Optimized').get_json()
+        event = next(e for e in data['data'] if e['id'] == sample_event)
+        assert event['total_seats'] == 90
+        assert event['available_seats'] == 90
@@ -0,0 +1,96 @@
+import io
+import sqlite3
+import threading
+import pytest
+import database.db
+import metrics
+from conftest import seat_ids_of
+from database.db import DatabaseBusy, execute_query, fetch_query
+
+
+@pytest.fixture
+def write_lock(test_db):
+    """另一个连接持有写锁，模拟并发的写事务"""
+    database.db.connect_db().close()  # 先完成建表迁移
+    conn = sqlite3.connect(test_db, check_same_thread=False)
+    conn.execute("BEGIN IMMEDIATE")
+    yield conn
+    conn.rollback()
+    conn.close()
+
+
+class TestBusyRetry:
+    """测试SQLITE_BUSY重试策略"""
+
+    def test_retries_until_lock_is_released(self, write_lock):
+        release = threading.Timer(0.15, write_lock.rollback)
+        release.start()
+        before = metrics.snapshot()['counters'].get('db.busy_retries.execute_query', 0)
+        execute_query("DELETE FROM Sessions WHERE username = ?", ('nobody',))
+        release.join()
+        snapshot = metrics.snapshot()
+        assert snapshot['counters']['db.busy_retries.execute_query'] > before
+        assert snapshot['histograms']['db.lock_wait_seconds.execute_query']['count'] >= 1
+
+    def test_gives_up_at_deadline(self, write_lock, monkeypatch):
+        monkeypatch.setattr(database.db, 'BUSY_DEADLINE_SECONDS', 0.1)
+        with pytest.raises(DatabaseBusy) as error:
+            execute_query("DELETE FROM Sessions WHERE username = ?", ('nobody',))
+        assert error.value.site == 'execute_query' and error.value.waited < 1
+
+    def test_other_errors_are_not_retried(self, test_db):
+        with pytest.raises(sqlite3.OperationalError):
+            execute_query("UPDATE NoSuchTable SET x = 1")
+
+    def test_booking_returns_503_with_retry_after(self, client, user_session, sample_event, monkeypatch):
+        seat_ids = seat_ids_of(sample_event, 1)
+        monkeypatch.setattr(database.db, 'BUSY_DEADLINE_SECONDS', 0.1)
+        conn = sqlite3.connect(database.db.DB_PATH)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids},
+                                   headers={'Session-ID': user_session})
+        finally:
+            conn.rollback()
+            conn.close()
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+        assert metrics.snapshot()['counters']['db.busy_failures.reserve_seats'] >= 1
+        assert fetch_query("SELECT is_reserved FROM Seats WHERE id = ?", (seat_ids[0],))[0]['is_reserved'] == 0
+        # 锁释放后重试成功
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids},
+                               headers={'Session-ID': user_session})
+        assert response.status_code == 200
+
+
+class TestBusyResponses:
+    """测试普通写入遇到写锁竞争时返回503而不是500"""
+
+    @pytest.fixture
+    def busy(self, test_db, monkeypatch):
+        monkeypatch.setattr(database.db, 'BUSY_DEADLINE_SECONDS', 0.1)
+        database.db.connect_db().close()  # 先完成建表迁移
+        conn = sqlite3.connect(database.db.DB_PATH, check_same_thread=False)
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.rollback()
+        conn.close()
+
+    @staticmethod
+    def _assert_busy(response):
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+        assert response.get_json()['status'] == 'fail'
+
+    def test_register(self, client, busy):
+        self._assert_busy(client.post('/register', json={'username': 'busy_user', 'password': 'pw'}))
+
+    def test_login(self, client, user_session, busy):
+        self._assert_busy(client.post('/login', json={'username': 'testuser', 'password': 'user123'}))
+
+    def test_add_event(self, client, admin_session, busy, monkeypatch, tmp_path):
+        import admin_event
+        monkeypatch.setattr(admin_event, 'UPLOAD_FOLDER', str(tmp_path))
+        data = {'name': 'Busy Concert', 'event_date': '2025-12-31', 'start_time': '20:00',
+                'price_1': '100', 'price_2': '80', 'price_3': '50', 'poster': (io.BytesIO(b'png'), 'busy.png')}
+        response = client.post('/add_event', data=data, content_type='multipart/form-data',
+                               headers={'Session-ID': admin_session})
+        self._assert_busy(response)
@@ -0,0 +1,105 @@
+import event_cancellation
+import seat_cache
+import stock_counters
+from conftest import create_event, seat_ids_of
+from database.db import cancel_event_orders_batch, execute_query, fetch_query, release_order, reserve_orders
+
+
+def _stock(event_id, seat_type=1):
+    return fetch_query("SELECT stock FROM SeatTypes WHERE event_id = ? AND type = ?", (event_id, seat_type))[0]['stock']
+
+
+def _book(event_id, username, count, per_order=2):
+    seat_ids = seat_ids_of(event_id, count)
+    return [result['order_id'] for result in reserve_orders(
+        event_id, [{'username': username, 'seat_ids': seat_ids[i:i + per_order]}
+                   for i in range(0, count, per_order)])]
+
+
+class TestEventCancellation:
+    """测试整场退票任务"""
+
+    def test_cancels_every_order_of_the_event(self, client, admin_session, sample_event, monkeypatch):
+        monkeypatch.setattr(event_cancellation, 'CANCEL_BATCH_SIZE', 2)
+        other_event = create_event('Other Cancellation Concert')
+        _book(sample_event, 'test_admin', 10)
+        other_orders = _book(other_event, 'test_admin', 2)
+        client.get(f'/get_seats?event_id={sample_event}')
+        client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids_of(sample_event)[10:11]},
+                    headers={'Session-ID': admin_session})
+
+        response = client.post('/admin/cancel_event_orders', json={'event_id': sample_event},
+                               headers={'Session-ID': admin_session})
+        assert response.status_code == 202
+        event_cancellation.wait(sample_event, timeout=10)
+        response = client.get(f'/admin/cancel_event_orders/{sample_event}', headers={'Session-ID': admin_session})
+        job = response.get_json()['data']
+        assert job['status'] == 'done' and job['cancelled_orders'] == 6 and job['remaining_orders'] == 0
+        assert job['released_seats'] == 11 and job['refunded'] == 11 * 1000
+
+        # 座位和库存集合式恢复，其他场次不受影响
+        assert fetch_query("SELECT COUNT(*) AS n FROM Seats WHERE event_id = ? AND is_reserved = 1",
+                           (sample_event,))[0]['n'] == 0
+        assert _stock(sample_event) == 30
+        assert fetch_query("SELECT status FROM Orders WHERE id = ?", (other_orders[0],))[0]['status'] == 1
+        # 任务结束后缓存和计数器已更新
+        assert all(seat['is_reserved'] == 0 for seat in seat_cache.get_seats_from_cache(sample_event))
+        assert stock_counters.remaining(sample_event)[1] == 30
+        refunded = fetch_query("SELECT SUM(refunded) AS n FROM SalesAggregates WHERE event_id = ?", (sample_event,))
+        assert refunded[0]['n'] == 11 * 1000
+
+        # 批处理结束后单笔取消仍由触发器释放座位
+        release_order(other_orders[0])
+        assert _stock(other_event) == 30
+
+    def test_resumes_from_the_saved_cursor(self, client, admin_session, sample_event):
+        order_ids = _book(sample_event, 'test_admin', 10)
+        execute_query("INSERT INTO EventCancellations (event_id) VALUES (?)", (sample_event,))
+        # 第一批提交后进程崩溃
+        assert cancel_event_orders_batch(sample_event, 2)['orders'] == 2
+        client.get(f'/get_seats?event_id={sample_event}')
+
+        assert event_cancellation.run_job(sample_event, batch_size=2)
+        statuses = fetch_query(f"SELECT status FROM Orders WHERE id IN ({','.join('?' * len(order_ids))})", order_ids)
+        assert [row['status'] for row in statuses] == [0] * 5
+        job = event_cancellation.get_job(sample_event)
+        assert job['cancelled_orders'] == 5 and job['last_order_id'] == order_ids[-1]
+        # 之前的运行释放的座位不在本次记录中，座位缓存整体失效
+        assert seat_cache.get_seats_from_cache(sample_event) is None
+
+    def test_failed_job_records_error_and_resumes(self, client, admin_session, sample_event, monkeypatch):
+        _book(sample_event, 'test_admin', 10)
+        execute_query("INSERT INTO EventCancellations (event_id) VALUES (?)", (sample_event,))
+        calls = []
+
+        def flaky_batch(event_id, batch_size):
+            calls.append(event_id)
+            if len(calls) == 2:
+                raise RuntimeError("disk I/O error")
+            return cancel_event_orders_batch(event_id, batch_size)
+
+        monkeypatch.setattr(event_cancellation, 'cancel_event_orders_batch', flaky_batch)
+        assert event_cancellation.run_job(sample_event, batch_size=2) is False
+        response = client.get(f'/admin/cancel_event_orders/{sample_event}', headers={'Session-ID': admin_session})
+        job = response.get_json()['data']
+        assert job['status'] == 'failed' and job['error'] == 'RuntimeError: disk I/O error'
+        assert job['cancelled_orders'] == 2 and job['remaining_orders'] == 3
+        assert seat_cache.redis_client.get(f"{event_cancellation.LEASE_PREFIX}{sample_event}") is None
+
+        # 进程重启时失败的任务从游标继续，完成后清除错误
+        event_cancellation.resume_jobs()
+        event_cancellation.wait(sample_event, timeout=10)
+        job = event_cancellation.get_job(sample_event)
+        assert job['status'] == 'done' and job['error'] is None
+        assert job['cancelled_orders'] == 5 and job['remaining_orders'] == 0
+
+    def test_lease_prevents_concurrent_runs(self, sample_event):
+        seat_cache.redis_client.set(f"{event_cancellation.LEASE_PREFIX}{sample_event}", 1)
+        assert event_cancellation.run_job(sample_event) is False
+
+    def test_requires_admin_and_existing_event(self, client, admin_session, user_session):
+        response = client.post('/admin/cancel_event_orders', json={'event_id': 1}, headers={'Session-ID': user_session})
+        assert response.status_code == 403
+        response = client.post('/admin/cancel_event_orders', json={'event_id': 999999},
+                               headers={'Session-ID': admin_session})
+        assert response.status_code == 404
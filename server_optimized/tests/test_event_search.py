@@ -0,0 +1,119 @@
+import pytest
+import event_search
+from database.db import execute_query
+from conftest import create_event
+
+
+class TestEventSearch:
+    """测试场次全文检索"""
+
+    @pytest.fixture
+    def events(self, test_db):
+        return {
+            'rock': create_event('Summer Rock Festival', rows=1, cols=1),
+            'jazz': create_event('Midnight Jazz Night', rows=1, cols=1),
+            'rocket': create_event('Rocketman Tribute', rows=1, cols=1),
+        }
+
+    @staticmethod
+    def _ids(client, query):
+        response = client.get(f'/search_events?{query}')
+        return [e['id'] for e in response.get_json()['data']] if response.status_code == 200 else []
+
+    def test_prefix_and_multi_token(self, client, events):
+        assert set(self._ids(client, 'keyword=rock')) >= {events['rock'], events['rocket']}
+        assert self._ids(client, 'keyword=roc fest') == [events['rock']]
+        assert events['jazz'] in self._ids(client, 'keyword=JAZZ nig')
+
+    def test_substring_mode_kept_for_compatibility(self, client, events):
+        """词中间的片段只有子串模式能匹配"""
+        assert events['jazz'] not in self._ids(client, 'keyword=dnight')
+        assert events['jazz'] in self._ids(client, 'keyword=dnight&match=substring')
+        assert client.get('/search_events?keyword=a&match=regex').status_code == 400
+
+    def test_index_follows_event_changes(self, test_db, events):
+        execute_query("UPDATE Events SET name = ? WHERE id = ?", ('Autumn Blues Festival', events['rock']))
+        ids = [e['id'] for e in event_search.search_events('blues')[0]]
+        assert ids == [events['rock']]
+        assert event_search.search_events('summer') == ([], None)
+        execute_query("DELETE FROM Events WHERE id = ?", (events['rock'],))
+        assert event_search.search_events('blues') == ([], None)
+
+    def test_match_expression_escapes_syntax(self):
+        assert event_search.fts_match_expression('rock "AND" -x*') == '"rock"* "AND"* "x"*'
+        assert event_search.fts_match_expression(' -* ') is None
+
+
+class TestPaginatedSearch:
+    """测试键集分页与过滤"""
+
+    @pytest.fixture
+    def events(self, test_db):
+        ids = [create_event(f'Paged Show {i}', rows=1, cols=2, event_date=f'2027-03-{i % 5 + 1:02d}',
+                            prices=(1000 + i * 100, 500, 200)) for i in range(12)]
+        # 第0场全部售空，其余场次每种座位类型余2张
+        execute_query("UPDATE SeatTypes SET stock = 0 WHERE event_id = ?", (ids[0],))
+        return ids
+
+    @staticmethod
+    def _page(client, query):
+        return client.get(f'/search_events?keyword=paged show&{query}').get_json()
+
+    def test_unpaginated_without_limit_or_cursor(self, client, events, monkeypatch):
+        """只带关键字的旧客户端（如管理端场次列表）仍拿到全部结果"""
+        monkeypatch.setattr(event_search, 'DEFAULT_PAGE_SIZE', 2)
+        data = self._page(client, 'match=fts')
+        assert {e['id'] for e in data['data']} == set(events) and data['next_cursor'] is None
+        data = client.get('/search_events?keyword=').get_json()
+        assert set(events) <= {e['id'] for e in data['data']} and data['next_cursor'] is None
+        # 只带游标时使用默认页大小
+        cursor = self._page(client, 'limit=1')['next_cursor']
+        assert len(self._page(client, f'cursor={cursor}')['data']) == 2
+
+    def test_pages_follow_date_then_id(self, client, events):
+        seen, cursor = [], None
+        while True:
+            data = self._page(client, 'limit=5' + (f'&cursor={cursor}' if cursor else ''))
+            assert len(data['data']) <= 5
+            seen += [(e['event_date'], e['id']) for e in data['data']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        assert seen == sorted(seen)
+        assert sorted(e_id for _, e_id in seen) == events
+
+    def test_filters(self, client, events):
+        data = self._page(client, 'date_from=2027-03-02&date_to=2027-03-03')
+        assert {e['event_date'] for e in data['data']} == {'2027-03-02', '2027-03-03'}
+        data = self._page(client, 'price_min=1900&price_max=2000')
+        assert {e['id'] for e in data['data']} == {events[9], events[10]}
+        data = self._page(client, 'price_min=1000&price_max=1000&has_availability=1&limit=10')
+        assert data['data'] == []
+        assert events[0] not in [e['id'] for e in self._page(client, 'has_availability=1')['data']]
+
+    def test_availability_filter_follows_stock(self, client, events):
+        """余票过滤不走搜索缓存，售罄/补票后立即反映"""
+        assert events[1] in [e['id'] for e in self._page(client, 'has_availability=1')['data']]
+        execute_query("UPDATE SeatTypes SET stock = 0 WHERE event_id = ?", (events[1],))
+        execute_query("UPDATE SeatTypes SET stock = 2 WHERE event_id = ?", (events[0],))
+        ids = [e['id'] for e in self._page(client, 'has_availability=1')['data']]
+        assert events[1] not in ids and events[0] in ids
+
+    def test_empty_page_and_bad_arguments(self, client, events):
+        response = client.get('/search_events?keyword=nothing here&limit=5')
+        assert response.status_code == 200 and response.get_json()['data'] == []
+        assert client.get('/search_events?keyword=nothing here').status_code == 404
+        assert client.get('/search_events?keyword=a&cursor=%%%').status_code == 400
+        assert client.get('/search_events?keyword=a&date_from=tomorrow').status_code == 400
+        assert client.get('/search_events?keyword=a&limit=0').status_code == 400
+
+    def test_relevance_sort_single_page(self, client, events):
+        data = self._page(client, 'sort=relevance&limit=3')
+        assert len(data['data']) == 3 and data['next_cursor'] is None
+
+    def test_keyset_uses_index(self, test_db, events):
+        from database.db import fetch_query
+        plan = " ".join(row['detail'] for row in fetch_query(
+            "EXPLAIN QUERY PLAN SELECT e.* FROM Events e WHERE (e.event_date, e.id) > (?, ?) "
+            "ORDER BY e.event_date, e.id LIMIT 5", ('2027-03-01', 1)))
+        assert 'idx_events_date_id' in plan and 'TEMP B-TREE' not in plan
@@ -0,0 +1,65 @@
+import event_suggest
+import search_cache
+from conftest import create_event
+
+
+class TestEventSuggest:
+    """测试场次名称联想"""
+
+    def test_prefix_of_any_word(self, client, test_db):
+        rock = create_event('Summer Rock Festival', rows=1, cols=1)
+        rocket = create_event('Rocketman Tribute', rows=1, cols=1)
+        data = client.get('/suggest_events?q=ROC').get_json()['data']
+        assert {e['id'] for e in data} >= {rock, rocket}
+        assert [e['id'] for e in client.get('/suggest_events?q=rock f').get_json()['data']] == [rock]
+        assert client.get('/suggest_events?q=').get_json()['data'] == []
+        assert len(client.get('/suggest_events?q=t&limit=1').get_json()['data']) == 1
+
+    def test_long_prefix_checked_against_name(self):
+        name = 'An Extraordinarily Long Orchestral Evening Programme'
+        index = event_suggest.PrefixIndex.build([(1, name), (2, name[:30] + ' Matinee')], 0)
+        assert [e['id'] for e in index.lookup(name.lower())] == [1]
+
+    def test_incremental_update_matches_rebuild(self, monkeypatch):
+        monkeypatch.setattr(event_suggest, "BLOCK_SIZE", 4)
+        events = [(i, f'Show {i} Night') for i in range(50)]
+        index = event_suggest.PrefixIndex.build(events, 0)
+        index = index.with_event(7, 'Renamed Gala', 1).with_event(8, None, 2).with_event(99, 'New Night', 3)
+        expected = dict(events)
+        expected.update({7: 'Renamed Gala', 99: 'New Night'})
+        del expected[8]
+        rebuilt = event_suggest.PrefixIndex.build(list(expected.items()), 3)
+        def entries(ix):
+            return sorted((key, event_id) for keys, ids in ix.blocks for key, event_id in zip(keys, ids))
+        assert entries(index) == entries(rebuilt)
+        assert index.names == rebuilt.names
+        assert all(keys == sorted(keys) for keys, _ in index.blocks)
+
+    def test_admin_changes_update_index(self, client, admin_session, sample_event):
+        assert client.get('/suggest_events?q=test opt').get_json()['data'][0]['id'] == sample_event
+        built = event_suggest.current_index()
+        client.post('/edit_event', json={
+            'event_id': sample_event, 'event_date': '2026-01-01', 'start_time': '19:00',
+            'price_1': 1000, 'price_2': 600, 'price_3': 300
+        }, headers={'Session-ID': admin_session})
+        # 本进程的修改增量生效，无需整体重建
+        assert event_suggest.current_index().blocks is built.blocks
+        client.post('/delete_event', json={'event_id': sample_event}, headers={'Session-ID': admin_session})
+        assert client.get('/suggest_events?q=test opt').get_json()['data'] == []
+
+    def test_other_worker_change_triggers_rebuild(self, test_db, monkeypatch):
+        event_suggest.suggest('x')
+        event_id = create_event('Harbour Lights Concert', rows=1, cols=1)
+        assert event_suggest.suggest('harbour') == []
+        search_cache.bump_events_version()
+        # 检查间隔内不查询版本号
+        calls = []
+        monkeypatch.setattr(search_cache, 'events_version', lambda: calls.append(1) or 0)
+        event_suggest.suggest('harbour')
+        assert calls == []
+        monkeypatch.undo()
+        # 间隔到期后发现版本变化，在后台重建，期间仍返回旧快照
+        monkeypatch.setattr(event_suggest, 'VERSION_CHECK_SECONDS', 0)
+        event_suggest.suggest('harbour')
+        event_suggest._refresher.join()
+        assert event_suggest.suggest('harbour') == [{'id': event_id, 'name': 'Harbour Lights Concert'}]
@@ -0,0 +1,79 @@
+import threading
+import time
+import idempotency
+from conftest import seat_ids_of
+from database.db import fetch_query
+
+
+def _orders(event_id):
+    return fetch_query("SELECT COUNT(*) AS n FROM Orders WHERE event_id = ?", (event_id,))[0]['n']
+
+
+class TestIdempotency:
+    """测试订票幂等键"""
+
+    def test_retry_replays_first_result(self, client, user_session, sample_event, monkeypatch):
+        body = {'event_id': sample_event, 'seat_ids': seat_ids_of(sample_event, 2)}
+        headers = {'Session-ID': user_session, 'Idempotency-Key': 'retry-1'}
+        first = client.post('/book_ticket', json=body, headers=headers)
+        assert first.status_code == 200 and 'Idempotent-Replayed' not in first.headers
+
+        # 同一会话的重试不访问数据库
+        import ticket_booking
+        monkeypatch.setattr(ticket_booking, 'fetch_query', None)
+        monkeypatch.setattr(ticket_booking, 'reserve_seats', None)
+        second = client.post('/book_ticket', json=body, headers=headers)
+        assert second.status_code == 200 and second.headers['Idempotent-Replayed'] == 'true'
+        assert second.get_json() == first.get_json()
+        monkeypatch.undo()
+        assert _orders(sample_event) == 1
+
+    def test_key_reused_with_different_body(self, client, user_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 2)
+        headers = {'Session-ID': user_session, 'Idempotency-Key': 'retry-2'}
+        client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids[:1]}, headers=headers)
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids[1:]},
+                               headers=headers)
+        assert response.status_code == 422
+        assert _orders(sample_event) == 1
+
+    def test_business_failure_is_stored_and_conflict_is_not(self, client, user_session, admin_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 1)
+        body = {'event_id': sample_event, 'seat_ids': seat_ids}
+        client.post('/book_ticket', json=body, headers={'Session-ID': admin_session})
+        headers = {'Session-ID': user_session, 'Idempotency-Key': 'retry-3'}
+        assert client.post('/book_ticket', json=body, headers=headers).status_code == 400
+        replay = client.post('/book_ticket', json=body, headers=headers)
+        assert replay.status_code == 400 and replay.headers['Idempotent-Replayed'] == 'true'
+
+        # 被他人锁定的409不保存，锁定释放后用同一个键重试可以成功
+        free = seat_ids_of(sample_event, 2)[1:]
+        hold = client.post('/hold_seats', json={'event_id': sample_event, 'seat_ids': free},
+                           headers={'Session-ID': admin_session}).get_json()['data']
+        body = {'event_id': sample_event, 'seat_ids': free}
+        headers['Idempotency-Key'] = 'retry-4'
+        assert client.post('/book_ticket', json=body, headers=headers).status_code == 409
+        client.post('/release_hold', json={'hold_id': hold['hold_id']}, headers={'Session-ID': admin_session})
+        assert client.post('/book_ticket', json=body, headers=headers).status_code == 200
+
+    def test_in_flight_duplicate_waits_for_first_result(self, test_db):
+        fingerprint = idempotency.fingerprint({'event_id': 1})
+        state, pending = idempotency.begin('alice', 'k', fingerprint)
+        assert state == idempotency.STARTED
+
+        def finish_later():
+            time.sleep(0.1)
+            idempotency.finish('alice', 'k', pending, 'sid', {'status': 'success'}, 200)
+
+        worker = threading.Thread(target=finish_later)
+        worker.start()
+        state, record = idempotency.begin('alice', 'k', fingerprint)
+        worker.join()
+        assert state == idempotency.REPLAY and record['body'] == {'status': 'success'}
+        assert idempotency.session_replay('sid', 'k', fingerprint)['status_code'] == 200
+
+    def test_in_flight_wait_times_out(self, test_db, monkeypatch):
+        monkeypatch.setattr(idempotency, 'WAIT_TIMEOUT', 0.05)
+        fingerprint = idempotency.fingerprint({})
+        idempotency.begin('alice', 'k', fingerprint)
+        assert idempotency.begin('alice', 'k', fingerprint)[0] == idempotency.IN_PROGRESS
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+
+import order_listing
+from conftest import create_event, seat_ids_of
+from database.db import execute_query, reserve_orders
+
+
+def _place_orders(event_id, usernames, day='2025-11-'):
+    """每个用户各下一单（各1个座位），下单时间依次为当月1日、2日……返回订单ID列表"""
+    seat_ids = seat_ids_of(event_id, len(usernames))
+    results = reserve_orders(event_id, [{'username': name, 'seat_ids': [seat_id]}
+                                        for name, seat_id in zip(usernames, seat_ids)])
+    order_ids = [result['order_id'] for result in results]
+    for i, order_id in enumerate(order_ids):
+        execute_query("UPDATE Orders SET created_at = ? WHERE id = ?", (f"{day}{i + 1:02d} 10:00:00", order_id))
+    return order_ids
+
+
+class TestOrderListing:
+    """测试订单列表的键集分页与过滤"""
+
+    def test_pages_follow_created_at_order(self, client, user_session, sample_event):
+        order_ids = _place_orders(sample_event, ['testuser'] * 5)
+        seen, cursor = [], None
+        while True:
+            url = '/show_orders?status=2&limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = client.get(url, headers={'Session-ID': user_session}).get_json()
+            seen.extend(order['id'] for order in data['data'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        assert seen == order_ids
+
+    def test_users_see_only_their_orders(self, client, user_session, admin_session, sample_event):
+        order_ids = _place_orders(sample_event, ['testuser', 'test_admin', 'testuser'])
+        data = client.get('/show_orders?status=2', headers={'Session-ID': user_session}).get_json()
+        assert [order['id'] for order in data['data']] == [order_ids[0], order_ids[2]]
+        data = client.get(f'/show_orders?status=2&event_id={sample_event}',
+                          headers={'Session-ID': admin_session}).get_json()
+        assert [order['id'] for order in data['data']] == order_ids
+        assert data['data'][0]['username'] == 'testuser' and data['data'][1]['name'] == 'Test Optimized Concert'
+
+    def test_event_status_and_date_filters(self, client, admin_session, sample_event):
+        other_event = create_event('Other Listing Concert')
+        order_ids = _place_orders(sample_event, ['test_admin'] * 4)
+        _place_orders(other_event, ['test_admin'])
+        execute_query("UPDATE Orders SET status = 0 WHERE id = ?", (order_ids[1],))
+
+        def listed(query):
+            data = client.get(f'/show_orders?event_id={sample_event}&{query}',
+                              headers={'Session-ID': admin_session}).get_json()
+            return [order['id'] for order in data['data']]
+
+        assert listed('status=1') == [order_ids[0], order_ids[2], order_ids[3]]
+        assert listed('status=0') == [order_ids[1]]
+        # 截止日期当天整天都包含在内
+        assert listed('status=2&date_from=2025-11-02&date_to=2025-11-03') == order_ids[1:3]
+
+    def test_unpaginated_without_limit_or_cursor(self, client, user_session, sample_event, monkeypatch):
+        """不带limit/cursor的旧客户端仍拿到全部订单"""
+        monkeypatch.setattr(order_listing, 'DEFAULT_PAGE_SIZE', 2)
+        order_ids = _place_orders(sample_event, ['testuser'] * 3)
+        headers = {'Session-ID': user_session}
+        data = client.get('/show_orders?status=2', headers=headers).get_json()
+        assert [order['id'] for order in data['data']] == order_ids and 'next_cursor' not in data
+        data = client.get('/show_orders?status=2&limit=1&paginate=0', headers=headers).get_json()
+        assert [order['id'] for order in data['data']] == order_ids and 'next_cursor' not in data
+        # 显式分页时使用默认页大小
+        data = client.get('/show_orders?status=2&paginate=1', headers=headers).get_json()
+        assert [order['id'] for order in data['data']] == order_ids[:2] and data['next_cursor']
+
+    def test_invalid_arguments(self, client, user_session):
+        headers = {'Session-ID': user_session}
+        assert client.get('/show_orders', headers=headers).status_code == 400
+        assert client.get('/show_orders?status=2&cursor=bogus', headers=headers).status_code == 400
+        assert client.get('/show_orders?status=2&date_from=11/01', headers=headers).status_code == 400
+
+
+class TestOrderExport:
+    """测试订单流式导出"""
+
+    def test_csv_has_one_row_per_order_line(self, client, admin_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 3)
+        order_ids = [result['order_id'] for result in reserve_orders(sample_event, [
+            {'username': 'test_admin', 'seat_ids': seat_ids[:2]}, {'username': 'test_admin', 'seat_ids': seat_ids[2:]}])]
+        response = client.get(f'/export_orders?event_id={sample_event}', headers={'Session-ID': admin_session})
+        assert response.status_code == 200 and response.mimetype == 'text/csv'
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        assert rows[0] == list(order_listing.EXPORT_CSV_COLUMNS)
+        assert [(int(row[0]), int(row[7])) for row in rows[1:]] == [
+            (order_ids[0], seat_ids[0]), (order_ids[0], seat_ids[1]), (order_ids[1], seat_ids[2])]
+
+    def test_ndjson_streams_in_batches_without_holding_locks(self, client, admin_session, sample_event, monkeypatch):
+        monkeypatch.setattr(order_listing, 'EXPORT_BATCH_SIZE', 2)
+        order_ids = _place_orders(sample_event, ['test_admin'] * 5)
+        response = client.get(f'/export_orders?format=ndjson&event_id={sample_event}&date_from=2025-11-02',
+                               headers={'Session-ID': admin_session})
+        assert response.mimetype == 'application/x-ndjson'
+        stream = response.response
+        first = json.loads(next(iter(stream)))
+        assert first['order_id'] == order_ids[1] and len(first['details']) == 1
+        # 批与批之间不持有读锁，写事务可以提交
+        execute_query("UPDATE Orders SET total_price = total_price WHERE id = ?", (order_ids[0],))
+        rest = [json.loads(line) for line in stream]
+        assert [order['order_id'] for order in rest] == order_ids[2:]
+
+    def test_admin_only(self, client, user_session):
+        response = client.get('/export_orders', headers={'Session-ID': user_session})
+        assert response.status_code == 403
@@ -0,0 +1,42 @@
+import metrics
+import rate_limit
+
+
+class TestRateLimit:
+    """测试令牌桶限流"""
+
+    def test_bucket_refills_over_time(self, monkeypatch):
+        monkeypatch.setitem(rate_limit.ROUTE_LIMITS, 'booking', (2, 1))
+        assert rate_limit.take('booking', 'user:a', now=100)[0]
+        assert rate_limit.take('booking', 'user:a', now=100)[0]
+        allowed, wait = rate_limit.take('booking', 'user:a', now=100)
+        assert not allowed and wait == 1
+        # 其他用户的桶互不影响
+        assert rate_limit.take('booking', 'user:b', now=100)[0]
+        # 一秒后补充一个令牌
+        assert rate_limit.take('booking', 'user:a', now=101)[0]
+        assert not rate_limit.take('booking', 'user:a', now=101)[0]
+
+    def test_returns_429_with_retry_after(self, client, sample_event, monkeypatch):
+        monkeypatch.setitem(rate_limit.ROUTE_LIMITS, 'seats', (2, 0.5))
+        before = metrics.snapshot()['counters'].get('rate_limit.limited.seats', 0)
+        codes = [client.get(f'/get_seats?event_id={sample_event}').status_code for _ in range(3)]
+        assert codes == [200, 200, 429]
+        response = client.get(f'/get_seats?event_id={sample_event}')
+        assert response.status_code == 429 and response.headers['Retry-After'] == '2'
+        assert metrics.snapshot()['counters']['rate_limit.limited.seats'] == before + 2
+
+    def test_keyed_by_session_user(self, client, user_session, admin_session, sample_event, monkeypatch):
+        monkeypatch.setitem(rate_limit.ROUTE_LIMITS, 'seats', (1, 0.1))
+        url = f'/get_seats?event_id={sample_event}'
+        assert client.get(url, headers={'Session-ID': user_session}).status_code == 200
+        assert client.get(url, headers={'Session-ID': user_session}).status_code == 429
+        # 同一IP的其他用户和匿名请求各自计数
+        assert client.get(url, headers={'Session-ID': admin_session}).status_code == 200
+        assert client.get(url).status_code == 200
+
+    def test_can_be_disabled(self, client, sample_event, monkeypatch):
+        monkeypatch.setitem(rate_limit.ROUTE_LIMITS, 'seats', (1, 0.1))
+        monkeypatch.setattr(rate_limit, 'RATE_LIMITING', False)
+        for _ in range(3):
+            assert client.get(f'/get_seats?event_id={sample_event}').status_code == 200
@@ -0,0 +1,55 @@
+import sales_summary
+from conftest import create_event, seat_ids_of
+from database.db import execute_query, fetch_query, release_order, reserve_orders
+
+
+def _aggregate_rows():
+    return [dict(row) for row in fetch_query("SELECT * FROM SalesAggregates ORDER BY event_id, seat_type, day")]
+
+
+class TestSalesSummary:
+    """测试销售汇总表的增量维护与统计接口"""
+
+    def test_bookings_and_cancellations_update_aggregates(self, client, admin_session, user_session, sample_event):
+        seat_ids = seat_ids_of(sample_event)
+        # 前30个座位为类型1（1000元），随后30个为类型2（600元）
+        client.get(f'/get_seats?event_id={sample_event}')
+        client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': [seat_ids[0], seat_ids[30]]},
+                    headers={'Session-ID': user_session})
+        results = reserve_orders(sample_event, [{'username': 'test_admin', 'seat_ids': seat_ids[1:3]}])
+        release_order(results[0]['order_id'])
+
+        response = client.get(f'/admin/sales_summary?event_id={sample_event}&group_by=seat_type',
+                              headers={'Session-ID': admin_session})
+        data = response.get_json()
+        assert response.status_code == 200
+        assert [(row['seat_type'], row['tickets_sold'], row['tickets_cancelled'], row['net_revenue'])
+                for row in data['data']] == [(1, 3, 2, 1000), (2, 1, 0, 600)]
+        assert data['totals']['revenue'] == 3600 and data['totals']['refunded'] == 2000
+        assert data['totals']['net_tickets'] == 2
+
+    def test_rebuild_matches_incremental_updates(self, client, user_session, sample_event):
+        other_event = create_event('Other Sales Concert')
+        results = reserve_orders(sample_event, [{'username': 'testuser', 'seat_ids': seat_ids_of(sample_event, 3)}])
+        reserve_orders(other_event, [{'username': 'testuser', 'seat_ids': seat_ids_of(other_event, 1)}])
+        release_order(results[0]['order_id'])
+        incremental = _aggregate_rows()
+        execute_query("UPDATE SalesAggregates SET revenue = 0")
+        sales_summary.rebuild()
+        assert _aggregate_rows() == incremental
+
+    def test_deleted_events_drop_out(self, client, admin_session, sample_event):
+        reserve_orders(sample_event, [{'username': 'test_admin', 'seat_ids': seat_ids_of(sample_event, 1)}])
+        execute_query("DELETE FROM Events WHERE id = ?", (sample_event,))
+        data = client.get(f'/admin/sales_summary?event_id={sample_event}&group_by=',
+                          headers={'Session-ID': admin_session}).get_json()
+        assert data['data'] == [] and data['totals']['tickets_sold'] == 0
+
+    def test_day_grouping_and_validation(self, client, admin_session, user_session, sample_event):
+        reserve_orders(sample_event, [{'username': 'test_admin', 'seat_ids': seat_ids_of(sample_event, 1)}])
+        data = client.get(f'/admin/sales_summary?event_id={sample_event}&group_by=event,day',
+                          headers={'Session-ID': admin_session}).get_json()
+        assert len(data['data']) == 1 and data['data'][0]['event_id'] == sample_event and data['data'][0]['day']
+        assert client.get('/admin/sales_summary?group_by=month',
+                          headers={'Session-ID': admin_session}).status_code == 400
+        assert client.get('/admin/sales_summary', headers={'Session-ID': user_session}).status_code == 403
@@ -0,0 +1,39 @@
+import pytest
+import metrics
+import search_cache
+
+
+class TestSearchCache:
+    """测试场次搜索结果缓存"""
+
+    def test_repeated_search_hits_cache(self, client, sample_event):
+        """相同关键字（大小写、空白不同）第二次命中缓存"""
+        before = metrics.snapshot()['counters'].get('search_cache.hits', 0)
+        first = client.get('/search_events?keyword=Test Optimized').get_json()
+        second = client.get('/search_events?keyword=  test OPTIMIZED ').get_json()
+        assert first['data'] == second['data']
+        assert metrics.snapshot()['counters']['search_cache.hits'] == before + 1
+
+    def test_admin_changes_invalidate(self, client, admin_session, sample_event):
+        """增删改场次后旧结果失效"""
+        client.get('/search_events?keyword=2025-12-25')
+        client.post('/edit_event', json={
+            'event_id': sample_event, 'event_date': '2026-02-02', 'start_time': '19:00',
+            'price_1': 1000, 'price_2': 600, 'price_3': 300
+        }, headers={'Session-ID': admin_session})
+        response = client.get('/search_events?keyword=2025-12-25')
+        ids = [e['id'] for e in response.get_json().get('data', [])] if response.status_code == 200 else []
+        assert sample_event not in ids
+        data = client.get('/search_events?keyword=2026-02-02').get_json()
+        assert sample_event in [e['id'] for e in data['data']]
+
+    def test_lru_is_bounded(self, monkeypatch):
+        """超过容量时淘汰最久未使用的结果"""
+        monkeypatch.setattr(search_cache, 'SEARCH_CACHE_SIZE', 2)
+        search_cache.put(('name', 'a'), 0, [], 0.01)
+        search_cache.put(('name', 'b'), 0, [], 0.01)
+        assert search_cache.get(('name', 'a'), 0) == []
+        search_cache.put(('name', 'c'), 0, [], 0.01)
+        assert search_cache.get(('name', 'b'), 0) is None
+        assert search_cache.get(('name', 'a'), 0) == []
+        assert search_cache.get(('name', 'a'), 1) is None
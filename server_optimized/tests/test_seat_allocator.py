@@ -0,0 +1,87 @@
+import seat_allocator
+import seat_cache
+from conftest import seat_ids_of
+from database.db import execute_query, fetch_query
+from ticket_booking import load_event_seats
+
+
+def _seat(seat_id, row, col, seat_type=1, is_reserved=0):
+    return {'id': seat_id, 'row': row, 'col': col, 'type': seat_type, 'is_reserved': is_reserved}
+
+
+def _positions(seat_ids):
+    placeholders = ",".join("?" for _ in seat_ids)
+    rows = fetch_query(f"SELECT row, col FROM Seats WHERE id IN ({placeholders}) ORDER BY col", seat_ids)
+    return [(row['row'], row['col']) for row in rows]
+
+
+class TestFreeRunIndex:
+    """测试空闲连续座位索引"""
+
+    def test_prefers_front_row_center_and_skips_gaps(self):
+        # 第1行：1-2号空闲、3号售出、4-6号空闲、8号隔过道；第2行全部空闲
+        seats = [_seat(c, 1, c, is_reserved=int(c == 3)) for c in (1, 2, 3, 4, 5, 6, 8)]
+        seats += [_seat(100 + c, 2, c) for c in range(1, 9)]
+        index = seat_allocator.FreeRunIndex('1', seats)
+        assert index.runs[(1, 1)] == [(1, 2), (4, 6), (8, 8)]
+        assert index.best_block(1, 2) == [4, 5]
+        assert index.best_block(1, 3) == [4, 5, 6]
+        # 第1行没有4个相邻空闲座位，取第2行中间
+        assert index.best_block(1, 4) == [103, 104, 105, 106]
+        # 同一行优先于后排
+        assert index.best_block(1, 2, exclude={5}) == [1, 2]
+
+    def test_held_seats_split_runs(self):
+        # 一行10个空闲座位，中间的5、6号被他人锁定
+        index = seat_allocator.FreeRunIndex('1', [_seat(c, 1, c) for c in range(1, 11)])
+        assert index.best_block(1, 2, exclude={5, 6}) == [3, 4]
+        assert index.best_block(1, 4, exclude={5, 6}) == [1, 2, 3, 4]
+        assert index.best_block(1, 2, exclude={4}) == [5, 6]
+        assert index.best_block(1, 4, exclude={3, 8}) == [4, 5, 6, 7]
+        assert index.best_block(1, 4, exclude={2, 5, 8}) == []
+        assert seat_allocator.allocate(index, 1, 2, exclude={5, 6}) == [3, 4]
+
+    def test_incremental_marks(self):
+        index = seat_allocator.FreeRunIndex('1', [_seat(c, 1, c) for c in range(1, 5)])
+        index.mark([2], True)
+        assert index.runs[(1, 1)] == [(1, 1), (3, 4)]
+        assert index.best_block(1, 3) == []
+        index.mark([2], False)
+        assert index.best_block(1, 4) == [1, 2, 3, 4]
+        assert index.candidates[1][2] == [(1, 0.0, 2, 4)]
+
+
+class TestBookBestAvailable:
+    """测试最优座位自动分配接口"""
+
+    def _book(self, client, session, event_id, seat_type, count):
+        return client.post('/book_best_available', json={'event_id': event_id, 'seat_type': seat_type, 'count': count},
+                           headers={'Session-ID': session})
+
+    def test_books_adjacent_block_and_tracks_bookings(self, client, user_session, admin_session, sample_event):
+        response = self._book(client, user_session, sample_event, 1, 4)
+        assert response.status_code == 200
+        first = response.get_json()['seat_ids']
+        assert _positions(first) == [(1, 4), (1, 5), (1, 6), (1, 7)]
+
+        # 手动订走第1行剩余中间座位后，下一次分配使用增量更新后的索引
+        row_one = [s for s in seat_ids_of(sample_event, 10) if s not in first]
+        client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': row_one[1:4]},
+                    headers={'Session-ID': admin_session})
+        second = self._book(client, user_session, sample_event, 1, 3).get_json()['seat_ids']
+        assert _positions(second) == [(2, 4), (2, 5), (2, 6)]
+
+    def test_stale_index_is_rebuilt(self, client, user_session, sample_event):
+        index = seat_allocator.get_index(sample_event, load_event_seats)
+        # 模拟其他worker已订走最优座位：数据库和共享缓存已更新，本进程索引不知情
+        taken = index.best_block(1, 2)
+        execute_query(f"UPDATE Seats SET is_reserved = 1 WHERE id IN ({taken[0]}, {taken[1]})")
+        seat_cache.batch_update_seat_cache(sample_event, [(seat_id, 1) for seat_id in taken])
+        response = self._book(client, user_session, sample_event, 1, 2)
+        assert response.status_code == 200
+        assert set(response.get_json()['seat_ids']).isdisjoint(taken)
+
+    def test_invalid_requests(self, client, user_session, sample_event):
+        assert self._book(client, user_session, sample_event, 1, 5).status_code == 400
+        assert self._book(client, user_session, sample_event, 9, 2).status_code == 400
+        assert self._book(client, user_session, 999999, 1, 2).status_code == 404
@@ -0,0 +1,167 @@
+import time
+import pytest
+import seat_cache
+import seat_codec
+from database.db import fetch_query, get_event_meta
+from conftest import seat_ids_of
+
+
+def assert_cache_matches_db(event_id):
+    """缓存中的座位图、余票摘要和场次信息与数据库一致"""
+    db_seats = [dict(row) for row in fetch_query("SELECT * FROM Seats WHERE event_id = ? ORDER BY id", (event_id,))]
+    cached = seat_cache.get_seats_from_cache(event_id)
+    assert cached is not None, "seat map should stay cached"
+    assert sorted(cached, key=lambda s: s['id']) == db_seats
+    summary = seat_cache.get_availability_summaries([event_id])[event_id]
+    assert summary == seat_cache.availability_summary(db_seats)
+    meta = seat_cache.get_event_meta_from_cache(event_id)
+    if meta is not None:
+        assert meta == get_event_meta(event_id)
+
+
+class TestIncrementalCachePatching:
+    """测试订票、退票和改价后缓存原地更新且与数据库一致"""
+
+    def test_cache_matches_db_after_each_operation(self, client, admin_session, user_session, sample_event):
+        assert client.get(f'/get_seats?event_id={sample_event}').status_code == 200
+        assert_cache_matches_db(sample_event)
+
+        # 订票
+        seat_ids = seat_ids_of(sample_event, 3)
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids},
+                               headers={'Session-ID': user_session})
+        assert response.status_code == 200
+        assert_cache_matches_db(sample_event)
+
+        # 退票：释放的座位在缓存中恢复为可售
+        client.post(f"/cancel_order?id={response.get_json()['order_id']}")
+        assert_cache_matches_db(sample_event)
+        cached = {s['id']: s['is_reserved'] for s in seat_cache.get_seats_from_cache(sample_event)}
+        assert all(cached[seat_id] == 0 for seat_id in seat_ids)
+
+        # 改价改期：座位图不失效，场次信息原地更新
+        response = client.post('/edit_event', json={
+            'event_id': sample_event, 'event_date': '2026-01-01', 'start_time': '19:00',
+            'price_1': 1200, 'price_2': 700, 'price_3': 350
+        }, headers={'Session-ID': admin_session})
+        assert response.status_code == 200
+        assert_cache_matches_db(sample_event)
+        meta = seat_cache.get_event_meta_from_cache(sample_event)
+        assert meta['event']['event_date'] == '2026-01-01'
+        assert [t['price'] for t in meta['seat_types']] == [1200, 700, 350]
+
+    def test_get_seats_includes_prices(self, client, sample_event):
+        """座位查询同时返回票价"""
+        data = client.get(f'/get_seats?event_id={sample_event}').get_json()
+        assert [t['price'] for t in data['seat_types']] == [1000, 600, 300]
+        assert data['event']['id'] == sample_event
+
+    def test_delete_event_clears_cache(self, client, admin_session, sample_event):
+        """删除场次时整体失效"""
+        client.get(f'/get_seats?event_id={sample_event}')
+        client.post('/delete_event', json={'event_id': sample_event}, headers={'Session-ID': admin_session})
+        assert seat_cache.get_seats_from_cache(sample_event) is None
+        assert seat_cache.get_event_meta_from_cache(sample_event) is None
+
+
+class TestAdaptiveTTL:
+    """测试自适应TTL与内存预算"""
+
+    def test_ttl_follows_proximity_and_traffic(self):
+        from datetime import date, timedelta
+        seat_cache.note_event_date('past', (date.today() - timedelta(days=1)).isoformat())
+        seat_cache.note_event_date('soon', (date.today() + timedelta(days=2)).isoformat())
+        seat_cache.note_event_date('later', (date.today() + timedelta(days=60)).isoformat())
+        assert seat_cache.seat_cache_ttl('past') == seat_cache.MIN_CACHE_TTL
+        # 无人访问的远期场次TTL低于基准，临近场次高于远期
+        assert seat_cache.seat_cache_ttl('later') < seat_cache.CACHE_EXPIRE_SECONDS
+        assert seat_cache.seat_cache_ttl('soon') > seat_cache.seat_cache_ttl('later')
+        for _ in range(200):
+            seat_cache.record_access('soon')
+        assert seat_cache.seat_cache_ttl('soon') == min(seat_cache.MAX_CACHE_TTL, seat_cache.CACHE_EXPIRE_SECONDS * 8)
+
+    def test_memory_budget_evicts_cold_events_first(self, monkeypatch):
+        seats = [{'id': i, 'event_id': 1, 'row': i // 10 + 1, 'col': i % 10 + 1, 'type': 'A', 'is_reserved': 0}
+                 for i in range(100)]
+        seat_cache.set_seats_to_cache('cold', seats)
+        seat_cache.set_seats_to_cache('hot', seats)
+        for _ in range(50):
+            seat_cache.get_seats_from_cache('hot')
+        size = seat_cache.cache_stats()['avg_bytes_per_event']
+        monkeypatch.setattr(seat_cache, 'CACHE_MEMORY_BUDGET_BYTES', size * 2 - 1)
+        assert seat_cache.enforce_memory_budget() == ['cold']
+        assert seat_cache.get_seats_from_cache('cold') is None
+        assert seat_cache.get_seats_from_cache('hot') is not None
+
+    def test_policy_state_follows_cached_events(self, client):
+        import cache_auditor
+        # 不存在的场次不留下访问统计
+        client.get('/get_seats?event_id=987654')
+        assert '987654' not in seat_cache._access
+        seats = [{'id': i, 'event_id': 1, 'row': 1, 'col': i + 1, 'type': 'A', 'is_reserved': 0} for i in range(10)]
+        seat_cache.set_seats_to_cache('expiring', seats)
+        seat_cache.note_event_date('expiring', '2030-01-01')
+        seat_cache.note_reload_cost('expiring', 0.01)
+        for _ in range(10):
+            seat_cache.get_seats_from_cache('expiring')
+        # 模拟TTL到期：键消失后巡检丢弃该场次的容量统计
+        seat_cache.redis_client.delete(f'{seat_cache.SEAT_CACHE_PREFIX}expiring')
+        cache_auditor.run_once()
+        assert 'expiring' not in {e['event_id'] for e in seat_cache.cache_stats()['largest_events']}
+        assert 'expiring' not in seat_cache._event_dates and 'expiring' not in seat_cache._reload_seconds
+        # 仍在被访问的场次保留热度，重新加载时沿用；冷却后一并丢弃
+        assert 'expiring' in seat_cache._access
+        assert seat_cache.prune_policy_state([], now=time.time() + 3600) >= 1
+        assert 'expiring' not in seat_cache._access
+
+    def test_stats_exported(self, client, sample_event):
+        client.get(f'/get_seats?event_id={sample_event}')
+        stats = client.get('/metrics').get_json()['data']['collectors']['seat_cache']
+        event = next(e for e in stats['largest_events'] if e['event_id'] == str(sample_event))
+        assert event['bytes'] > 0
+        assert event['reload_seconds'] > 0
+        assert stats['reload_load_per_second'] > 0
+
+
+class TestCompactEncoding:
+    """测试座位图布局+位图编码"""
+
+    @staticmethod
+    def _seats(count, event_id=1):
+        return [{'id': 1000 + i, 'event_id': event_id, 'row': i // 50 + 1, 'col': i % 50 + 1,
+                 'type': 'VIP' if i < 100 else 'A', 'is_reserved': 1 if i % 3 == 0 else 0}
+                for i in range(count)]
+
+    @pytest.mark.parametrize('count', [1, 150, 5000])
+    def test_roundtrip(self, count):
+        seats = self._seats(count)
+        layout, flags = seat_codec.SeatLayout.from_seats(seats)
+        decoded = seat_codec.SeatLayout.decode(layout.encoded)
+        bitmap = seat_codec.encode_reservations(layout, flags)
+        assert decoded.to_seats(seat_codec.decode_reservations(bitmap, decoded)) == seats
+
+    def test_layout_reloaded_from_backend(self):
+        """进程内布局缓存失效后从缓存后端取回布局"""
+        seats = self._seats(300)
+        seat_cache.set_seats_to_cache(1, seats)
+        seat_cache.reset_policy_state()
+        assert seat_cache.get_seats_from_cache(1) == seats
+        assert seat_cache.get_availability_summaries([1])[1] == seat_cache.availability_summary(seats)
+
+    def test_patch_rewrites_bitmap_only(self):
+        seats = self._seats(300)
+        seat_cache.set_seats_to_cache(1, seats)
+        layout_before = seat_cache.redis_client.get(f'{seat_cache.LAYOUT_PREFIX}1')
+        assert seat_cache.batch_update_seat_cache(1, [(1000, 0), (1001, 1)])
+        assert seat_cache.redis_client.get(f'{seat_cache.LAYOUT_PREFIX}1') == layout_before
+        cached = {s['id']: s['is_reserved'] for s in seat_cache.get_seats_from_cache(1)}
+        assert cached[1000] == 0 and cached[1001] == 1
+
+    def test_bitmap_without_layout_is_a_miss(self):
+        seat_cache.set_seats_to_cache(1, self._seats(10))
+        seat_cache.redis_client.delete(f'{seat_cache.LAYOUT_PREFIX}1')
+        seat_cache.reset_policy_state()
+        assert seat_cache.get_seats_from_cache(1) is None
+        # 无法原地更新时整体失效
+        assert seat_cache.batch_update_seat_cache(1, [(1000, 0)]) is False
+        assert seat_cache.redis_client.get(f'{seat_cache.SEAT_CACHE_PREFIX}1') is None
@@ -0,0 +1,85 @@
+import time
+import seat_cache
+import seat_holds
+from conftest import seat_ids_of
+
+
+def _hold(client, session, event_id, seat_ids):
+    return client.post('/hold_seats', json={'event_id': event_id, 'seat_ids': seat_ids},
+                       headers={'Session-ID': session})
+
+
+class TestSeatHolds:
+    """测试选座临时锁定"""
+
+    def test_hold_blocks_others_and_converts_to_order(self, client, admin_session, user_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 2)
+        response = _hold(client, user_session, sample_event, seat_ids)
+        assert response.status_code == 200
+        hold_id = response.get_json()['data']['hold_id']
+
+        # 他人看到锁定座位不可选，锁定和下单都直接被拒绝
+        seats = {s['id']: s for s in client.get(f'/get_seats?event_id={sample_event}').get_json()['data']}
+        assert all(seats[seat_id]['is_reserved'] == 1 and seats[seat_id]['held'] for seat_id in seat_ids)
+        assert _hold(client, admin_session, sample_event, seat_ids[1:]).status_code == 409
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids[:1]},
+                               headers={'Session-ID': admin_session})
+        assert response.status_code == 409 and response.get_json()['seat_ids'] == seat_ids[:1]
+
+        # 凭hold_id下单，未指定座位时使用锁定的座位
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'hold_id': hold_id},
+                               headers={'Session-ID': user_session})
+        assert response.status_code == 200
+        assert seat_holds.get_hold(hold_id) is None
+        assert seat_holds.held_seat_ids(sample_event) == set()
+        seats = {s['id']: s for s in seat_cache.get_seats_from_cache(sample_event)}
+        assert all(seats[seat_id]['is_reserved'] == 1 for seat_id in seat_ids)
+
+    def test_new_hold_replaces_previous_and_release(self, client, user_session, sample_event):
+        first, second = seat_ids_of(sample_event, 2)
+        old = _hold(client, user_session, sample_event, [first]).get_json()['data']['hold_id']
+        new = _hold(client, user_session, sample_event, [second]).get_json()['data']['hold_id']
+        assert seat_holds.get_hold(old) is None
+        assert seat_holds.held_seat_ids(sample_event) == {second}
+        response = client.post('/release_hold', json={'hold_id': new}, headers={'Session-ID': user_session})
+        assert response.status_code == 200
+        assert seat_holds.held_seat_ids(sample_event) == set()
+
+    def test_failed_hold_keeps_previous(self, client, admin_session, user_session, sample_event):
+        a, b, c, d = seat_ids_of(sample_event, 4)
+        old = _hold(client, user_session, sample_event, [a, b]).get_json()['data']['hold_id']
+        # 已锁定的座位可以转入新的锁定，不算冲突
+        response = _hold(client, user_session, sample_event, [b, c])
+        assert response.status_code == 200
+        new = response.get_json()['data']['hold_id']
+        assert seat_holds.get_hold(old) is None
+        assert seat_holds.held_seat_ids(sample_event) == {b, c}
+        assert seat_holds.conflicting_seats(sample_event, [b, c], new) == []
+
+        # 新锁定与他人冲突时，原有的锁定保持不变
+        assert _hold(client, admin_session, sample_event, [d]).status_code == 200
+        response = _hold(client, user_session, sample_event, [c, d])
+        assert response.status_code == 409 and response.get_json()['seat_ids'] == [d]
+        assert seat_holds.get_hold(new)['seat_ids'] == [b, c]
+        assert seat_holds.user_hold_id(sample_event, 'testuser') == new
+        assert seat_holds.conflicting_seats(sample_event, [b, c], new) == []
+        assert seat_holds.held_seat_ids(sample_event) == {b, c, d}
+
+    def test_reserved_seats_cannot_be_held(self, client, user_session, admin_session, sample_event):
+        seat_id = seat_ids_of(sample_event, 1)
+        client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_id},
+                    headers={'Session-ID': admin_session})
+        assert _hold(client, user_session, sample_event, seat_id).status_code == 409
+
+    def test_holds_expire_without_scanning(self, monkeypatch, test_db, sample_event):
+        monkeypatch.setattr(seat_holds, 'HOLD_TTL_SECONDS', 1)
+        seat_ids = seat_ids_of(sample_event, 3)
+        hold, _ = seat_holds.create_hold(sample_event, seat_ids[:2], 'alice')
+        time.sleep(1.05)
+        assert seat_holds.held_seat_ids(sample_event) == set()
+        # 过期的座位可以被他人锁定，后续写入顺带清理过期键
+        other, conflicts = seat_holds.create_hold(sample_event, seat_ids[:1], 'bob')
+        assert other is not None and not conflicts
+        data = seat_cache.redis_client._data
+        assert f'hold:seat:{sample_event}:{seat_ids[1]}' not in data
+        assert f"hold:id:{hold['hold_id']}" not in data
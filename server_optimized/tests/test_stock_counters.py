@@ -0,0 +1,80 @@
+import cache_auditor
+import database.db
+import stock_counters
+from conftest import seat_ids_of
+
+
+def _book(client, session, event_id, seat_ids):
+    return client.post('/book_ticket', json={'event_id': event_id, 'seat_ids': seat_ids},
+                       headers={'Session-ID': session})
+
+
+class TestStockCounters:
+    """测试余票计数器"""
+
+    def test_counters_follow_bookings_failures_and_cancels(self, client, user_session, admin_session, sample_event):
+        seat_ids = seat_ids_of(sample_event, 3)
+        client.get(f'/get_seats?event_id={sample_event}')
+        # 首次订票按事务内的剩余票数建立计数器
+        order_id = _book(client, user_session, sample_event, seat_ids[:2]).get_json()['order_id']
+        assert stock_counters.remaining(sample_event) == {1: 28, 2: 30, 3: 30}
+        # 事务失败（座位已售）时加回扣减
+        assert _book(client, admin_session, sample_event, seat_ids[1:]).status_code == 400
+        assert stock_counters.remaining(sample_event)[1] == 28
+        client.post(f'/cancel_order?id={order_id}')
+        assert stock_counters.remaining(sample_event)[1] == 30
+
+    def test_sold_out_fails_fast_and_reconciles(self, client, user_session, sample_event, monkeypatch):
+        seat_ids = seat_ids_of(sample_event, 1)
+        client.get(f'/get_seats?event_id={sample_event}')
+        stock_counters.reconcile(sample_event, {1: 0, 2: 0, 3: 0})
+        assert stock_counters.is_sold_out(sample_event)
+
+        # 售罄场次不进入数据库事务
+        def no_connection():
+            raise AssertionError("sold-out booking opened a connection")
+        monkeypatch.setattr(database.db, 'connect_db', no_connection)
+        assert stock_counters.claim(sample_event, {1: 1}) == [1]
+        assert database.db.reserve_seats(sample_event, seat_ids, 'testuser', 1)['sold_out'] is True
+        monkeypatch.undo()
+
+        response = _book(client, user_session, sample_event, seat_ids)
+        assert response.status_code == 400 and response.get_json()['sold_out'] is True
+        assert client.get(f'/get_seats?event_id={sample_event}').get_json()['sold_out'] is True
+        results = client.get('/search_events?keyword=Test Optimized').get_json()['data']
+        event = next(e for e in results if e['id'] == sample_event)
+        assert event['sold_out'] is True and event['available_seats'] == 0
+
+        # 巡检按数据库校正后恢复售票
+        assert cache_auditor.reconcile_stock_counters() == 90
+        assert not stock_counters.is_sold_out(sample_event)
+        assert _book(client, user_session, sample_event, seat_ids).status_code == 200
+
+    def test_claim_checks_and_decrements_atomically(self, sample_event, monkeypatch):
+        import seat_cache
+        stock_counters.reconcile(sample_event, {1: 2})
+        # 超量请求不扣减计数器，其他请求不会被误判售罄
+        assert stock_counters.claim(sample_event, {1: 3}) == [1]
+        assert stock_counters.remaining(sample_event) == {1: 2}
+
+        # 检查之后、扣减之前另一个请求扣减了计数器：按新的剩余重新检查
+        client = seat_cache.redis_client
+        original = client.pipeline
+        raced = []
+
+        def racing_pipeline(transaction=True):
+            pipe = original(transaction)
+            mget = pipe.mget
+
+            def mget_then_race(keys):
+                values = mget(keys)
+                if not raced:
+                    raced.append(client.decrby(keys[0], 1))
+                return values
+            pipe.mget = mget_then_race
+            return pipe
+        monkeypatch.setattr(client, 'pipeline', racing_pipeline)
+        assert stock_counters.claim(sample_event, {1: 2}) == [1]
+        assert raced == [1] and stock_counters.remaining(sample_event) == {1: 1}
+        assert stock_counters.claim(sample_event, {1: 1}) == []
+        assert stock_counters.remaining(sample_event) == {1: 0} and stock_counters.is_sold_out(sample_event)
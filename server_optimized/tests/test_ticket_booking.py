@@ -0,0 +1,132 @@
+import pytest
+from database.db import reserve_seats, get_user_id
+from conftest import seat_ids_of
+
+
+class TestSeatDelta:
+    """测试座位图增量查询 (/get_seats?since=)"""
+
+    def test_full_snapshot_has_version(self, client, sample_event):
+        """全量查询返回版本号"""
+        response = client.get(f'/get_seats?event_id={sample_event}')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['mode'] == 'full'
+        assert isinstance(data['version'], int)
+        assert len(data['data']) == 90
+
+    def test_delta_after_booking_and_cancel(self, client, user_session, sample_event):
+        """订票和退票后增量只包含变化的座位"""
+        version = client.get(f'/get_seats?event_id={sample_event}').get_json()['version']
+        seat_ids = seat_ids_of(sample_event, 2)
+
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids},
+                               headers={'Session-ID': user_session})
+        assert response.status_code == 200
+        order_id = response.get_json()['order_id']
+
+        data = client.get(f'/get_seats?event_id={sample_event}&since={version}').get_json()
+        assert data['mode'] == 'delta'
+        assert data['version'] > version
+        assert {(s['id'], s['is_reserved']) for s in data['data']} == {(seat_ids[0], 1), (seat_ids[1], 1)}
+
+        booked_version = data['version']
+        client.post(f'/cancel_order?id={order_id}')
+        data = client.get(f'/get_seats?event_id={sample_event}&since={booked_version}').get_json()
+        assert data['mode'] == 'delta'
+        assert {(s['id'], s['is_reserved']) for s in data['data']} == {(seat_ids[0], 0), (seat_ids[1], 0)}
+
+    def test_unknown_version_falls_back_to_full(self, client, sample_event):
+        """落后太多或未知的版本返回全量快照"""
+        data = client.get(f'/get_seats?event_id={sample_event}&since=1').get_json()
+        assert data['mode'] == 'full'
+        assert len(data['data']) == 90
+
+
+class TestSeatChangeLog:
+    """测试变更日志环形缓冲区"""
+
+    def test_bounded_log_reports_gap(self):
+        from seat_changes import SeatChangeLog
+        log = SeatChangeLog(maxlen=3)
+        start = log.version
+        log.append([(1, 1), (2, 1)])
+        assert log.since(start)[1] == [{'id': 2, 'is_reserved': 1}, {'id': 1, 'is_reserved': 1}]
+        log.append([(3, 1), (1, 0)])
+        # 最早的变更已被淘汰，无法再从start给出增量
+        assert log.since(start) is None
+        version, changes = log.since(start + 1)
+        assert version == start + 4
+        assert {(c['id'], c['is_reserved']) for c in changes} == {(1, 0), (2, 1), (3, 1)}
+
+    def test_reads_do_not_create_logs(self, client, user_session, sample_event):
+        """只有记录变更才创建日志，任意event_id的读取不会留下日志"""
+        import seat_changes
+        seat_changes.reset_event_log(sample_event)  # 场次ID在测试间复用
+        for i in range(3):
+            client.get(f'/get_seats?event_id=nope{i}')
+        assert not any(key.startswith('nope') for key in seat_changes._logs)
+
+        # 尚无日志时拿到的共用版本号，之后仍能取到增量
+        version = client.get(f'/get_seats?event_id={sample_event}').get_json()['version']
+        assert str(sample_event) not in seat_changes._logs
+        seat_id = seat_ids_of(sample_event, 1)[0]
+        client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': [seat_id]},
+                    headers={'Session-ID': user_session})
+        data = client.get(f'/get_seats?event_id={sample_event}&since={version}').get_json()
+        assert data['mode'] == 'delta' and data['data'] == [{'id': seat_id, 'is_reserved': 1}]
+
+        # 丢弃日志后旧版本不再能取增量
+        seat_changes.reset_event_log(sample_event)
+        data = client.get(f'/get_seats?event_id={sample_event}&since={version}').get_json()
+        assert data['mode'] == 'full'
+
+
+class TestSeatStream:
+    """测试座位状态SSE推送 (/stream_seats)"""
+
+    def test_snapshot_then_delta(self, client, user_session, sample_event, monkeypatch):
+        """先收到快照，订票提交后收到增量帧"""
+        import metrics
+        import seat_stream
+        monkeypatch.setattr(seat_stream, 'STREAM_HEARTBEAT_SECONDS', 0.05)
+
+        response = client.get(f'/stream_seats?event_id={sample_event}', buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        frames = iter(response.response)
+
+        snapshot = next(frames)
+        snapshot = snapshot.decode() if isinstance(snapshot, bytes) else snapshot
+        assert 'event: snapshot' in snapshot
+        assert metrics.snapshot()['gauges']['seat_stream.subscribers'] >= 1
+
+        # 流式响应占用着请求上下文，这里直接调用订票事务
+        seat_ids = seat_ids_of(sample_event, 1)
+        assert reserve_seats(sample_event, seat_ids, 'testuser', get_user_id('testuser'))['status'] == 'success'
+
+        delta = next(frames)
+        delta = delta.decode() if isinstance(delta, bytes) else delta
+        assert 'event: delta' in delta
+        assert f'[[{seat_ids[0]},1]]' in delta
+        response.close()
+
+    def test_resume_without_frames_is_not_counted(self, sample_event):
+        """断线重连且没有新变更时只发心跳，不计入已推送的事件数"""
+        import metrics
+        import seat_changes
+        import seat_stream
+
+        def delivered():
+            return metrics.snapshot()['meters'].get('seat_stream.events_delivered', {}).get('total', 0)
+
+        before = delivered()
+        generator = seat_stream.stream(sample_event, seat_changes.get_version(sample_event), heartbeat=0.01)
+        assert next(generator) == ": keep-alive\n\n"
+        generator.close()
+        assert delivered() == before
+
+    def test_stream_unknown_event(self, client, test_db):
+        """不存在的场次返回404"""
+        response = client.get('/stream_seats?event_id=999999')
+        assert response.status_code == 404
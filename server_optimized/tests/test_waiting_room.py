@@ -0,0 +1,84 @@
+import pytest
+import waiting_room
+from conftest import seat_ids_of
+
+
+@pytest.fixture
+def queued_event(client, admin_session, sample_event):
+    response = client.post('/admin/waiting_room', json={'event_id': sample_event, 'rate': 1},
+                           headers={'Session-ID': admin_session})
+    assert response.get_json()['data']['enabled'] is True
+    return sample_event
+
+
+class TestWaitingRoom:
+    """测试热门场次排队放行"""
+
+    def test_booking_requires_admitted_token(self, client, user_session, queued_event):
+        seat_ids = seat_ids_of(queued_event, 2)
+        body = {'event_id': queued_event, 'seat_ids': seat_ids[:1]}
+        headers = {'Session-ID': user_session}
+        assert client.post('/book_ticket', json=body, headers=headers).status_code == 403
+
+        first = client.post('/waiting_room/join', json={'event_id': queued_event}, headers=headers).get_json()['data']
+        second = client.post('/waiting_room/join', json={'event_id': queued_event}, headers=headers).get_json()['data']
+        # 放行速率1人/秒：第一位立即放行，第二位需要等待
+        assert first['admitted'] and not second['admitted']
+        assert second['position'] == 1 and second['eta_seconds'] == 1.0
+
+        response = client.post('/book_ticket', json=body,
+                               headers=dict(headers, **{'Waiting-Room-Token': second['token']}))
+        assert response.status_code == 429 and response.headers['Retry-After'] == '1'
+        response = client.post('/book_ticket', json=body,
+                               headers=dict(headers, **{'Waiting-Room-Token': first['token']}))
+        assert response.status_code == 200
+        # 凭证只能使用一次
+        response = client.post('/book_ticket', json={'event_id': queued_event, 'seat_ids': seat_ids[1:]},
+                               headers=dict(headers, **{'Waiting-Room-Token': first['token']}))
+        assert response.status_code == 403
+
+    def test_token_bound_to_user(self, client, admin_session, user_session, queued_event):
+        token = client.post('/waiting_room/join', json={'event_id': queued_event},
+                            headers={'Session-ID': user_session}).get_json()['data']['token']
+        response = client.post('/book_ticket', json={'event_id': queued_event, 'seat_ids': seat_ids_of(queued_event, 1)},
+                               headers={'Session-ID': admin_session, 'Waiting-Room-Token': token})
+        assert response.status_code == 403
+
+    def test_admission_advances_with_time(self, monkeypatch, queued_event):
+        now = [1000.0]
+        monkeypatch.setattr(waiting_room.time, 'time', lambda: now[0])
+        tokens = [waiting_room.join(queued_event, f'user{i}')['token'] for i in range(5)]
+        assert [waiting_room.status(t)['admitted'] for t in tokens] == [True, False, False, False, False]
+        now[0] += 2.5
+        assert [waiting_room.status(t)['position'] for t in tokens] == [0, 0, 0, 1, 2]
+        now[0] += 2
+        assert waiting_room.status(tokens[4])['admitted']
+        # 队列放空后的空闲时间不累积放行额度
+        now[0] += 100
+        tokens = [waiting_room.join(queued_event, f'late{i}')['token'] for i in range(3)]
+        assert [waiting_room.status(t)['position'] for t in tokens] == [0, 1, 2]
+
+    def test_rate_follows_booking_throughput(self, monkeypatch, sample_event):
+        now = 5000.0
+        assert waiting_room.admit_rate(sample_event, now) == waiting_room.INITIAL_ADMIT_RATE
+        for second in range(1, 11):
+            for _ in range(5):
+                waiting_room.record_completion(now - second)
+        assert waiting_room.booking_throughput(now) == 5
+        assert waiting_room.admit_rate(sample_event, now) == pytest.approx(5 * waiting_room.ADMIT_HEADROOM)
+
+    def test_invalid_rate_rejected(self, client, admin_session, queued_event):
+        for rate in ('fast', 0, -5, True, [1]):
+            response = client.post('/admin/waiting_room', json={'event_id': queued_event, 'rate': rate},
+                                   headers={'Session-ID': admin_session})
+            assert response.status_code == 400
+        # 原有的固定速率不受影响
+        assert waiting_room.admit_rate(queued_event) == 1
+        response = client.post('/admin/waiting_room', json={'event_id': queued_event, 'rate': 2.5},
+                               headers={'Session-ID': admin_session})
+        assert response.get_json()['data']['admit_rate'] == 2.5
+
+    def test_events_without_queue_unaffected(self, client, user_session, sample_event):
+        response = client.post('/book_ticket', json={'event_id': sample_event, 'seat_ids': seat_ids_of(sample_event, 1)},
+                               headers={'Session-ID': user_session})
+        assert response.status_code == 200
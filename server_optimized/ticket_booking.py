@@ -1,9 +1,21 @@
-from flask import Blueprint, request, jsonify
-from database.db import fetch_query, reserve_seats, get_user_id
-import re
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from database.db import fetch_query, reserve_seats, get_user_id, get_event_meta, DatabaseBusy
+import time
 import threading  # 新增：用于请求合并的锁机制
 # 新增：导入缓存模块
 import seat_cache  # <-- 新增
+import seat_changes
+import seat_stream
+import cache_warmer
+import search_cache
+import event_search
+import event_suggest
+import waiting_room
+import seat_holds
+import idempotency
+import seat_allocator
+import stock_counters
+import booking_queue
 
 ticket_booking_bp = Blueprint("ticket_booking", __name__)
 
@@ -15,48 +27,148 @@ loading_locks = {}  # 格式: {event_id: threading.Lock()}
 @ticket_booking_bp.route("/search_events", methods=["GET"])
 def search_events():
     keyword = request.args.get("keyword")
-    keyword = keyword.strip()
+    keyword = search_cache.normalize_keyword(keyword)
     #print('keyword', keyword)
-    pattern_date = r"^\d{4}-\d{2}-\d{2}$"
-    # Search events by date
-    if re.match(pattern_date, keyword):
-        print(keyword)
-        results = fetch_query("SELECT * FROM Events WHERE event_date = ?", (keyword,))
-    # Search events by name, ignoring case sensitivity
+    # 匹配方式、排序、分页游标及日期/票价/余票过滤条件
+    try:
+        options = event_search.parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'fail', 'message': str(e)}), 400
+    filters = options["filters"]
+    query_key = (event_search.query_kind(keyword), keyword, options["match"], options["sort"],
+                 options["limit"], options["after"], tuple(sorted(filters.items())))
+
+    # 先查搜索结果缓存，场次表版本变化后自动失效
+    # has_availability 取决于每次订票/退票都会变化的库存，不随场次版本失效，始终查库
+    cacheable = not filters["has_availability"]
+    version = search_cache.events_version()
+    cached = search_cache.get(query_key, version) if cacheable else None
+    if cached is not None:
+        results, next_cursor = cached
     else:
-        results = fetch_query(
-            "SELECT * FROM Events WHERE LOWER(name) LIKE LOWER(?)",
-            (f"%{keyword}%",)
+        start = time.perf_counter()
+        results, next_cursor = event_search.search_events(
+            keyword, options["match"], filters, options["after"], options["limit"], options["sort"]
         )
-    if results:
-        dict_results = [dict(row) for row in results]
+        if cacheable:
+            search_cache.put(query_key, version, (results, next_cursor), time.perf_counter() - start)
+
+    # 显式分页的请求空页也返回200；旧客户端无结果时仍为404
+    paged = "limit" in request.args or "cursor" in request.args
+    if results or paged:
+        # 复制一份再附加余票信息，避免改动缓存中的结果
+        dict_results = [dict(event) for event in results]
         #print('dict_results', dict_results)
 
-        # 新增：缓存预热 - 搜索到活动后提前加载座位缓存
-        for event in dict_results:  # 新增
-            event_id = event["id"]  # 新增
-            # 检查缓存是否已存在，不存在则加载
-            if not seat_cache.get_seats_from_cache(event_id):  # 新增
-                # 从数据库查询座位数据
-                seats = fetch_query("SELECT * FROM Seats WHERE event_id = ?", (event_id,))  # 新增
-                if seats:  # 新增
-                    dict_seats = [dict(row) for row in seats]  # 新增
-                    seat_cache.set_seats_to_cache(event_id, dict_seats)  # 新增
-        # 新增：缓存预热结束
-
-        return jsonify({'status': 'success', 'data': dict_results})
+        # 一次MGET取回所有场次的余票摘要；未缓存的场次交给后台预热线程
+        summaries = seat_cache.get_availability_summaries(event["id"] for event in dict_results)
+        sold_out = stock_counters.sold_out_events(summaries)
+        for event in dict_results:
+            seat_cache.note_event_date(event["id"], event["event_date"])
+            if summaries[event["id"]]:
+                event.update(summaries[event["id"]])
+            if sold_out[event["id"]]:
+                event.update(sold_out=True, available_seats=0)
+        # 售罄场次无需预热座位图
+        cache_warmer.enqueue(event_id for event_id, summary in summaries.items()
+                             if summary is None and not sold_out[event_id])
+
+        return jsonify({'status': 'success', 'data': dict_results, 'next_cursor': next_cursor})
     else:
         return jsonify({'status': 'fail', 'message': 'No results'}), 404
 
+# 场次名称联想（输入框逐字提示）
+@ticket_booking_bp.route("/suggest_events", methods=["GET"])
+def suggest_events():
+    prefix = request.args.get("q", "")
+    limit = request.args.get("limit", event_suggest.SUGGEST_LIMIT, type=int)
+    if limit < 1:
+        return jsonify({'status': 'fail', 'message': 'limit must be >= 1'}), 400
+    return jsonify({'status': 'success', 'data': event_suggest.suggest(prefix, limit)})
+
+
+# 选座锁定：选中座位后锁定一段时间，订票时凭hold_id下单
+@ticket_booking_bp.route("/hold_seats", methods=["POST"])
+def hold_seats():
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    username = session_info[0]['username']
+
+    data = request.get_json() or {}
+    event_id = data.get("event_id")
+    seat_ids = data.get("seat_ids", [])
+    if not event_id or not seat_ids:
+        return jsonify({"status": "fail", "message": "event_id and seat_ids required"}), 400
+    if len(seat_ids) > seat_holds.MAX_HOLD_SEATS:
+        return jsonify({"status": "fail", "message": f"Cannot hold more than {seat_holds.MAX_HOLD_SEATS} seats"}), 400
+
+    if stock_counters.is_sold_out(event_id):
+        return jsonify({"status": "fail", "message": "Event sold out"}), 409
+    # 已售或不存在的座位不能锁定（按缓存中的座位图判断，订票时仍以数据库为准）
+    seats = {seat['id']: seat for seat in load_event_seats(event_id) or []}
+    unavailable = [seat_id for seat_id in seat_ids if seat_id not in seats or seats[seat_id]['is_reserved']]
+    if unavailable:
+        return jsonify({"status": "fail", "message": "Seats are not available", "seat_ids": unavailable}), 409
+
+    hold, conflicts = seat_holds.create_hold(event_id, seat_ids, username)
+    if conflicts:
+        return jsonify({"status": "fail", "message": "Seats are held by another user", "seat_ids": conflicts}), 409
+    return jsonify({'status': 'success', 'data': dict(hold, ttl_seconds=seat_holds.HOLD_TTL_SECONDS)})
+
+
+@ticket_booking_bp.route("/release_hold", methods=["POST"])
+def release_hold():
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    hold_id = (request.get_json() or {}).get("hold_id")
+    if not seat_holds.release_hold(hold_id, session_info[0]['username']):
+        return jsonify({'status': 'fail', 'message': 'Seat hold expired or not found'}), 404
+    return jsonify({'status': 'success', 'message': 'Seat hold released'})
+
+
 #FR-TK-002
 @ticket_booking_bp.route("/get_seats", methods=["GET"])
 def get_seats():
     event_id = request.args.get("event_id")
+    since = request.args.get("since", type=int)
+
+    # 增量模式：客户端持有since版本的座位图时只返回之后变化的座位
+    sold_out = stock_counters.is_sold_out(event_id)
+    if since is not None:
+        delta = seat_changes.get_changes_since(event_id, since)
+        if delta is not None:
+            version, changes = delta
+            # 锁定状态不进入变更日志，每次附带当前被锁定的座位；售罄场次没有可锁定的座位
+            held = set() if sold_out else seat_holds.held_seat_ids(event_id)
+            return jsonify({'status': 'success', 'mode': 'delta', 'version': version, 'data': changes,
+                            'held': sorted(held), 'sold_out': sold_out})
+
+    # 先读版本再取快照：快照之后的变更会在下次增量中重复下发，但不会丢失
+    version = seat_changes.get_version(event_id)
+    seats = load_event_seats(event_id)
+    if seats:
+        meta = load_event_meta(event_id) or {}
+        # 他人锁定中的座位显示为不可选（不修改缓存中的座位图）
+        held = set() if sold_out else seat_holds.held_seat_ids(event_id)
+        if held:
+            seats = [dict(seat, is_reserved=1, held=True) if seat['id'] in held and not seat['is_reserved'] else seat
+                     for seat in seats]
+        return jsonify({'status': 'success', 'mode': 'full', 'version': version, 'data': seats, 'held': sorted(held),
+                        'sold_out': sold_out, 'event': meta.get('event'), 'seat_types': meta.get('seat_types')})
+    else:
+        return jsonify({'status': 'fail', 'message': 'Event not found or has been deleted'}), 404
+
 
+def load_event_seats(event_id):
+    """读取场次座位图：优先缓存，未命中时合并并发请求只查询一次数据库"""
     # 新增：先查询缓存
     cached_seats = seat_cache.get_seats_from_cache(event_id)  # <-- 新增
     if cached_seats:  # <-- 新增
-        return jsonify({'status': 'success', 'data': cached_seats})  # <-- 新增
+        return cached_seats  # <-- 新增
 
     # 新增：请求合并逻辑
     # 获取或创建当前event_id的加载锁
@@ -69,49 +181,250 @@ def get_seats():
         # 双重检查缓存，防止锁等待期间缓存已被其他请求填充
         cached_seats = seat_cache.get_seats_from_cache(event_id)  # 新增
         if cached_seats:  # 新增
-            return jsonify({'status': 'success', 'data': cached_seats})  # 新增
+            return cached_seats  # 新增
 
         # 原逻辑：查询数据库
+        start = time.perf_counter()
         results = fetch_query("SELECT * FROM Seats WHERE event_id = ?", (event_id,))
-        if results:
-            dict_results = [dict(row) for row in results]
+        if not results:
+            return None
+        dict_results = [dict(row) for row in results]
+        seat_cache.note_reload_cost(event_id, time.perf_counter() - start)
+        seat_cache.record_access(event_id)  # 未命中但场次存在，同样计入访问热度
+
+        # 新增：将查询结果写入缓存
+        seat_cache.set_seats_to_cache(event_id, dict_results)  # <-- 新增
+        return dict_results
+    # 新增：请求合并逻辑结束
+
+
+def load_event_meta(event_id):
+    """读取场次信息和票价：优先缓存，未命中时查询数据库并写入缓存"""
+    meta = seat_cache.get_event_meta_from_cache(event_id)
+    if meta is None:
+        meta = get_event_meta(event_id)
+        if meta is not None:
+            seat_cache.set_event_meta_to_cache(event_id, meta)
+    return meta
 
-            # 新增：将查询结果写入缓存
-            seat_cache.set_seats_to_cache(event_id, dict_results)  # <-- 新增
 
-            return jsonify({'status': 'success', 'data': dict_results})
+@ticket_booking_bp.route("/stream_seats", methods=["GET"])
+def stream_seats():
+    """SSE推送座位状态：首次发送紧凑快照，之后推送订票/退票产生的增量"""
+    event_id = request.args.get("event_id")
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+
+    # 断线重连：变更日志还能补齐时直接从增量继续，不再下发快照
+    if last_event_id is not None and seat_changes.get_changes_since(event_id, last_event_id) is not None:
+        generator = seat_stream.stream(event_id, last_event_id)
+    else:
+        version = seat_changes.get_version(event_id)
+        snapshot = seat_stream.cached_snapshot(event_id, version)
+        if snapshot is not None:
+            generator = seat_stream.stream(event_id, version, snapshot=snapshot)
         else:
-            return jsonify({'status': 'fail', 'message': 'Event not found or has been deleted'}), 404
-    # 新增：请求合并逻辑结束
+            seats = load_event_seats(event_id)
+            if not seats:
+                return jsonify({'status': 'fail', 'message': 'Event not found or has been deleted'}), 404
+            generator = seat_stream.stream(event_id, version, seats=seats)
+
+    return Response(stream_with_context(generator), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _replay(record):
+    """按保存的幂等结果返回响应"""
+    response = jsonify(record["body"])
+    response.headers["Idempotent-Replayed"] = "true"
+    return response, record["status_code"]
 
 
 @ticket_booking_bp.route('/book_ticket', methods=['POST'])
 def book_ticket():
-    # Step 1: validate session
     session_id = request.headers.get('Session-ID')
+    data = request.get_json()
+
+    # 带Idempotency-Key的重试：同一会话直接从缓存返回首次请求的结果，不访问数据库
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key:
+        if len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+            return jsonify({"status": "fail", "message": "Idempotency-Key too long"}), 400
+        fingerprint = idempotency.fingerprint(data)
+        record = idempotency.session_replay(session_id, idempotency_key, fingerprint)
+        if record is not None:
+            return _replay(record)
+
+    # Step 1: validate session
     session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
     if not session_info:
         return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
     username = session_info[0]['username']
+    if not idempotency_key:
+        return _book_ticket(username, data)
+
+    # 同一用户同一键只执行一次；首次请求处理中时等待其结果
+    state, record = idempotency.begin(username, idempotency_key, fingerprint)
+    if state == idempotency.REPLAY:
+        return _replay(record)
+    if state == idempotency.MISMATCH:
+        return jsonify({"status": "fail", "message": "Idempotency-Key reused with a different request"}), 422
+    if state == idempotency.IN_PROGRESS:
+        response = jsonify({"status": "fail", "message": "A request with this Idempotency-Key is in progress"})
+        response.headers["Retry-After"] = "1"
+        return response, 409
+    try:
+        response, status_code = _book_ticket(username, data)
+    except Exception:
+        idempotency.finish(username, idempotency_key, record, session_id, None, 500)
+        raise
+    idempotency.finish(username, idempotency_key, record, session_id, response.get_json(), status_code)
+    return response, status_code
+
 
+def _book_ticket(username, data):
     # Step 2: parse request body
-    data = request.get_json()
     event_id = data.get("event_id")
     seat_ids = data.get("seat_ids", [])
-    user_id = get_user_id(username)
+
+    # 凭选座锁定下单：未指定座位时使用锁定的座位；未传hold_id时沿用用户在该场次的锁定
+    hold_id = data.get("hold_id")
+    if hold_id:
+        hold = seat_holds.get_hold(hold_id)
+        if hold is None or hold["username"] != username or hold["event_id"] != str(event_id):
+            return jsonify({"status": "fail", "message": "Seat hold expired or not found"}), 409
+        seat_ids = seat_ids or hold["seat_ids"]
+    elif event_id:
+        hold_id = seat_holds.user_hold_id(event_id, username)
 
     if not event_id or not seat_ids:
         return jsonify({"status": "fail", "message": "event_id and seat_ids required"}), 400
     if len(seat_ids) > 4:
         return jsonify({"status": "fail", "message": "Cannot purchase more than 4 seats"}), 400
+    # 整场售罄直接拒绝；单个类型售罄由reserve_seats在事务前按计数器拒绝
+    if stock_counters.is_sold_out(event_id):
+        return jsonify({"status": "fail", "sold_out": True, "message": "Reservation failed: event sold out"}), 400
+
+    # 开启排队的场次须持有已放行的排队凭证
+    queue_token = request.headers.get("Waiting-Room-Token")
+    denied = waiting_room.check_admission(event_id, username, queue_token)
+    if denied:
+        message, code, retry_after = denied
+        response = jsonify({"status": "fail", "message": message})
+        if retry_after:
+            response.headers["Retry-After"] = str(retry_after)
+        return response, code
+
+    # 被他人锁定的座位直接拒绝，不进入数据库事务
+    conflicts = seat_holds.conflicting_seats(event_id, seat_ids, hold_id)
+    if conflicts:
+        return jsonify({"status": "fail", "message": "Seats are held by another user", "seat_ids": conflicts}), 409
 
+    booking = {"event_id": event_id, "seat_ids": seat_ids, "hold_id": hold_id, "queue_token": queue_token}
+    # 异步模式：校验通过后入队，立即返回任务ID，由订票线程执行事务
+    if data.get("async", booking_queue.ASYNC_BOOKING) or request.headers.get("Prefer") == "respond-async":
+        job = booking_queue.submit(username, booking, _reserve)
+        if job is None:
+            response = jsonify({"status": "fail", "message": "Booking queue is full, please retry"})
+            response.headers["Retry-After"] = "1"
+            return response, 503
+        return jsonify({"status": "queued", "job_id": job["job_id"],
+                        "status_url": f"/booking_status/{job['job_id']}"}), 202
+
+    result, status_code = _reserve(username, booking)
+    return jsonify(result), status_code
+
+
+def _reserve(username, booking):
+    """执行订票事务，返回 (结果, HTTP状态码)；同步请求和异步订票线程共用"""
+    event_id = booking["event_id"]
     # Step 3: call db.py function
-    result = reserve_seats(event_id, seat_ids, username, user_id)
+    user_id = get_user_id(username)
+    result = reserve_seats(event_id, booking["seat_ids"], username, user_id)
 
     # Step 4: return response
     if result["status"] == "success":
-        return jsonify(result), 200
+        waiting_room.complete(event_id, booking["queue_token"])
+        if booking["hold_id"]:
+            seat_holds.release_hold(booking["hold_id"])
+        return result, 200
     elif result["status"] == "fail":
-        return jsonify(result), 400
+        return result, 400
     else:  # "error"
-        return jsonify(result), 500
+        return result, 500
+
+
+@ticket_booking_bp.route('/booking_status/<job_id>', methods=['GET'])
+def booking_status(job_id):
+    """查询异步订票任务：queued/processing/done，完成后附带订票结果"""
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    job = booking_queue.get_job(job_id)
+    if job is None or job["username"] != session_info[0]['username']:
+        return jsonify({'status': 'fail', 'message': 'Booking job not found'}), 404
+    data = {key: job[key] for key in ("job_id", "status", "event_id", "seat_ids")}
+    if job["status"] == booking_queue.QUEUED:
+        data["queue_depth"] = booking_queue.queue_depth()
+    if job["status"] == booking_queue.DONE:
+        data.update(result=job["result"], status_code=job["status_code"])
+    return jsonify({'status': 'success', 'data': data})
+
+
+@ticket_booking_bp.route('/book_best_available', methods=['POST'])
+def book_best_available():
+    """按座位类型和张数自动分配最优的相邻座位并订票"""
+    session_id = request.headers.get('Session-ID')
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    username = session_info[0]['username']
+
+    data = request.get_json() or {}
+    event_id = data.get("event_id")
+    try:
+        seat_type = int(data.get("seat_type"))
+        count = int(data.get("count", 1))
+    except (TypeError, ValueError):
+        return jsonify({"status": "fail", "message": "event_id, seat_type and count required"}), 400
+    if not event_id:
+        return jsonify({"status": "fail", "message": "event_id, seat_type and count required"}), 400
+    if not 1 <= count <= seat_allocator.MAX_BLOCK_SEATS:
+        return jsonify({"status": "fail", "message": "Cannot purchase more than 4 seats"}), 400
+
+    queue_token = request.headers.get("Waiting-Room-Token")
+    denied = waiting_room.check_admission(event_id, username, queue_token)
+    if denied:
+        message, code, retry_after = denied
+        response = jsonify({"status": "fail", "message": message})
+        if retry_after:
+            response.headers["Retry-After"] = str(retry_after)
+        return response, code
+
+    user_id = get_user_id(username)
+    # 索引可能落后于其他worker的订票：分到的座位已被占用时重建索引重新分配
+    for _ in range(seat_allocator.ALLOCATION_RETRIES):
+        index = seat_allocator.get_index(event_id, load_event_seats)
+        if index is None:
+            return jsonify({'status': 'fail', 'message': 'Event not found or has been deleted'}), 404
+        if not index.has_type(seat_type):
+            return jsonify({"status": "fail", "message": "Invalid seat type"}), 400
+        seat_ids = seat_allocator.allocate(index, seat_type, count, seat_holds.held_seat_ids(event_id))
+        if not seat_ids:
+            return jsonify({"status": "fail", "message": f"No {count} adjacent seats available"}), 409
+        try:
+            result = reserve_seats(event_id, seat_ids, username, user_id)
+        except DatabaseBusy:
+            seat_allocator.release(index, seat_ids)
+            raise
+        if result["status"] == "success":
+            waiting_room.complete(event_id, queue_token)
+            return jsonify(dict(result, seat_ids=seat_ids)), 200
+        if result.get("sold_out"):
+            # 计数器判定售罄：索引中的空位只是尚未同步
+            seat_allocator.release(index, seat_ids)
+            return jsonify(result), 409
+        seat_allocator.release(index, seat_ids, stale=result["status"] == "fail")
+        if result["status"] == "error":
+            return jsonify(result), 500
+    return jsonify({"status": "fail", "message": "Seats sold out while allocating, please retry"}), 409
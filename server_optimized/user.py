@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify, session
-from database.db import execute_query, fetch_query
+from database.db import execute_query, fetch_query, DatabaseBusy
 import sqlite3
 import uuid
 #from datetime import datetime, timedelta
@@ -22,6 +22,8 @@ def register():
         return jsonify({'status': 'success', 'message': 'Registration successful'}), 200
     except sqlite3.IntegrityError:
         return jsonify({'status': 'fail', 'message': 'Username already exists'}), 409
+    except DatabaseBusy:
+        raise
     except Exception as e:
         print(f"Unexpected error: {e}")
         return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
@@ -36,6 +38,8 @@ def login():
     password = data.get('password')
     try:
         user = fetch_query("SELECT * FROM Users WHERE username = ? and password = ?", (username, password))
+    except DatabaseBusy:
+        raise
     except Exception as e:
         print(f"Unexpected error: {e}")
         return jsonify({'message': 'Server is wrong'}), 500
@@ -54,6 +58,8 @@ def login():
                 'message': 'Login successful',
                 'session_id': session_id
             })
+        except DatabaseBusy:
+            raise
         except Exception as e:
             print(f"Unexpected error: {e}")
             return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
@@ -0,0 +1,244 @@
+"""
+热门场次排队：开启排队的场次，用户先领取排队凭证，按放行速率依次放行后才能订票。
+放行速率跟随实测的订票完成速率（略留余量），排队状态全部存放在缓存后端，多worker共享。
+"""
+import json
+import math
+import os
+import secrets
+import time
+
+import redis
+from flask import Blueprint, request, jsonify
+
+import metrics
+import seat_cache
+from database.db import fetch_query
+
+waiting_room_bp = Blueprint("waiting_room", __name__)
+
+WAITING_ROOM_PREFIX = "waitroom:"
+# 所有场次都强制排队（默认只对管理员开启排队的场次生效）
+WAITING_ROOM_ALL_EVENTS = os.environ.get("WAITING_ROOM_ALL_EVENTS", "0") == "1"
+# 尚无订票完成数据时的初始放行速率，以及放行速率上下限（人/秒）
+INITIAL_ADMIT_RATE = 20
+MIN_ADMIT_RATE = 1
+MAX_ADMIT_RATE = 500
+# 放行速率 = 最近THROUGHPUT_WINDOW_SECONDS秒的订票完成速率 × ADMIT_HEADROOM
+THROUGHPUT_WINDOW_SECONDS = 10
+ADMIT_HEADROOM = 1.2
+# 排队凭证有效期；放行后须在ADMISSION_WINDOW_SECONDS内完成订票
+QUEUE_TOKEN_TTL = 2 * 3600
+ADMISSION_WINDOW_SECONDS = 600
+# 场次排队计数键的有效期（持续有人排队时自动续期）
+ROOM_STATE_TTL = 24 * 3600
+
+
+def _key(*parts):
+    return WAITING_ROOM_PREFIX + ":".join(str(part) for part in parts)
+
+
+def is_enabled(event_id):
+    """场次是否开启排队"""
+    return WAITING_ROOM_ALL_EVENTS or bool(seat_cache.redis_client.get(_key(event_id, "enabled")))
+
+
+def configure(event_id, enabled, rate=None):
+    """开启/关闭场次排队；rate为固定放行速率（正数），None表示跟随订票完成速率；rate不合法时抛出ValueError"""
+    if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, float))
+                             or not math.isfinite(rate) or rate <= 0):
+        raise ValueError("rate must be a positive number")
+    client = seat_cache.redis_client
+    if enabled:
+        client.set(_key(event_id, "enabled"), 1)
+    else:
+        client.delete(_key(event_id, "enabled"))
+    if rate is not None:
+        client.set(_key(event_id, "rate"), rate)
+    else:
+        client.delete(_key(event_id, "rate"))
+
+
+def record_completion(now=None):
+    """记录一次订票完成（按秒计数，所有场次共享：SQLite写锁是共同的瓶颈）"""
+    key = _key("completed", int(now or time.time()))
+    pipe = seat_cache.redis_client.pipeline(transaction=False)
+    pipe.incr(key)
+    pipe.expire(key, THROUGHPUT_WINDOW_SECONDS * 2)
+    pipe.execute()
+
+
+def booking_throughput(now=None):
+    """最近THROUGHPUT_WINDOW_SECONDS个完整秒的平均订票完成速率（笔/秒）"""
+    second = int(now or time.time())
+    keys = [_key("completed", second - i) for i in range(1, THROUGHPUT_WINDOW_SECONDS + 1)]
+    return sum(int(v) for v in seat_cache.redis_client.mget(keys) if v) / THROUGHPUT_WINDOW_SECONDS
+
+
+def admit_rate(event_id, now=None):
+    """当前放行速率（人/秒）"""
+    fixed = seat_cache.redis_client.get(_key(event_id, "rate"))
+    if fixed:
+        return float(fixed)
+    throughput = booking_throughput(now)
+    if not throughput:
+        return INITIAL_ADMIT_RATE
+    return max(MIN_ADMIT_RATE, min(MAX_ADMIT_RATE, throughput * ADMIT_HEADROOM))
+
+
+def _advance(event_id, now=None):
+    """
+    按放行速率推进放行位置并返回（各worker在请求中惰性推进，WATCH保证不会重复放行）
+    clock记录已发放额度对应的时间点；队列放空后标记为空闲，空闲期间最多积累1秒的放行额度
+    """
+    now = now or time.time()
+    seq_key, admitted_key, clock_key = _key(event_id, "seq"), _key(event_id, "admitted"), _key(event_id, "clock")
+    rate = admit_rate(event_id, now)
+    burst = max(1.0, 1.0 / rate)
+    admitted = 0
+    for _ in range(seat_cache.UPDATE_RETRIES):
+        pipe = seat_cache.redis_client.pipeline()
+        try:
+            pipe.watch(admitted_key, clock_key)
+            issued = int(pipe.get(seq_key) or 0)
+            admitted = int(pipe.get(admitted_key) or 0)
+            clock = json.loads(pipe.get(clock_key) or '{"at": 0, "idle": true}')
+            last = max(clock["at"], now - burst) if clock["idle"] else clock["at"]
+            allowance = int((now - last) * rate)
+            if admitted >= issued:
+                return admitted
+            new_admitted = min(issued, admitted + allowance)
+            if new_admitted == admitted and not clock["idle"]:
+                return admitted
+            # 空闲的场次有人排队后开始按速率累积额度
+            if new_admitted == issued:
+                clock = {"at": now, "idle": True}
+            else:
+                clock = {"at": last + (new_admitted - admitted) / rate, "idle": False}
+            pipe.multi()
+            pipe.set(admitted_key, new_admitted, ex=ROOM_STATE_TTL)
+            pipe.set(clock_key, json.dumps(clock), ex=ROOM_STATE_TTL)
+            pipe.execute()
+            metrics.inc("waiting_room.admitted", new_admitted - admitted)
+            return new_admitted
+        except redis.WatchError:
+            continue
+        finally:
+            pipe.reset()
+    return admitted
+
+
+def join(event_id, username):
+    """领取排队凭证，返回排队状态"""
+    client = seat_cache.redis_client
+    position = client.incr(_key(event_id, "seq"))
+    client.expire(_key(event_id, "seq"), ROOM_STATE_TTL)
+    token = secrets.token_urlsafe(16)
+    client.setex(_key("token", token), QUEUE_TOKEN_TTL,
+                 json.dumps({"event_id": str(event_id), "position": position, "username": username}))
+    metrics.inc("waiting_room.joined")
+    return dict(status(token), token=token)
+
+
+def _load_token(token):
+    if not token:
+        return None
+    value = seat_cache.redis_client.get(_key("token", token))
+    return json.loads(value) if value else None
+
+
+def status(token):
+    """凭证的排队状态 {event_id, position(前面还有多少人), admitted, eta_seconds}；凭证无效时返回None"""
+    info = _load_token(token)
+    if info is None:
+        return None
+    event_id = info["event_id"]
+    admitted_upto = _advance(event_id)
+    ahead = max(0, info["position"] - admitted_upto)
+    if not ahead:
+        # 放行后只在订票窗口内有效
+        key = _key("token", token)
+        ttl = seat_cache.redis_client.ttl(key)
+        if ttl is None or ttl < 0 or ttl > ADMISSION_WINDOW_SECONDS:
+            seat_cache.redis_client.expire(key, ADMISSION_WINDOW_SECONDS)
+    return {
+        "event_id": event_id,
+        "position": ahead,
+        "admitted": ahead == 0,
+        "eta_seconds": round(ahead / admit_rate(event_id), 1),
+    }
+
+
+def check_admission(event_id, username, token):
+    """
+    订票前检查排队凭证，允许时返回None，否则返回 (提示信息, HTTP状态码, Retry-After秒数或None)
+    """
+    if not is_enabled(event_id):
+        return None
+    info = _load_token(token)
+    if info is None or info["event_id"] != str(event_id) or info["username"] != username:
+        metrics.inc("waiting_room.rejected")
+        return "Waiting room admission token required", 403, None
+    state = status(token)
+    if not state["admitted"]:
+        metrics.inc("waiting_room.rejected")
+        return "Not yet admitted from the waiting room", 429, max(1, int(state["eta_seconds"]))
+    return None
+
+
+def complete(event_id, token):
+    """订票成功：记录完成速率，排队凭证作废（一次放行对应一次订票）"""
+    record_completion()
+    if token and is_enabled(event_id):
+        seat_cache.redis_client.delete(_key("token", token))
+
+
+def _session_user():
+    session_id = request.headers.get("Session-ID")
+    session_info = fetch_query("SELECT username, is_admin FROM Sessions WHERE session_id = ?", (session_id,))
+    return session_info[0] if session_info else None
+
+
+@waiting_room_bp.route("/waiting_room/join", methods=["POST"])
+def join_waiting_room():
+    session_info = _session_user()
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    event_id = (request.get_json() or {}).get("event_id")
+    if not event_id:
+        return jsonify({'status': 'fail', 'message': 'event_id required'}), 400
+    if not is_enabled(event_id):
+        return jsonify({'status': 'success', 'data': {'event_id': str(event_id), 'admitted': True,
+                                                      'position': 0, 'eta_seconds': 0, 'token': None}})
+    return jsonify({'status': 'success', 'data': join(event_id, session_info['username'])})
+
+
+@waiting_room_bp.route("/waiting_room/status", methods=["GET"])
+def waiting_room_status():
+    state = status(request.args.get("token"))
+    if state is None:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired token'}), 404
+    return jsonify({'status': 'success', 'data': state})
+
+
+@waiting_room_bp.route("/admin/waiting_room", methods=["POST"])
+def configure_waiting_room():
+    session_info = _session_user()
+    if not session_info:
+        return jsonify({'status': 'fail', 'message': 'Invalid or expired session'}), 401
+    if session_info['is_admin'] == 0:
+        return jsonify({'status': 'fail', 'message': 'Permission denied: not an admin'}), 403
+    data = request.get_json() or {}
+    event_id = data.get("event_id")
+    if not event_id:
+        return jsonify({'status': 'fail', 'message': 'event_id required'}), 400
+    try:
+        configure(event_id, bool(data.get("enabled", True)), data.get("rate"))
+    except ValueError as e:
+        return jsonify({'status': 'fail', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'data': {
+        'event_id': str(event_id),
+        'enabled': is_enabled(event_id),
+        'admit_rate': admit_rate(event_id),
+        'booking_throughput': booking_throughput(),
+    }})
@@ -0,0 +1,78 @@
+"""
+场次搜索性能对比：LIKE子串匹配(全表扫描) vs FTS5全文索引
+在临时数据库中生成EVENT_COUNT个场次后测量各类查询的延迟
+用法: python bench_event_search.py
+"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SEAT_CACHE_BACKEND", "memory")
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server_optimized")
+sys.path.insert(0, SERVER_DIR)
+import database.db as db  # noqa: E402
+import event_search  # noqa: E402
+
+EVENT_COUNT = 100000
+REPEAT = 20
+PAGE_SIZE = 20
+WORDS = ["rock", "jazz", "summer", "winter", "night", "festival", "symphony", "tour", "live", "acoustic",
+         "orchestra", "tribute", "gala", "opera", "piano", "guitar", "dance", "electric", "classic", "legends"]
+QUERIES = [
+    ("单词", "festival"),
+    ("前缀", "sym"),
+    ("多词", "summer jazz night"),
+    ("低频词", "legends acoustic gala"),
+    ("无结果", "zzzz"),
+]
+
+
+def build_database(path):
+    shutil.copy2(os.path.join(SERVER_DIR, "database", "concert.db"), path)
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO Events (name, poster_url, event_date, start_time) VALUES (?, ?, ?, ?)",
+        ((f"{' '.join(rng.sample(WORDS, 3)).title()} {i}", "", f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "20:00")
+         for i in range(EVENT_COUNT))
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(keyword, match, limit=None):
+    """平均查询耗时(ms)与返回条数；limit为None时取回全部结果"""
+    event_search.search_events(keyword, match, limit=limit)  # 预热页缓存
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        count = len(event_search.search_events(keyword, match, limit=limit)[0])
+    return (time.perf_counter() - start) / REPEAT * 1000, count
+
+
+def main():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db.DB_PATH = os.path.join(temp_dir, "bench.db")
+        build_database(db.DB_PATH)
+        start = time.perf_counter()
+        db.connect_db().close()  # 首次连接时建立全文索引
+        print(f"{EVENT_COUNT}个场次，建立FTS5索引耗时 {time.perf_counter() - start:.2f}s")
+        print(f"{'查询':<8} {'关键字':<24} {'LIKE全部ms':>12} {'命中':>8} {'FTS5全部ms':>12} {'命中':>8} "
+              f"{'LIKE首页ms':>12} {'FTS5首页ms':>12}")
+        for label, keyword in QUERIES:
+            like_ms, like_count = measure(keyword, "substring")
+            fts_ms, fts_count = measure(keyword, "fts")
+            like_page_ms, _ = measure(keyword, "substring", PAGE_SIZE)
+            fts_page_ms, _ = measure(keyword, "fts", PAGE_SIZE)
+            print(f"{label:<8} {keyword:<24} {like_ms:>12.2f} {like_count:>8} {fts_ms:>12.2f} {fts_count:>8} "
+                  f"{like_page_ms:>12.2f} {fts_page_ms:>12.2f}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
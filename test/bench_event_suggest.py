@@ -0,0 +1,67 @@
+"""
+场次名称联想索引基准：NAME_COUNT个名称的整体构建耗时、内存占用、单次查询延迟和增量更新耗时
+用法: python bench_event_suggest.py
+"""
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SEAT_CACHE_BACKEND", "memory")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server_optimized"))
+from event_suggest import PrefixIndex  # noqa: E402
+
+NAME_COUNT = 1000000
+LOOKUPS = 20000
+UPDATES = 50
+WORDS = ["rock", "jazz", "summer", "winter", "night", "festival", "symphony", "tour", "live", "acoustic",
+         "orchestra", "tribute", "gala", "opera", "piano", "guitar", "dance", "electric", "classic", "legends"]
+PREFIXES = ["r", "ja", "sym", "festi", "night tour", "zz"]
+
+
+def make_events(count):
+    rng = random.Random(7)
+    return [(i, f"{' '.join(rng.sample(WORDS, 3)).title()} {i}") for i in range(count)]
+
+
+def main():
+    events = make_events(NAME_COUNT)
+
+    start = time.perf_counter()
+    index = PrefixIndex.build(events, 0)
+    build_seconds = time.perf_counter() - start
+
+    print(f"{NAME_COUNT}个名称，索引项 {len(index)} 条，整体构建 {build_seconds:.2f}s")
+
+    for prefix in PREFIXES:
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            results = index.lookup(prefix, 10)
+        elapsed = (time.perf_counter() - start) / LOOKUPS
+        print(f"前缀 {prefix!r:<14} 返回 {len(results):>2} 条，平均 {elapsed * 1e6:.1f}us")
+
+    # 生成的百万个输入元组会被每次完整GC遍历，服务中它们随查询结果释放，这里冻结以免干扰计时
+    gc.freeze()
+    # 改名、新增、删除轮流进行
+    timings = []
+    for i in range(UPDATES):
+        change = [(i, f"Renamed Harbour Gala {i}"), (NAME_COUNT + i, f"Brand New Festival {i}"), (i + UPDATES, None)][i % 3]
+        start = time.perf_counter()
+        index = index.with_event(*change, version=i + 1)
+        timings.append(time.perf_counter() - start)
+    print(f"增量更新 {UPDATES}次：中位数 {statistics.median(timings) * 1000:.2f}ms，最大 {max(timings) * 1000:.2f}ms")
+
+    # 最后单独构建一次统计内存（tracemalloc会拖慢之后的分配，不能与计时混在一起）
+    del index
+    tracemalloc.start()
+    index = PrefixIndex.build(events, 0)
+    # 名称字符串本身由输入持有，这里只统计索引新增的内存
+    print(f"索引内存约 {tracemalloc.get_traced_memory()[0] / 1024 / 1024:.1f}MB")
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
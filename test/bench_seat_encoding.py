@@ -0,0 +1,95 @@
+"""
+座位图缓存编码对比：JSON整体序列化 vs 静态布局+售出位图
+比较缓存占用字节数与解码耗时；本机Redis可用时额外报告 MEMORY USAGE
+用法: python bench_seat_encoding.py
+"""
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server_optimized"))
+from seat_codec import SeatLayout, decode_reservations, encode_reservations  # noqa: E402
+
+SEAT_COUNTS = [150, 5000, 50000]
+RESERVED_RATIO = 0.3
+SEAT_TYPES = ["VIP", "A", "B"]
+
+
+def make_seats(count, event_id=1):
+    """生成count个座位，每排50座，随机售出RESERVED_RATIO"""
+    rng = random.Random(count)
+    return [{
+        "id": 100000 + i, "event_id": event_id, "row": i // 50 + 1, "col": i % 50 + 1,
+        "type": SEAT_TYPES[min(i * len(SEAT_TYPES) // count, len(SEAT_TYPES) - 1)],
+        "is_reserved": 1 if rng.random() < RESERVED_RATIO else 0,
+    } for i in range(count)]
+
+
+def best_of(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def redis_memory(values):
+    """写入本机Redis并读取 MEMORY USAGE，不可用时返回None"""
+    try:
+        import redis
+        client = redis.StrictRedis(host="localhost", port=6379, db=15, decode_responses=True, socket_connect_timeout=1)
+        client.ping()
+    except Exception:
+        return None
+    usage = []
+    for i, value in enumerate(values):
+        key = f"bench:seat_encoding:{i}"
+        client.set(key, value)
+        usage.append(client.memory_usage(key, samples=0))
+        client.delete(key)
+    return usage
+
+
+def run(count):
+    seats = make_seats(count)
+    json_payload = json.dumps(seats)
+    layout, flags = SeatLayout.from_seats(seats)
+    bitmap = encode_reservations(layout, flags)
+    cached_layout = SeatLayout.decode(layout.encoded)
+    number = max(1, 20000 // count)
+
+    result = {
+        "seats": count,
+        "json_bytes": len(json_payload),
+        "layout_bytes": len(layout.encoded),
+        "bitmap_bytes": len(bitmap),
+        "json_decode_ms": best_of(lambda: json.loads(json_payload), number) * 1000,
+        # 稳态：布局已在进程内缓存，只解码位图并还原座位列表
+        "compact_decode_ms": best_of(
+            lambda: cached_layout.to_seats(decode_reservations(bitmap, cached_layout)), number) * 1000,
+        # 冷启动：布局也需要解码
+        "compact_cold_decode_ms": best_of(
+            lambda: (lambda lay: lay.to_seats(decode_reservations(bitmap, lay)))(SeatLayout.decode(layout.encoded)),
+            number) * 1000,
+        "bitmap_only_decode_ms": best_of(lambda: decode_reservations(bitmap, cached_layout), number) * 1000,
+    }
+    assert cached_layout.to_seats(decode_reservations(bitmap, cached_layout)) == seats
+    memory = redis_memory([json_payload, layout.encoded, bitmap])
+    if memory:
+        result["redis_json_bytes"] = memory[0]
+        result["redis_compact_bytes"] = memory[1] + memory[2]
+    return result
+
+
+def main():
+    print(f"{'座位数':>8} {'JSON字节':>10} {'布局字节':>10} {'位图字节':>10} "
+          f"{'JSON解码ms':>12} {'位图解码ms':>12} {'冷解码ms':>10} {'仅位图ms':>10}")
+    for count in SEAT_COUNTS:
+        r = run(count)
+        print(f"{r['seats']:>8} {r['json_bytes']:>10} {r['layout_bytes']:>10} {r['bitmap_bytes']:>10} "
+              f"{r['json_decode_ms']:>12.3f} {r['compact_decode_ms']:>12.3f} "
+              f"{r['compact_cold_decode_ms']:>10.3f} {r['bitmap_only_decode_ms']:>10.3f}")
+        if "redis_json_bytes" in r:
+            print(f"{'':>8} Redis MEMORY USAGE: JSON {r['redis_json_bytes']} / 布局+位图 {r['redis_compact_bytes']}")
+
+
+if __name__ == "__main__":
+    main()